@@ -42,7 +42,8 @@ def prepare(conv_node: orm.CalcJobNode) -> builder.ProcessBuilder:
 
     builder.code = code
     builder.expid = "aii001"
-    builder.gcm_converted = conv_node.outputs.converted
+    month = conv_node.inputs.parameters.obj.date.strftime("%Y%m")
+    builder.gcm_converted = conv_node.outputs.converted_months[f"m{month}"]
     builder.boundary_data = data.get_inidata()
     builder.parameters = get_params(conv_node)
     builder.ini_basedir = data.get_inibasedir()
@@ -1,8 +1,8 @@
-import time
-
 from aiida import engine, orm, plugins
 from aiida.engine.processes.workchains import workchain
 
+from aiida_c2sm import cycle, cycling, sleep
+
 
 @engine.calcfunction
 def initial_dependency_uuid() -> orm.Str:
@@ -14,7 +14,7 @@ def one() -> orm.Int:
     return orm.Int(1)
 
 
-class BuyIngredients(engine.WorkChain):
+class BuyIngredients(sleep.SleepMixin, engine.WorkChain):
     @classmethod
     def define(cls: type, spec: workchain.WorkChainSpec) -> None:
         super().define(spec)
@@ -22,17 +22,19 @@ class BuyIngredients(engine.WorkChain):
         spec.output("flour")
         spec.output("water")
         spec.output("salt")
-        spec.outline(cls.buy_ingredients)
+        spec.outline(cls.buy_ingredients, cls.deliver)
 
     def buy_ingredients(self) -> None:
         self.report("Buying flour, salt and water!")
-        time.sleep(1)
+        self.sleep(1)
+
+    def deliver(self) -> None:
         self.out("flour", one())
         self.out("water", one())
         self.out("salt", one())
 
 
-class MakeDough(engine.WorkChain):
+class MakeDough(sleep.SleepMixin, engine.WorkChain):
     @classmethod
     def define(cls: type, spec: workchain.WorkChainSpec) -> None:
         super().define(spec)
@@ -40,35 +42,41 @@ class MakeDough(engine.WorkChain):
         spec.input("water")
         spec.input("salt")
         spec.output("dough")
-        spec.outline(cls.make_dough)
+        spec.outline(cls.mix, cls.rise, cls.knead, cls.rise, cls.finish)
 
-    def make_dough(self) -> None:
+    def mix(self) -> None:
         self.report("Mixing ingredients!")
-        time.sleep(1)
+        self.sleep(1)
+
+    def rise(self) -> None:
         self.report("Letting the dough rise!")
-        time.sleep(1)
+        self.sleep(1)
+
+    def knead(self) -> None:
         self.report("Kneading the dough!")
-        time.sleep(1)
-        self.report("Letting the dough rise!")
-        time.sleep(1)
+        self.sleep(1)
+
+    def finish(self) -> None:
         self.out("dough", one())
 
 
-class PreHeatOven(engine.WorkChain):
+class PreHeatOven(sleep.SleepMixin, engine.WorkChain):
     @classmethod
     def define(cls: type, spec: workchain.WorkChainSpec) -> None:
         super().define(spec)
         spec.input("oven_cold")
         spec.output("oven_hot")
-        spec.outline(cls.heat_oven)
+        spec.outline(cls.heat_oven, cls.oven_is_hot)
 
     def heat_oven(self) -> None:
         self.report("Heating the oven!")
-        time.sleep(1)
+        self.sleep(1)
+
+    def oven_is_hot(self) -> None:
         self.out("oven_hot", orm.Int(180).store())
 
 
-class BakeBread(engine.WorkChain):
+class BakeBread(sleep.SleepMixin, engine.WorkChain):
     @classmethod
     def define(cls: type, spec: workchain.WorkChainSpec) -> None:
         super().define(spec)
@@ -77,30 +85,34 @@ class BakeBread(engine.WorkChain):
         spec.input("dough")
         spec.output("oven_dirty")
         spec.output("bread")
-        spec.outline(cls.bake)
+        spec.outline(cls.bake, cls.take_out)
 
     def bake(self) -> None:
         self.report("Baking the bread!")
-        time.sleep(1)
+        self.sleep(1)
+
+    def take_out(self) -> None:
         self.out("oven_dirty", one())
         self.out("bread", one())
 
 
-class SellBread(engine.WorkChain):
+class SellBread(sleep.SleepMixin, engine.WorkChain):
     @classmethod
     def define(cls: type, spec: workchain.WorkChainSpec) -> None:
         super().define(spec)
         spec.input("bread")
         spec.output("money")
-        spec.outline(cls.sell)
+        spec.outline(cls.sell, cls.cash_in)
 
     def sell(self) -> None:
         self.report("Selling bread for money!")
-        time.sleep(1)
+        self.sleep(1)
+
+    def cash_in(self) -> None:
         self.out("money", one())
 
 
-class CleanOven(engine.WorkChain):
+class CleanOven(sleep.SleepMixin, engine.WorkChain):
     @classmethod
     def define(cls: type, spec: workchain.WorkChainSpec) -> None:
         super().define(spec)
@@ -108,11 +120,13 @@ class CleanOven(engine.WorkChain):
         spec.input("oven_hot")
         spec.output("oven_clean")
         spec.output("oven_cold")
-        spec.outline(cls.clean_oven)
+        spec.outline(cls.clean_oven, cls.oven_is_clean)
 
     def clean_oven(self) -> None:
         self.report("Cleaning the oven!")
-        time.sleep(1)
+        self.sleep(1)
+
+    def oven_is_clean(self) -> None:
         self.out("oven_cold", one())
         self.out("oven_clean", one())
 
@@ -263,15 +277,18 @@ class WaitForDependencies(engine.WorkChain):
         Inputs:
         -------
 
-        - dependent: [Str], entry point for the dependent workchain type.
-        - dependencies: [Dict], uuid of running or finished dependency workchains.
+        - dependent: [str], entry point for the dependent workchain type.
+        - dependencies: [dict], uuid of running or finished dependency workchains.
             {"uuid": {"output_name": "input_name"}, [...]}
+        - passthrough_inputs: [dict], {"input_name": "uuid"}
+
+        The inputs are not stored, the uuid of the started dependent is
+        recorded in the extras, see `cycle.get_dependents`.
         """
         super().define(spec)
-        spec.input("dependent", required=True, valid_type=orm.Str)
-        spec.input("dependencies", required=True, valid_type=orm.Dict)
-        spec.input("passthrough_inputs", required=False, valid_type=orm.Dict)
-        spec.output("dependent_id")
+        spec.input("dependent", required=True, valid_type=str, non_db=True)
+        spec.input("dependencies", required=True, valid_type=dict, non_db=True)
+        spec.input("passthrough_inputs", required=False, valid_type=dict, non_db=True)
         spec.outline(
             cls.prepare,
             engine.while_(cls.dependencies_left)(cls.push_futures, cls.collect_inputs),
@@ -281,7 +298,7 @@ class WaitForDependencies(engine.WorkChain):
     def prepare(self) -> None:
         self.ctx.wait_for_ids = list(self.inputs.dependencies.keys())
         self.report(
-            f"Wait({self.inputs.dependent.value}): initial dependencies {self.ctx.wait_for_ids}"
+            f"Wait({self.inputs.dependent}): initial dependencies {self.ctx.wait_for_ids}"
         )
         self.ctx.dependent_inputs = {}
         self.ctx.resolution_table = {i: i for i in self.ctx.wait_for_ids}
@@ -292,7 +309,7 @@ class WaitForDependencies(engine.WorkChain):
 
     def push_futures(self) -> None:
         for dependency_id in self.ctx.wait_for_ids:
-            self.report(f"Wait({self.inputs.dependent.value}): pushing {dependency_id}")
+            self.report(f"Wait({self.inputs.dependent}): pushing {dependency_id}")
             self.to_context(
                 futures=engine.append_(
                     orm.WorkChainNode.collection.get(uuid=dependency_id)
@@ -301,34 +318,29 @@ class WaitForDependencies(engine.WorkChain):
             self.ctx.wait_for_ids.remove(dependency_id)
 
     def collect_inputs(self) -> None:
+        connections = {}
         for dependency in self.ctx.futures:
-            self.report(
-                f"Wait({self.inputs.dependent.value}): checking on {dependency}"
-            )
+            self.report(f"Wait({self.inputs.dependent}): checking on {dependency}")
             assert dependency.is_finished_ok
             if dependency.process_class is self.__class__:
-                dependent_id = dependency.outputs.dependent_id.value
+                dependent_id = dependency.base.extras.get(cycle.DEPENDENT_EXTRA)
                 self.ctx.wait_for_ids.append(dependent_id)
                 self.ctx.resolution_table[dependent_id] = self.ctx.resolution_table[
                     dependency.uuid
                 ]
                 self.report(
-                    f"Wait({self.inputs.dependent.value}): -> it's a waiter, waiting for it's "
+                    f"Wait({self.inputs.dependent}): -> it's a waiter, waiting for it's "
                     f"dependent {dependent_id}"
                 )
             else:
-                self.ctx.dependent_inputs.update(
-                    {
-                        v: getattr(dependency.outputs, k)
-                        for k, v in self.inputs.dependencies[
-                            self.ctx.resolution_table[dependency.uuid]
-                        ].items()
-                    }
-                )
+                connections[dependency.uuid] = self.inputs.dependencies[
+                    self.ctx.resolution_table[dependency.uuid]
+                ]
             self.ctx.futures.remove(dependency)
+        self.ctx.dependent_inputs.update(cycle.collect_outputs(connections))
 
         self.report(
-            f"Wait({self.inputs.dependent.value}): collected {self.ctx.dependent_inputs}"
+            f"Wait({self.inputs.dependent}): collected {self.ctx.dependent_inputs}"
         )
 
     def start_dependent(self) -> None:
@@ -339,143 +351,61 @@ class WaitForDependencies(engine.WorkChain):
             }
 
         self.report(
-            f"Wait({self.inputs.dependent.value}): start baking with {self.ctx.dependent_inputs}"
+            f"Wait({self.inputs.dependent}): start baking with {self.ctx.dependent_inputs}"
         )
         dependent = self.submit(
-            plugins.WorkflowFactory(self.inputs.dependent.value),
+            plugins.WorkflowFactory(self.inputs.dependent),
             **self.ctx.dependent_inputs,
         )
-        self.out("dependent_id", orm.Str(dependent.uuid).store())
-
-
-class BakeryCycle(engine.WorkChain):
-    @classmethod
-    def define(cls: type, spec: workchain.WorkChainSpec) -> None:
-        super().define(spec)
-        spec.input("start_iteration", required=True, valid_type=orm.Int)
-        spec.input("end_iteration", required=True, valid_type=orm.Int)
-        spec.outline(
-            cls.prepare,
-            engine.while_(cls.should_continue)(
-                cls.run_iteration, cls.increment_iteration
+        self.node.base.extras.set(cycle.DEPENDENT_EXTRA, dependent.uuid)
+
+
+class BakeryCycle(cycling.CyclingWorkChain):
+    """
+    Run the bakery from `initial_cycle_point` to `final_cycle_point`.
+
+    Ingredients are bought with the money from selling bread two cycle points
+    earlier, the oven is heated and cleaned once per cycle point. The first
+    cycle points start from seed money and a cold, clean oven.
+    """
+
+    graph = cycling.Graph(
+        tasks={
+            "buy_ingredients": BuyIngredients,
+            "pre_heat_oven": PreHeatOven,
+            "make_dough": MakeDough,
+            "bake_bread": BakeBread,
+            "clean_oven": CleanOven,
+            "sell_bread": SellBread,
+        },
+        edges=(
+            cycling.Edge("sell_bread[-P2]", "buy_ingredients", {"money": "money"}),
+            cycling.Edge(
+                "clean_oven[-P1]", "pre_heat_oven", {"oven_cold": "oven_cold"}
             ),
-        )
-
-    def prepare(self) -> None:
-        self.report("Preparing")
-        self.ctx.iteration_nr = self.inputs.start_iteration.value
-        self.ctx.ingredients_ids = []
-        self.ctx.clean_oven_ids = []
-        self.ctx.sell_bread_ids = []
-        self.ctx.seed_money = one()
-        self.ctx.oven_cold_start = one()
-        self.ctx.oven_clean_start = one()
-        self.ctx.buy_ingredients_str = orm.Str("c2sm.bakery_buy_ingredients").store()
-        self.ctx.pre_heat_str = orm.Str("c2sm.bakery_pre_heat_oven").store()
-        self.ctx.make_dough_str = orm.Str("c2sm.bakery_make_dough").store()
-        self.ctx.bake_bread_str = orm.Str("c2sm.bakery_bake_bread").store()
-        self.ctx.clean_oven_str = orm.Str("c2sm.bakery_clean_oven").store()
-        self.ctx.sell_bread_str = orm.Str("c2sm.bakery_sell_bread").store()
-        self.ctx.empty_dependencies = orm.Dict().store()
-
-    def should_continue(self) -> bool:
-        return bool(self.ctx.iteration_nr <= self.inputs.end_iteration)
-
-    def run_iteration(self) -> None:
-        self.report("Buying ingredients!")
-        if self.ctx.iteration_nr <= 2:
-            self.ctx.ingredients_ids.append(
-                self.submit(BuyIngredients, money=self.ctx.seed_money).uuid
-            )
-        else:
-            self.ctx.ingredients_ids.append(
-                self.submit(
-                    WaitForDependencies,
-                    dependent=self.ctx.buy_ingredients_str,
-                    dependencies=orm.Dict(
-                        {self.ctx.sell_bread_ids[-2]: {"money": "money"}}
-                    ).store(),
-                ).uuid
-            )
-
-        self.report("Heating oven!")
-        hot_oven = None
-        if self.ctx.iteration_nr <= 1:
-            hot_oven = self.submit(PreHeatOven, oven_cold=self.ctx.oven_cold_start)
-        else:
-            hot_oven = self.submit(
-                WaitForDependencies,
-                dependent=self.ctx.pre_heat_str,
-                dependencies=orm.Dict(
-                    {self.ctx.clean_oven_ids[-1]: {"oven_cold": "oven_cold"}}
-                ),
-            )
-
-        self.report("Making dough!")
-        bake_bread_dependencies = {
-            self.ctx.ingredients_ids[-1]: {
-                "flour": "flour",
-                "water": "water",
-                "salt": "salt",
-            },
-        }
-        make_dough = self.submit(
-            WaitForDependencies,
-            dependent=self.ctx.make_dough_str,
-            dependencies=orm.Dict(bake_bread_dependencies).store(),
-        )
-
-        self.report("Baking bread!")
-        bake_bread_dependencies = {
-            hot_oven.uuid: {"oven_hot": "oven_hot"},
-            make_dough.uuid: {"dough": "dough"},
+            cycling.Edge(
+                "buy_ingredients",
+                "make_dough",
+                {"flour": "flour", "water": "water", "salt": "salt"},
+            ),
+            cycling.Edge("pre_heat_oven", "bake_bread", {"oven_hot": "oven_hot"}),
+            cycling.Edge("make_dough", "bake_bread", {"dough": "dough"}),
+            cycling.Edge("clean_oven[-P1]", "bake_bread", {"oven_clean": "oven_clean"}),
+            cycling.Edge("pre_heat_oven", "clean_oven", {"oven_hot": "oven_hot"}),
+            cycling.Edge("bake_bread", "clean_oven", {"oven_dirty": "oven_dirty"}),
+            cycling.Edge("bake_bread", "sell_bread", {"bread": "bread"}),
+        ),
+    )
+
+    def init_cycling(self) -> None:
+        super().init_cycling()
+        self.ctx.seeds = {
+            "money": one(),
+            "oven_cold": one(),
+            "oven_clean": one(),
         }
-        passthrough_inputs = {}
-        if (
-            self.ctx.iteration_nr > 1
-        ):  # TODO: starting at iteration number > 1 would break
-            bake_bread_dependencies |= {
-                self.ctx.clean_oven_ids[-1]: {"oven_clean": "oven_clean"}
-            }
-        else:
-            passthrough_inputs = {
-                "passthrough_inputs": orm.Dict(
-                    {"oven_clean": self.ctx.oven_clean_start.uuid}
-                ).store()
-            }
-        bake_bread = self.submit(
-            WaitForDependencies,
-            dependent=self.ctx.bake_bread_str,
-            dependencies=orm.Dict(bake_bread_dependencies).store(),
-            **passthrough_inputs,
-        )
-
-        self.report("Cleaning oven!")
-        self.ctx.clean_oven_ids.append(
-            self.submit(
-                WaitForDependencies,
-                dependent=self.ctx.clean_oven_str,
-                dependencies=orm.Dict(
-                    {
-                        hot_oven.uuid: {"oven_hot": "oven_hot"},
-                        bake_bread.uuid: {"oven_dirty": "oven_dirty"},
-                    }
-                ).store(),
-            ).uuid
-        )
-
-        self.report("Selling bread!")
-        self.ctx.sell_bread_ids.append(
-            self.submit(
-                WaitForDependencies,
-                dependent=self.ctx.sell_bread_str,
-                dependencies=orm.Dict({bake_bread.uuid: {"bread": "bread"}}).store(),
-            ).uuid
-        )
-
-        self.to_context(latest_baked_bread=bake_bread)
 
-    def increment_iteration(self) -> None:
-        self.report("Waiting for baked bread!")
-        self.ctx.latest_baked_bread.is_finished_ok
-        self.ctx.iteration_nr += 1
+    def initial_input(
+        self, edge: cycling.Edge, cycle_point: int
+    ) -> dict[str, orm.Node]:
+        return {name: self.ctx.seeds[name] for name in edge.ports.values()}
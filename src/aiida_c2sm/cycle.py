@@ -1,6 +1,12 @@
+from typing import Iterable, Mapping
+
 from aiida import engine, orm, plugins
+from aiida.common import exceptions
 from aiida.engine.processes.workchains import workchain
 
+DEPENDENT_EXTRA = "dependent"
+EDGES_EXTRA = "dependency_edges"
+
 
 class Dependencies(engine.WorkChain):
     """
@@ -10,7 +16,12 @@ class Dependencies(engine.WorkChain):
     outpus as inputs to the dependent workchain. All the provenance
     tracking happens through links between output and input data.
     The inputs to this workchain are not stored, as it's sole purpose
-    is scheduling.
+    is scheduling. The scheduling records are kept in extras of the
+    workchain node instead:
+
+    - "dependent": uuid of the started dependent, see `get_dependents`.
+    - "dependency_edges": one row per connected output,
+        [<uuid of dependency>, <uuid it resolved to>, <output name>, <input name>]
 
     Inputs which are already available can be passed by uuid in a
     separate input.
@@ -37,7 +48,6 @@ class Dependencies(engine.WorkChain):
         super().define(spec)
         spec.input("dependent", required=True, valid_type=str, non_db=True)
         spec.input("dependencies", required=True, valid_type=dict, non_db=True)
-        spec.output("dependent_id")
         spec.input(
             "passthrough_inputs",
             required=False,
@@ -45,100 +55,235 @@ class Dependencies(engine.WorkChain):
             default=lambda: {},
             non_db=True,
         )
-        spec.exit_code(400, "DEPENDENCY_FAILED")
+        spec.exit_code(
+            400,
+            "DEPENDENCY_FAILED",
+            message="A dependency did not finish successfully.",
+        )
+        spec.exit_code(
+            401,
+            "DEPENDENCY_NOT_FOUND",
+            message="A dependency or passthrough input does not exist.",
+        )
         spec.outline(
             cls.prepare,
             engine.while_(cls.is_waiting)(
                 cls.await_dependencies, cls.resolve_dependencies
             ),
-            cls.collected_inputs,
+            cls.collect_inputs,
             cls.start_dependent,
         )
 
-    def prepare(self) -> None:
+    def prepare(self) -> engine.ExitCode | None:
         """Prepare the context variables."""
-        self.ctx.dependency_queue = list(self.inputs.dependencies.keys())
-        dep_pks = [
-            orm.load_node(uuid=dep_id).pk for dep_id in self.ctx.dependency_queue
-        ]
-        self._report(f"Initialize dependencies as {dep_pks}.")
-        self.ctx.dependency_resolution = {
-            i: i for i in self.dependency_queue.wait_for_ids
-        }
-        self.ctx.collected_workchains = []
+        self.ctx.pending = list(self.inputs.dependencies.keys())
+        # maps every awaited node to the dependency it stands in for
+        self.ctx.origin = {uuid: uuid for uuid in self.ctx.pending}
+        self.ctx.awaited = []
+        self.ctx.resolved = {}
         self.ctx.collected_inputs = {}
-        self.ctx.future_queue = []
+        try:
+            nodes = load_nodes(self.ctx.pending)
+        except exceptions.NotExistent as exc:
+            return self._not_found(exc)
+        self._report(
+            f"Initialize dependencies as {[node.pk for node in nodes.values()]}"
+        )
+        return None
 
     def _report(self, message: str) -> None:
         self.report(f"[{self.inputs.dependent}]: {message}.")
 
+    def _not_found(self, exc: exceptions.NotExistent) -> engine.ExitCode:
+        self._report(f"{str(exc).rstrip('.')}, abort")
+        return self.exit_codes.DEPENDENCY_NOT_FOUND
+
     def is_waiting(self) -> bool:
-        """
-        Continue to wait for dependencies until none are left.
+        """Continue to wait until every dependency is resolved to a finished process."""
+        return bool(self.ctx.pending)
 
-        No futures are being awaited and none have been put in the queue
-        in the last round.
+    def await_dependencies(self) -> None:
+        """Load all pending dependency nodes at once and await them together."""
+        nodes = load_nodes(self.ctx.pending)
+        for node in nodes.values():
+            self.to_context(awaited=engine.append_(node))
+        self._report(f"Awaiting {[node.pk for node in nodes.values()]}")
+        self.ctx.pending = []
+
+    def resolve_dependencies(self) -> engine.ExitCode | None:
         """
-        return self.ctx.dependency_queue or self.ctx.future_queue
+        Replace finished Dependencies workflows by the dependents they started.
 
-    def await_dependencies(self) -> None:
-        """Load dependency nodes and start awaiting them."""
-        for dependency_uuid in self.ctx.dependency_queue:
-            future = orm.load_node(uuid=dependency_uuid)
-            self.to_context(future_queue=engine.append_(future))
-            self.ctx.dependency_queue.remove(dependency_uuid)
-            self._report(f"Awaiting {future.pk}.")
-
-    def resolve_dependencies(self) -> None:
-        """Make sure to resolve any nested dependencies."""
-        for future in self.ctx.future_queue:
-            self._report(f"Check and resolve {future.pk}.")
-            if not future.is_finished_ok:
+        Chains of Dependencies workflows which have already finished are followed
+        in one go, only dependents still running are awaited in the next round.
+        """
+        finished = {node.uuid: node for node in self.ctx.awaited}
+        self.ctx.awaited = []
+        while finished:
+            failed = [node.pk for node in finished.values() if not node.is_finished_ok]
+            if failed:
                 self._report(
-                    f"Dependency {future.pk} did not finish successfully, abort."
+                    f"Dependencies {failed} did not finish successfully, abort"
                 )
                 return self.exit_codes.DEPENDENCY_FAILED
-            self.ctx.future_queue.remove(future)
-            if future.process_class is self.__class__:
-                dependent = get_dependent(future)
-                self.ctx.dependency_queue.append(dependent.uuid)
-                self.ctx.dependency_resolution[
-                    dependent.uuid
-                ] = self.ctx.dependency_resolution[future.uuid]
+            waiters = {
+                uuid
+                for uuid, node in finished.items()
+                if node.process_class is self.__class__
+            }
+            for uuid in finished.keys() - waiters:
+                self.ctx.resolved[self.ctx.origin[uuid]] = uuid
+            dependents = get_dependents(waiters)
+            if missing := waiters - dependents.keys():
+                self._report(f"Dependencies {missing} did not start a dependent, abort")
+                return self.exit_codes.DEPENDENCY_FAILED
+            try:
+                nodes = load_nodes(dependents.values())
+            except exceptions.NotExistent as exc:
+                return self._not_found(exc)
+            finished = {}
+            for waiter, dependent in dependents.items():
+                self.ctx.origin[dependent] = self.ctx.origin[waiter]
+                if nodes[dependent].is_terminated:
+                    finished[dependent] = nodes[dependent]
+                else:
+                    self.ctx.pending.append(dependent)
+            if dependents:
                 self._report(
-                    f"Dependency {future.pk} is a Dependencies workflow, "
-                    f"add it's dependent {dependent.pk} to dependencies"
+                    f"Resolved Dependencies workflows to their dependents "
+                    f"{[node.pk for node in nodes.values()]}"
                 )
-            else:
-                self.ctx.collected_workchains.append(future.uuid)
+        return None
 
-    def collect_inputs(self) -> None:
+    def collect_inputs(self) -> engine.ExitCode | None:
         """
         After all dependencies have finished, collect dependent's inputs.
         """
-        for dependency_uuid in self.ctx.collected_workchains:
-            dependency = orm.load_node(uuid=dependency_uuid)
-            connection_table = self.inputs.dependencies[
-                self.ctx.dependency_resolution[dependency.uuid]
-            ]
-            self.ctx.collect_inputs |= {
-                v: getattr(dependency.outputs, k) for k, v in connection_table.items()
+        self.node.base.extras.set(
+            EDGES_EXTRA,
+            [
+                [origin, uuid, output, input_name]
+                for origin, uuid in self.ctx.resolved.items()
+                for output, input_name in self.inputs.dependencies[origin].items()
+            ],
+        )
+        self.ctx.collected_inputs |= collect_outputs(
+            {
+                uuid: self.inputs.dependencies[origin]
+                for origin, uuid in self.ctx.resolved.items()
             }
+        )
         if "passthrough_inputs" in self.inputs:
-            self.ctx.collect_inputs |= {
-                k: orm.load_node(uuid=v)
-                for k, v in self.inputs.passthrough_inputs.items()
+            try:
+                passthrough = load_nodes(
+                    self.inputs.passthrough_inputs.values(), node_class=orm.Node
+                )
+            except exceptions.NotExistent as exc:
+                return self._not_found(exc)
+            self.ctx.collected_inputs |= {
+                k: passthrough[v] for k, v in self.inputs.passthrough_inputs.items()
             }
-        self._report("Collected inputs: {self.ctx.collect_inputs}.")
+        self._report(f"Collected inputs: {self.ctx.collected_inputs}")
+        return None
 
     def start_dependent(self) -> None:
         dependent = self.submit(
-            plugins.WorkFlowFactory(self.inputs.dependent),
+            plugins.WorkflowFactory(self.inputs.dependent),
             **self.ctx.collected_inputs,
         )
-        self._report("Start depdendent {self.inputs.dependent}: {dependent.pk}")
-        self.out("dependent_id", orm.Str(dependent.uuid).store())
+        self._report(f"Start dependent {self.inputs.dependent}: {dependent.pk}")
+        self.node.base.extras.set(DEPENDENT_EXTRA, dependent.uuid)
 
 
 def get_dependent(workchain: orm.WorkChainNode) -> orm.WorkChainNode:
-    return orm.load_node(workchain.outputs.dependent_id.value)
+    return orm.load_node(workchain.base.extras.get(DEPENDENT_EXTRA))
+
+
+def load_nodes(
+    uuids: Iterable[str], node_class: type[orm.Node] = orm.ProcessNode
+) -> dict[str, orm.Node]:
+    """
+    Load the nodes with the given uuids in a single query.
+
+    Raises `NotExistent` if any uuid does not match a node of `node_class`.
+    """
+    uuids = list(uuids)
+    if not uuids:
+        return {}
+    query = orm.QueryBuilder()
+    query.append(node_class, filters={"uuid": {"in": uuids}})
+    nodes = {node.uuid: node for node in query.all(flat=True)}
+    if missing := sorted(set(uuids) - nodes.keys()):
+        raise exceptions.NotExistent(f"No {node_class.__name__} with uuids: {missing}.")
+    return nodes
+
+
+def get_dependents(waiters: Iterable[str]) -> dict[str, str]:
+    """Uuids of the dependents started by the given Dependencies workflows."""
+    waiters = list(waiters)
+    if not waiters:
+        return {}
+    query = orm.QueryBuilder()
+    query.append(
+        orm.WorkChainNode,
+        filters={"uuid": {"in": waiters}, "extras": {"has_key": DEPENDENT_EXTRA}},
+        project=["uuid", f"extras.{DEPENDENT_EXTRA}"],
+    )
+    return dict(query.all())
+
+
+def collect_outputs(
+    connections: Mapping[str, Mapping[str, str]]
+) -> dict[str, orm.Node]:
+    """
+    Collect outputs of several processes as inputs for another one, in one query.
+
+    Parameters:
+    -----------
+    connections: dictionary of the format
+        {
+            <uuid of process>: {
+                <output name from process>: <input name>
+            }
+        }
+
+    Returns a dictionary of the format {<input name>: <output node>}.
+    """
+    if not connections:
+        return {}
+    query = orm.QueryBuilder()
+    query.append(
+        orm.ProcessNode,
+        filters={"uuid": {"in": list(connections)}},
+        project=["uuid"],
+        tag="process",
+    )
+    query.append(
+        orm.Node,
+        with_incoming="process",
+        edge_filters={
+            "label": {
+                "in": list({label for table in connections.values() for label in table})
+            }
+        },
+        edge_project=["label"],
+        project=["*"],
+        tag="output",
+    )
+    collected = {}
+    for row in query.iterdict():
+        table = connections[row["process"]["uuid"]]
+        label = row["process--output"]["label"]
+        if label in table:
+            collected[table[label]] = row["output"]["*"]
+    missing = [
+        (uuid, label)
+        for uuid, table in connections.items()
+        for label, input_name in table.items()
+        if input_name not in collected
+    ]
+    if missing:
+        raise exceptions.NotExistent(
+            f"Missing (process uuid, output) pairs: {missing}."
+        )
+    return collected
@@ -0,0 +1,365 @@
+"""
+Declarative cycling graphs.
+
+A cycling graph is a set of tasks which run once per cycle point, and edges
+which connect outputs of one task to inputs of another. An edge can reach back
+to an earlier cycle point with an offset, written like `b[-P1]` for the task
+`b` of the previous cycle point.
+
+`CyclingWorkChain` expands the graph once into the full dependency DAG between
+the initial and the final cycle point and submits every task as soon as its
+dependencies have finished, keeping at most `max_active_cycle_points` cycle
+points running at a time.
+"""
+from __future__ import annotations
+
+import dataclasses
+import functools
+import graphlib
+import re
+from typing import Any, Mapping
+
+from aiida import engine, orm
+from aiida.engine.processes.workchains import workchain
+
+from aiida_c2sm import cycle
+
+_SOURCE_PATTERN = re.compile(r"^(?P<task>\w+)(?:\[-P(?P<offset>\d+)\])?$")
+#: context key of the awaitable keeping the work chain waiting for a running task
+_FIRST_FINISHED = "first_finished_task"
+
+__all__ = ["Edge", "Graph", "CyclingWorkChain"]
+
+
+@dataclasses.dataclass(frozen=True)
+class Edge:
+    """
+    Connect outputs of `source` to inputs of `target` in the same cycle point.
+
+    `source` may carry an offset like `a[-P2]`, in which case the outputs of
+    `a` from two cycle points earlier are used.
+
+    Parameters:
+    -----------
+    source: task name, optionally with an offset.
+    target: task name.
+    ports: {<output name of source>: <input name of target>}
+    """
+
+    source: str
+    target: str
+    ports: Mapping[str, str]
+
+    def __post_init__(self) -> None:
+        if not _SOURCE_PATTERN.match(self.source):
+            raise ValueError(f"Invalid edge source {self.source!r}.")
+
+    @property
+    def source_task(self) -> str:
+        return _SOURCE_PATTERN.match(self.source)["task"]
+
+    @property
+    def offset(self) -> int:
+        """How many cycle points back the source lies (0 for the same cycle point)."""
+        return int(_SOURCE_PATTERN.match(self.source)["offset"] or 0)
+
+
+@dataclasses.dataclass(frozen=True)
+class Graph:
+    """
+    Tasks and edges of a cycling graph.
+
+    Parameters:
+    -----------
+    tasks: {<task name>: <process class run for the task>}
+    edges: connections between the tasks.
+    """
+
+    tasks: Mapping[str, type[engine.Process]]
+    edges: tuple[Edge, ...]
+
+    def __post_init__(self) -> None:
+        unknown = {
+            name
+            for edge in self.edges
+            for name in (edge.source_task, edge.target)
+            if name not in self.tasks
+        }
+        if unknown:
+            raise ValueError(f"Edges refer to unknown tasks {sorted(unknown)}.")
+        self.task_order()
+
+    def task_order(self) -> list[str]:
+        """Tasks in the order they can run within one cycle point."""
+        sorter = graphlib.TopologicalSorter({name: set() for name in self.tasks})
+        for edge in self.edges:
+            if edge.offset == 0:
+                sorter.add(edge.target, edge.source_task)
+        try:
+            return list(sorter.static_order())
+        except graphlib.CycleError as err:
+            raise ValueError(
+                f"Edges within a cycle point form a loop: {err.args[1]}."
+            ) from err
+
+    def expand(
+        self, initial_cycle_point: int, final_cycle_point: int
+    ) -> dict[str, list[tuple[str | None, int]]]:
+        """
+        Expand the graph into the dependency DAG of all cycle points.
+
+        Returns {<task key>: [(<source task key>, <edge index>), ...]} in an
+        order in which the tasks can be submitted. The source task key is None
+        for edges reaching before the initial cycle point.
+        """
+        order = self.task_order()
+        incoming = {name: [] for name in order}
+        for index, edge in enumerate(self.edges):
+            incoming[edge.target].append(index)
+        dag = {}
+        for point in range(initial_cycle_point, final_cycle_point + 1):
+            for name in order:
+                upstream = []
+                for index in incoming[name]:
+                    edge = self.edges[index]
+                    source_point = point - edge.offset
+                    if source_point < initial_cycle_point:
+                        upstream.append((None, index))
+                    else:
+                        upstream.append(
+                            (task_key(edge.source_task, source_point), index)
+                        )
+                dag[task_key(name, point)] = upstream
+        return dag
+
+
+def task_key(name: str, cycle_point: int) -> str:
+    return f"{name}@{cycle_point}"
+
+
+def split_task_key(key: str) -> tuple[str, int]:
+    name, point = key.rsplit("@", 1)
+    return name, int(point)
+
+
+class CyclingWorkChain(engine.WorkChain):
+    """
+    Run a cycling graph from the initial to the final cycle point.
+
+    Subclasses set `graph` and implement `initial_input` for the edges which
+    reach before the initial cycle point. Those inputs are collected before
+    any task is submitted, so a graph without them fails right away.
+
+    Inputs:
+    -------
+    initial_cycle_point [Int]: first cycle point.
+    final_cycle_point [Int]: last cycle point (inclusive).
+    max_active_cycle_points [Int]: how many cycle points may have tasks
+        submitted at the same time, counted from the oldest unfinished one.
+    max_active_processes [Int, optional]: how many tasks may run at the same
+        time. Ready tasks beyond the limit are submitted in order as running
+        ones finish. Unlimited if not given.
+    """
+
+    graph: Graph
+
+    @classmethod
+    def define(cls: type, spec: workchain.WorkChainSpec) -> None:
+        super().define(spec)
+        spec.input("initial_cycle_point", valid_type=orm.Int)
+        spec.input("final_cycle_point", valid_type=orm.Int)
+        spec.input(
+            "max_active_cycle_points",
+            valid_type=orm.Int,
+            default=lambda: orm.Int(3),
+            validator=_validate_at_least_one,
+        )
+        spec.input(
+            "max_active_processes",
+            valid_type=orm.Int,
+            required=False,
+            validator=_validate_at_least_one,
+        )
+        spec.exit_code(400, "ERROR_TASK_FAILED", message="A task did not finish ok.")
+        spec.exit_code(
+            401,
+            "ERROR_MISSING_INITIAL_INPUT",
+            message="No inputs for an edge reaching before the initial cycle point.",
+        )
+        spec.outline(
+            cls.init_cycling,
+            cls.check_initial_inputs,
+            engine.while_(cls.has_unfinished_tasks)(
+                cls.submit_ready_tasks,
+                cls.await_first_task,
+                cls.check_running_tasks,
+            ),
+        )
+
+    def init_cycling(self) -> None:
+        """Expand the graph into the dependency DAG of all cycle points."""
+        dag = self.graph.expand(
+            self.inputs.initial_cycle_point.value, self.inputs.final_cycle_point.value
+        )
+        self.ctx.waiting = list(dag)
+        self.ctx.upstream = dag
+        self.ctx.running = {}
+        self.ctx.finished = {}
+        self.report(f"Scheduling {len(dag)} tasks")
+
+    def initial_input(self, edge: Edge, cycle_point: int) -> dict[str, orm.Node]:
+        """
+        Inputs for an edge reaching before the initial cycle point.
+
+        Returns {<input name of edge.target>: <node>} for every port of `edge`.
+        Called once per edge and cycle point, after `init_cycling`.
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not provide inputs for {edge.source} "
+            f"before the initial cycle point {self.inputs.initial_cycle_point.value}."
+        )
+
+    def check_initial_inputs(self) -> engine.ExitCode | None:
+        """Collect the inputs of the edges reaching before the initial cycle point."""
+        self.ctx.initial_inputs = {}
+        for key, upstream in self.ctx.upstream.items():
+            _, point = split_task_key(key)
+            for source, index in upstream:
+                if source is not None:
+                    continue
+                edge = self.graph.edges[index]
+                try:
+                    inputs = self.initial_input(edge, point)
+                except NotImplementedError as err:
+                    self.report(str(err))
+                    return self.exit_codes.ERROR_MISSING_INITIAL_INPUT
+                if missing := set(edge.ports.values()) - set(inputs):
+                    self.report(
+                        f"No initial inputs {sorted(missing)} of {key} from {edge.source}."
+                    )
+                    return self.exit_codes.ERROR_MISSING_INITIAL_INPUT
+                self.ctx.initial_inputs.setdefault(key, {}).update(inputs)
+        return None
+
+    def has_unfinished_tasks(self) -> bool:
+        return bool(self.ctx.waiting or self.ctx.running)
+
+    def oldest_active_cycle_point(self) -> int:
+        keys = list(self.ctx.running) + self.ctx.waiting
+        return min(split_task_key(key)[1] for key in keys)
+
+    def free_process_slots(self) -> int | float:
+        if "max_active_processes" not in self.inputs:
+            return float("inf")
+        return self.inputs.max_active_processes.value - len(self.ctx.running)
+
+    def submit_ready_tasks(self) -> None:
+        """Submit waiting tasks whose dependencies have finished, oldest first."""
+        horizon = (
+            self.oldest_active_cycle_point() + self.inputs.max_active_cycle_points.value
+        )
+        slots = self.free_process_slots()
+        waiting = []
+        for position, key in enumerate(self.ctx.waiting):
+            name, point = split_task_key(key)
+            if point >= horizon or slots <= 0:
+                # waiting tasks are ordered by cycle point, so none of the rest can run
+                waiting.extend(self.ctx.waiting[position:])
+                break
+            if all(
+                source is None or source in self.ctx.finished
+                for source, _ in self.ctx.upstream[key]
+            ):
+                self.ctx.running[key] = self.submit_task(name, point).uuid
+                slots -= 1
+            else:
+                waiting.append(key)
+        self.ctx.waiting = waiting
+
+    def submit_task(self, name: str, cycle_point: int) -> orm.ProcessNode:
+        key = task_key(name, cycle_point)
+        connections = {}
+        for source, index in self.ctx.upstream[key]:
+            edge = self.graph.edges[index]
+            if source is not None:
+                connections.setdefault(self.ctx.finished[source], {}).update(edge.ports)
+        inputs = self.ctx.initial_inputs.get(key, {}) | cycle.collect_outputs(
+            connections
+        )
+        node = self.submit(self.graph.tasks[name], **inputs, metadata={"label": key})
+        self._watch_task(node)
+        self.report(f"Submitted {key}: {node.pk}")
+        return node
+
+    def await_first_task(self) -> None:
+        """
+        Wait until the first of the running tasks finishes.
+
+        A task finishing early releases its dependents and its process slot
+        right away, whichever tasks were submitted before it. All running tasks
+        are checked afterwards, as several may have finished by then.
+
+        Every task is watched once from its submission on (see `_watch_task`).
+        The single awaitable inserted here is not watched itself, it only keeps
+        the work chain waiting until `_resolve_first_finished` resolves it.
+        """
+        nodes = cycle.load_nodes(self.ctx.running.values())
+        if not nodes or any(node.is_terminated for node in nodes.values()):
+            return
+        self.to_context(**{_FIRST_FINISHED: next(iter(nodes.values()))})
+        self.node.set_process_status(
+            f"Waiting for the first of {len(nodes)} running tasks"
+        )
+
+    def _watch_task(self, node: orm.ProcessNode) -> None:
+        self.runner.call_on_process_finish(
+            node.pk, functools.partial(self.call_soon, self._resolve_first_finished)
+        )
+
+    def _resolve_first_finished(self) -> None:
+        """Resume the work chain waiting in `await_first_task` if a task finished."""
+        pending = [
+            awaitable
+            for awaitable in self._awaitables
+            if awaitable.key == _FIRST_FINISHED
+        ]
+        if self.state != engine.ProcessState.WAITING or not pending:
+            return
+        nodes = cycle.load_nodes(self.ctx.running.values())
+        finished = [node for node in nodes.values() if node.is_terminated]
+        if finished:
+            (awaitable,) = pending
+            awaitable.pk = finished[0].pk
+            self._on_awaitable_finished(awaitable)
+
+    def _action_awaitables(self) -> None:
+        if any(awaitable.key != _FIRST_FINISHED for awaitable in self._awaitables):
+            super()._action_awaitables()
+        else:
+            # a task may have finished before the work chain started waiting
+            self.call_soon(self._resolve_first_finished)
+
+    def load_instance_state(self, saved_state: Any, load_context: Any) -> None:
+        super().load_instance_state(saved_state, load_context)
+        for uuid in self.ctx.get("running", {}).values():
+            self._watch_task(orm.load_node(uuid))
+
+    def check_running_tasks(self) -> engine.ExitCode | None:
+        nodes = cycle.load_nodes(self.ctx.running.values())
+        failed = []
+        for key, uuid in list(self.ctx.running.items()):
+            if not nodes[uuid].is_terminated:
+                continue
+            if not nodes[uuid].is_finished_ok:
+                failed.append(key)
+            self.ctx.finished[key] = self.ctx.running.pop(key)
+        if failed:
+            self.report(f"Tasks {failed} did not finish successfully, abort")
+            return self.exit_codes.ERROR_TASK_FAILED
+        return None
+
+
+def _validate_at_least_one(value: orm.Int, port: Any) -> str | None:
+    if value.value < 1:
+        return f"{port.name} must be at least 1."
+    return None
@@ -1,26 +1,27 @@
-import time
-
 from aiida import engine, orm
 from aiida.engine.processes.workchains import context, workchain
 
+from aiida_c2sm import cycle, sleep
+
 
 @engine.calcfunction
 def hello(task_name: str) -> orm.Str:
-    time.sleep(5)
     return orm.Str(f"Hello from {task_name}!")
 
 
-class Hello(engine.WorkChain):
+class Hello(sleep.SleepMixin, engine.WorkChain):
     @classmethod
     def define(cls: type, spec: workchain.WorkChainSpec) -> None:
         super().define(spec)
         spec.input("task_name")
         spec.input("sleep_duration", default=lambda: orm.Int(5))
-        spec.outline(cls.say_hello)
+        spec.outline(cls.wait, cls.say_hello)
 
-    def say_hello(self) -> None:
+    def wait(self) -> None:
         self.ctx.task_name = self.inputs.task_name.value
-        time.sleep(self.inputs.sleep_duration.value)
+        self.sleep(self.inputs.sleep_duration.value)
+
+    def say_hello(self) -> None:
         self.report(f"Hello from {self.ctx.task_name}")
 
 
@@ -120,17 +121,45 @@ class WaitingHello(engine.WorkChain):
 
 
 class HandoffWait(engine.WorkChain):
+    """
+    Hand dependencies off to WaitingHello workflows instead of awaiting them.
+
+    At most `max_waiting` of the WaitingHello workflows exist unfinished at a
+    time, each of them occupies a daemon slot while it waits. Before submitting
+    another one, the oldest unfinished one is awaited.
+    """
+
     @classmethod
     def define(cls: type, spec: workchain.WorkChainSpec) -> None:
         super().define(spec)
+        spec.input("max_waiting", valid_type=orm.Int, default=lambda: orm.Int(2))
         spec.outline(
+            cls.init_waiting,
             cls.sub_a,
+            engine.while_(cls.at_waiting_limit)(cls.await_oldest_waiting),
             cls.sub_b,
+            engine.while_(cls.at_waiting_limit)(cls.await_oldest_waiting),
             cls.sub_c,
+            engine.while_(cls.at_waiting_limit)(cls.await_oldest_waiting),
             cls.sub_d,
             cls.await_d,
         )
 
+    def init_waiting(self) -> None:
+        self.ctx.waiting = []
+
+    def at_waiting_limit(self) -> bool:
+        nodes = cycle.load_nodes(self.ctx.waiting)
+        self.ctx.waiting = [
+            uuid for uuid in self.ctx.waiting if not nodes[uuid].is_terminated
+        ]
+        return len(self.ctx.waiting) >= self.inputs.max_waiting.value
+
+    def await_oldest_waiting(self) -> None:
+        oldest = orm.load_node(self.ctx.waiting[0])
+        self.report(f"Waiting limit reached, awaiting {oldest.pk}")
+        self.to_context(oldest_waiting=oldest)
+
     def sub_a(self) -> None:
         a = self.submit(Hello, task_name=orm.Str("A"))
         self.report(f"Subbing A: {a.pk}")
@@ -145,6 +174,7 @@ class HandoffWait(engine.WorkChain):
         )
         self.report(f"Subbing B: {b.pk}")
         self.ctx.id_b = b.uuid
+        self.ctx.waiting.append(b.uuid)
 
     def sub_c(self) -> None:
         c = self.submit(
@@ -155,6 +185,7 @@ class HandoffWait(engine.WorkChain):
         )
         self.report(f"Subbing C: {c.pk}")
         self.ctx.id_c = c.uuid
+        self.ctx.waiting.append(c.uuid)
 
     def sub_d(self) -> None:
         d = self.submit(
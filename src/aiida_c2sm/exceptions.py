@@ -1,2 +1,6 @@
 class DatabaseAmbiguityError(Exception):
     ...
+
+
+class RemoteCommandError(Exception):
+    ...
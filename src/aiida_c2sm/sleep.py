@@ -0,0 +1,49 @@
+"""
+Non-blocking sleep for workchain steps.
+
+`time.sleep` in a step blocks the daemon worker, which then cannot progress
+any of its other processes. `SleepMixin.sleep` pauses the process after the
+current step instead and plays it again from the event loop once the time is
+up, so one worker can keep thousands of sleeping processes.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from plumpy import persistence
+
+__all__ = ["SleepMixin"]
+
+
+class SleepMixin:
+    """
+    Add a non-blocking `sleep` to a WorkChain, list it before `engine.WorkChain`.
+
+    The wake-up time is kept in the context, so a process which is reloaded
+    from its checkpoint while sleeping (e.g. after a daemon restart) is woken
+    up on time as well.
+    """
+
+    def sleep(self, seconds: float) -> None:
+        """Pause after the current step and continue with the next one after `seconds`."""
+        if seconds <= 0:
+            return
+        self.ctx.wake_up_at = time.time() + seconds
+        self.pause(f"Sleeping for {seconds} s")
+        self._schedule_wake_up()
+
+    def _schedule_wake_up(self) -> None:
+        self.loop.call_later(max(self.ctx.wake_up_at - time.time(), 0), self._wake_up)
+
+    def _wake_up(self) -> None:
+        if "wake_up_at" in self.ctx and self.paused:
+            del self.ctx.wake_up_at
+            self.play()
+
+    def load_instance_state(
+        self, saved_state: dict[str, Any], load_context: persistence.LoadSaveContext
+    ) -> None:
+        super().load_instance_state(saved_state, load_context)
+        if self.paused and "wake_up_at" in self.ctx:
+            self._schedule_wake_up()
@@ -1,7 +1,8 @@
-from . import conv2icon, data, gcm2icon, icon, icon_wc, params, prep, prepare
+from . import conv2icon, data, gcm2icon, grid, icon, icon_wc, params, prep, prepare
 
 __all__ = [
     "data",
+    "grid",
     "prep",
     "conv2icon",
     "icon",
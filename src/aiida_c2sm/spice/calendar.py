@@ -0,0 +1,92 @@
+"""
+Run chunks of an experiment.
+
+An experiment is run in chunks of `chunk_months` calendar months, the first
+one starting at the start date and every later one at the start of a month.
+The last chunk ends at the first start of a month at or after the stop date,
+so it may be shorter than the others. The chunk boundaries are computed once
+with numpy, in the wall clock time of the start date, together with their
+offsets from the start in seconds as used by the ICON namelists.
+"""
+from __future__ import annotations
+
+import datetime
+
+import numpy as np
+import pendulum
+
+__all__ = ["ExperimentCalendar"]
+
+
+class ExperimentCalendar:
+    """
+    Chunk boundaries of an experiment from `start_date` to `stop_date`.
+
+    Chunk `i` runs from `boundaries[i]` to `boundaries[i + 1]`, which are
+    `offsets[i]` and `offsets[i + 1]` seconds after the start.
+    """
+
+    def __init__(
+        self,
+        start_date: datetime.datetime,
+        stop_date: datetime.datetime,
+        chunk_months: int = 1,
+    ) -> None:
+        if chunk_months < 1:
+            raise ValueError(f"Chunks must be at least one month, not {chunk_months}.")
+        self.start_date = pendulum.instance(start_date)
+        self.chunk_months = chunk_months
+        start = self._to_datetime64(self.start_date)
+        stop = self._to_datetime64(stop_date)
+        if stop <= start:
+            raise ValueError(f"Stop date {stop_date} is not after {start_date}.")
+        stop_month = stop.astype("datetime64[M]")
+        end = stop_month.astype("datetime64[s]")
+        if end < stop:
+            end = (stop_month + 1).astype("datetime64[s]")
+        months = np.arange(
+            start.astype("datetime64[M]") + chunk_months, stop_month + 1, chunk_months
+        ).astype("datetime64[s]")
+        self.boundaries = np.concatenate([[start], months[months < stop], [end]])
+        self.offsets = (self.boundaries - start).astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.boundaries) - 1
+
+    @property
+    def dates(self) -> list[pendulum.DateTime]:
+        """Start dates of the chunks."""
+        return [self._to_pendulum(value) for value in self.boundaries[:-1]]
+
+    def index(self, date: datetime.datetime) -> int:
+        """Index of the chunk containing `date`."""
+        index = int(
+            np.searchsorted(self.boundaries, self._to_datetime64(date), side="right")
+            - 1
+        )
+        if not 0 <= index < len(self):
+            raise ValueError(f"{date} is outside of the experiment.")
+        return index
+
+    def start(self, index: int) -> pendulum.DateTime:
+        """Start date of chunk `index`."""
+        return self._to_pendulum(self.boundaries[index])
+
+    def stop(self, index: int) -> pendulum.DateTime:
+        """End date of chunk `index`, the start date of the next one."""
+        return self._to_pendulum(self.boundaries[index + 1])
+
+    def next_date(self, date: datetime.datetime) -> pendulum.DateTime:
+        """Start date of the chunk after the one containing `date`."""
+        return self.stop(self.index(date))
+
+    def _to_datetime64(self, date: datetime.datetime) -> np.datetime64:
+        date = pendulum.instance(date)
+        if self.start_date.tzinfo is not None:
+            date = date.in_timezone(self.start_date.tzinfo)
+        return np.datetime64(date.naive().replace(tzinfo=None), "s")
+
+    def _to_pendulum(self, value: np.datetime64) -> pendulum.DateTime:
+        return pendulum.instance(
+            value.astype(datetime.datetime), tz=self.start_date.tzinfo
+        )
@@ -0,0 +1,76 @@
+"""Command line tools for SPICE experiments."""
+from __future__ import annotations
+
+import click
+import tabulate
+from aiida import load_profile
+
+from aiida_c2sm.spice import timing
+
+_JOB_COLUMNS = ("queue_seconds", "run_seconds", "retrieve_seconds")
+
+
+@click.group()
+@click.option(
+    "-p", "--profile", default=None, help="AiiDA profile (default profile if omitted)."
+)
+def cli(profile: str | None) -> None:
+    """Tools for SPICE experiments run with aiida-c2sm."""
+    load_profile(profile)
+
+
+@cli.command()
+@click.argument("experiment_id")
+def timings(experiment_id: str) -> None:
+    """Print per-month and per-stage timings of EXPERIMENT_ID."""
+    data = timing.experiment_timings(experiment_id)
+    if not data["months"] and not data["steps"]:
+        raise click.ClickException(f"No timings found for experiment {experiment_id}.")
+
+    headers = ["month"] + [
+        f"{stage} {column.split('_')[0]}"
+        for stage in timing.STAGES
+        for column in _JOB_COLUMNS
+    ]
+    rows = [
+        [month]
+        + [
+            stages.get(stage, {}).get(column)
+            for stage in timing.STAGES
+            for column in _JOB_COLUMNS
+        ]
+        for month, stages in data["months"].items()
+    ]
+    click.echo("Jobs per month [s]:")
+    click.echo(tabulate.tabulate(rows, headers=headers, floatfmt=".0f"))
+
+    rows = []
+    for stage in timing.STAGES:
+        jobs = [stages[stage] for stages in data["months"].values() if stage in stages]
+        rows.append(
+            [stage, len(jobs)]
+            + [sum(job.get(column, 0.0) for job in jobs) for column in _JOB_COLUMNS]
+            + [sum(job.get("retrieved_bytes", 0) for job in jobs)]
+        )
+    click.echo("\nJobs per stage (totals):")
+    click.echo(
+        tabulate.tabulate(
+            rows,
+            headers=["stage", "jobs", "queue [s]", "run [s]", "retrieve [s]", "bytes"],
+            floatfmt=".0f",
+        )
+    )
+
+    rows = [
+        [workchain, step, record["calls"], record["seconds"], record["max_seconds"]]
+        for workchain, steps in data["steps"].items()
+        for step, record in steps.items()
+    ]
+    click.echo("\nWorkchain steps:")
+    click.echo(
+        tabulate.tabulate(
+            rows,
+            headers=["workchain", "step", "calls", "total [s]", "max [s]"],
+            floatfmt=".3f",
+        )
+    )
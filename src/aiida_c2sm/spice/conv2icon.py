@@ -2,13 +2,19 @@ from __future__ import annotations
 
 import dataclasses
 import pathlib
+from typing import Any, Mapping
 
 import pendulum
 from aiida import engine, orm
-from aiida.common import datastructures, folders
+from aiida.common import datastructures, folders, hashing
 from aiida.engine.processes.calcjobs import calcjob
 from aiida.parsers import parser
 
+from aiida_c2sm.spice import calendar
+from aiida_c2sm.spice import data as spice_data
+from aiida_c2sm.spice import params as spice_params
+from aiida_c2sm.spice import prep, timing
+
 
 class Conv2Icon(engine.CalcJob):
     """AiiDA calculation to convert boundary data to ICON."""
@@ -24,8 +30,40 @@ class Conv2Icon(engine.CalcJob):
         )
         spec.input("ini_basedir", valid_type=orm.RemoteData)
         spec.input("parameters", valid_type=orm.JsonableData, help="Input parameters.")
-        spec.output("converted")
+        spec.input(
+            "remap_weights",
+            valid_type=orm.RemoteData,
+            required=False,
+            help="Remapping weights from a previous conversion onto the same grid.",
+        )
+        spec.input(
+            "store",
+            valid_type=orm.RemoteData,
+            required=False,
+            help="Shared directory keeping converted months, see `prep.get_store_path`.",
+        )
+        spec.output("converted", help="Converted data, one subdirectory per chunk.")
+        spec.output_namespace(
+            "converted_months",
+            valid_type=orm.RemoteData,
+            dynamic=True,
+            help=(
+                "Converted data of each ICON chunk (see `chunk_months`), keyed by "
+                "`m<YYYYMM>` of its first month."
+            ),
+        )
+        spec.output(
+            "timings",
+            valid_type=orm.Dict,
+            required=False,
+            help="Wall time of the script stages and work queue tasks.",
+        )
         spec.output("boundary_data")
+        spec.output(
+            "remap_weights",
+            required=False,
+            help="Remapping weights generated by this conversion.",
+        )
         options = spec.inputs["metadata"]["options"]
         options["resources"].default = {
             "num_machines": 1,
@@ -37,15 +75,25 @@ class Conv2Icon(engine.CalcJob):
             "ERROR_MISSING_OUTPUT_FILES",
             message="Conv2Icon prep did not create all expected output files!",
         )
+        spec.exit_code(
+            301,
+            "ERROR_INCOMPLETE_LBC_SHARDS",
+            message="Not all lateral boundary shards converted all of their files!",
+        )
 
     def prepare_for_submission(self, folder: folders.Folder) -> datastructures.CalcInfo:
         params = self.inputs.parameters.obj
         ini_basedir = pathlib.Path(self.inputs.ini_basedir.get_remote_path())
+        resources = self.inputs.metadata.options.resources
+        store_path = prep.get_store_path(
+            self.inputs, "conv", get_store_key(self.inputs)
+        )
         variables = {
             "ydate_start": params.start_date.strftime("%Y%m%d%H"),
-            "current_date": params.date.strftime("%Y%m%d%H"),
-            "yyyy": params.date.strftime("%Y"),
-            "mm": params.date.strftime("%m"),
+            "month_dates": '"{}"'.format(
+                " ".join(date.strftime("%Y%m%d%H") for date in params.month_dates())
+            ),
+            "chunk_months": params.chunk_months,
             "max_pp": params.n_parallel_tasks,
             "gcm_prefix": params.gcm_prefix,
             "extpar": str(
@@ -58,6 +106,12 @@ class Conv2Icon(engine.CalcJob):
             "gcm_remap": params.gcm_remap,
             "icon_input_optional": params.icon_input_optional,
             "cleanup_previous": 1 if params.cleanup_previous else 0,
+            "reuse_remap_weights": 1 if params.reuse_remap_weights else 0,
+            "lbc_conversion": params.lbc_conversion,
+            "lbc_shards": get_lbc_shards(resources),
+            "lbc_cpus_per_shard": resources.get("num_cores_per_mpiproc", 0),
+            "store_dir": store_path or "",
+            "remap_weights_dir": get_remap_weights_path(self.inputs) or "",
         }
 
         with folder.open("inputs.sh", "w", encoding="utf8") as handle:
@@ -66,12 +120,20 @@ class Conv2Icon(engine.CalcJob):
                     [f"{key.upper()}={value}" for key, value in variables.items()]
                 )
             )
+        for script in ["workqueue.sh", "store.sh", "conv2icon_lbc.sh"]:
+            folder.insert_path(str(prep.get_script_path(script)), script)
 
         codeinfo = datastructures.CodeInfo()
         codeinfo.code_uuid = self.inputs.code.uuid
 
         calcinfo = datastructures.CalcInfo()
         calcinfo.codes_info = [codeinfo]
+        calcinfo.retrieve_list = [
+            "task_timings.txt",
+            "stage_timings.txt",
+            "lbc_files.txt",
+            "lbc_shards",
+        ]
         calcinfo.remote_symlink_list = [
             (
                 self.inputs.gcm_prepared.computer.uuid,
@@ -79,6 +141,14 @@ class Conv2Icon(engine.CalcJob):
                 "gcm_prepared",
             ),
         ]
+        if "remap_weights" in self.inputs:
+            calcinfo.remote_symlink_list.append(
+                (
+                    self.inputs.remap_weights.computer.uuid,
+                    self.inputs.remap_weights.get_remote_path(),
+                    "remap_weights",
+                )
+            )
         calcinfo.remote_copy_list = [
             (
                 self.inputs.boundary_data.computer.uuid,
@@ -93,36 +163,161 @@ class Conv2IconParser(parser.Parser):
     """Parser for conv2icon calculations."""
 
     def parse(self, **kwargs):
-        """Add the remote outfiles subdirectory to outputs."""
-        remote_path = self.node.outputs.remote_folder.get_remote_path()
+        """Add the outfiles directory and its chunks (linked to the store) to outputs."""
+        timing.record_calcjob_timings(self.node, self.retrieved)
+        if script_timings := timing.parse_script_timings(self.retrieved):
+            self.out("timings", orm.Dict(script_timings))
+        inputs = prep.get_node_inputs(self.node)
+        remote_path = pathlib.Path(self.node.outputs.remote_folder.get_remote_path())
 
         outfiles = orm.RemoteData(
             computer=self.node.outputs.remote_folder.computer,
-            remote_path=str(pathlib.Path(remote_path) / "outfiles"),
+            remote_path=str(remote_path / "outfiles"),
         )
-        if outfiles.is_empty:
+        months = prep.get_month_outputs(
+            outfiles, self.node.inputs.parameters.obj.chunk_dates()
+        )
+        if not months.keys() <= prep.get_filled_months(outfiles):
             return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+        # months taken from the store are not in lbc_files.txt
+        if not self.lbc_shards_complete():
+            return self.exit_codes.ERROR_INCOMPLETE_LBC_SHARDS
         self.out("converted", outfiles)
+        self.out("converted_months", months)
 
         boundary_data = orm.RemoteData(
             computer=self.node.outputs.remote_folder.computer,
-            remote_path=str(pathlib.Path(remote_path) / "boundary_data"),
+            remote_path=str(remote_path / "boundary_data"),
         )
         self.out("boundary_data", boundary_data)
+
+        if "remap_weights" not in inputs:
+            remap_weights = orm.RemoteData(
+                computer=self.node.outputs.remote_folder.computer,
+                remote_path=str(
+                    get_remap_weights_path(inputs)
+                    or pathlib.Path(self.node.outputs.remote_folder.get_remote_path())
+                    / "remap_weights"
+                ),
+            )
+            if not remap_weights.is_empty:
+                self.out("remap_weights", remap_weights)
         return engine.ExitCode(0)
 
+    def lbc_shards_complete(self) -> bool:
+        """Check that every shard finished and together they covered all files."""
+        expected = set(self.retrieved.get_object_content("lbc_files.txt").split())
+        converted: set[str] = set()
+        for shard in range(get_lbc_shards(self.node.get_option("resources"))):
+            done_file = f"lbc_shards/shard_{shard}.done"
+            try:
+                converted |= set(self.retrieved.get_object_content(done_file).split())
+            except FileNotFoundError:
+                self.logger.error(f"LBC shard {shard} did not finish.")
+                return False
+        if missing := expected - converted:
+            self.logger.error(f"LBC files not converted: {sorted(missing)}.")
+            return False
+        return True
+
+
+def get_store_key(inputs: Mapping[str, Any]) -> dict[str, Any]:
+    """
+    What determines the content of a converted month, see `prep.get_store_path`.
+
+    The prepared GCM data are identified by the store key of the prep job which
+    created them, so months prepared by different jobs from the same GCM data
+    share their converted months as well.
+    """
+    params = inputs["parameters"].obj
+    return {
+        "gcm_prepared": get_prepared_key(inputs["gcm_prepared"]),
+        "ini_basedir": inputs["ini_basedir"].base.caching.compute_hash(),
+        "gcm_prefix": params.gcm_prefix,
+        "gcm_remap": params.gcm_remap,
+        "icon_input_optional": params.icon_input_optional,
+    }
+
+
+def get_prepared_key(gcm_prepared: orm.RemoteData) -> str:
+    """Hash of the GCM data and prefix `gcm_prepared` was prepared from."""
+    creator = gcm_prepared.creator
+    if isinstance(creator, orm.CalcJobNode) and creator.process_class is (
+        prep.GCM2IconPrep
+    ):
+        return hashing.make_hash(prep.get_store_key(prep.get_node_inputs(creator)))
+    return gcm_prepared.base.caching.compute_hash()
+
+
+def get_remap_weights_path(inputs: Mapping[str, Any]) -> pathlib.Path | None:
+    """
+    Remapping weights in the shared store, if there is a `store` input.
+
+    The weights depend on the target grid and the remapping method only, so
+    they are shared by all months and experiments using the same ones.
+    """
+    if "store" not in inputs:
+        return None
+    params = inputs["parameters"].obj
+    key = hashing.make_hash(
+        {
+            "ini_basedir": inputs["ini_basedir"].base.caching.compute_hash(),
+            "gcm_prefix": params.gcm_prefix,
+            "gcm_remap": params.gcm_remap,
+        }
+    )
+    return pathlib.Path(inputs["store"].get_remote_path()) / "remap_weights" / key
+
+
+def get_lbc_shards(resources: dict[str, int]) -> int:
+    """Number of tasks the lateral boundary files are spread over."""
+    if "tot_num_mpiprocs" in resources:
+        return resources["tot_num_mpiprocs"]
+    return resources.get("num_machines", 1) * resources.get(
+        "num_mpiprocs_per_machine", 1
+    )
+
 
 @dataclasses.dataclass
 class Conv2IconParams:
     start_date: pendulum.DateTime
     date: pendulum.DateTime
+    #! number of consecutive months, starting with `date`, converted in one job
+    n_months: int = 1
+    #! months of an ICON chunk, converted into the subdirectory of its first month
+    chunk_months: int = 1
     hincbound: int = 6
-    n_parallel_tasks: int = 12
+    n_parallel_tasks: int = dataclasses.field(default=12, metadata={"hash": False})
     gcm_prefix: str = "caf"
-    omp_threads: int = 1
+    omp_threads: int = dataclasses.field(default=1, metadata={"hash": False})
     gcm_remap: str = "remaplaf"
     icon_input_optional: str = ""
-    cleanup_previous: bool = False
+    cleanup_previous: bool = dataclasses.field(default=False, metadata={"hash": False})
+    reuse_remap_weights: bool = dataclasses.field(
+        default=True, metadata={"hash": False}
+    )
+    #! "fused": select and remap in one CDO call, then attach the hybrid
+    #! coefficients and rename dimensions in place. "sequential": one NCO call
+    #! (and one rewrite of the file) per step.
+    lbc_conversion: str = dataclasses.field(default="fused", metadata={"hash": False})
+
+    def __post_init__(self) -> None:
+        spice_params.check_lbc_conversion(self.lbc_conversion)
+
+    def month_dates(self) -> list[pendulum.DateTime]:
+        """Start dates of the months to convert, beginning with `date`."""
+        return spice_data.month_dates(self.date, self._stop_date())
+
+    def chunk_dates(self) -> list[pendulum.DateTime]:
+        """Start dates of the ICON chunks to convert, beginning with `date`."""
+        chunks = calendar.ExperimentCalendar(
+            self.start_date, self._stop_date(), self.chunk_months
+        )
+        return [date for date in chunks.dates if date >= self.date]
+
+    def _stop_date(self) -> pendulum.DateTime:
+        stop_date = pendulum.instance(self.date).start_of("month")
+        return stop_date.add(months=self.n_months)
 
     def as_dict(self) -> dict[str, str | int | bool]:
         data = dataclasses.asdict(self)
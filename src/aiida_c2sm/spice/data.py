@@ -9,6 +9,7 @@ import pendulum
 from aiida import orm
 
 from aiida_c2sm import exceptions
+from aiida_c2sm.spice import calendar
 
 _GROUP_LABEL = "spice-exp"
 
@@ -24,18 +25,40 @@ _INIBASEDIR_LABEL = "ini_basedir"
 _INIBASEDIR_PATH = "/scratch/snx3000/mjaehn/sandbox_workflow/spice/data/rcm/"
 
 
-__all__ = ["get_gcm_data", "get_inidata", "get_inibasedir"]
+__all__ = ["ParamsData", "get_gcm_data", "get_inidata", "get_inibasedir"]
+
+
+class ParamsData(orm.JsonableData):
+    """
+    Wrapped parameter dataclass, hashed only by the fields which change the results.
+
+    Fields declared with ``dataclasses.field(metadata={"hash": False})`` only
+    control how a job runs (e.g. the number of parallel tasks). Leaving them out
+    of the hash lets AiiDA caching reuse jobs which differ only in those.
+    """
+
+    @property
+    def _hash_ignored_attributes(self) -> tuple[str, ...]:
+        return super()._hash_ignored_attributes + tuple(
+            field.name
+            for field in dataclasses.fields(self.obj)
+            if field.metadata.get("hash", True) is False
+        )
 
 
 @dataclasses.dataclass
 class PrepParams:
     date: pendulum.DateTime
+    #! end of the prepared period, may be several months after `date`
     next_date: pendulum.DateTime
-    n_parallel_tasks: int
+    n_parallel_tasks: int = dataclasses.field(metadata={"hash": False})
     utils_bindir: pathlib.Path
     cfu_bindir: pathlib.Path
     hincbound: int
     gcm_prefix: str
+    #! decompress and convert each tar member as soon as it is extracted,
+    #! instead of extracting the whole archive first
+    stream_extract: bool = dataclasses.field(default=True, metadata={"hash": False})
 
     def as_dict(self) -> dict[str, str | int]:
         data = dataclasses.asdict(self)
@@ -45,6 +68,10 @@ class PrepParams:
         data["cfu_bindir"] = str(self.cfu_bindir)
         return data
 
+    def month_dates(self) -> list[pendulum.DateTime]:
+        """Start dates of the months to prepare, beginning with `date`."""
+        return month_dates(self.date, self.next_date)
+
     @classmethod
     def from_dict(cls, data) -> PrepParams:
         kwargs = data.copy()
@@ -55,6 +82,13 @@ class PrepParams:
         return cls(**kwargs)
 
 
+def month_dates(
+    date: datetime.datetime, stop_date: datetime.datetime
+) -> list[pendulum.DateTime]:
+    """Start dates of the months from `date` up to (excluding) `stop_date`."""
+    return calendar.ExperimentCalendar(date, stop_date).dates
+
+
 def get_data(label: str, initializer: Callable[[], orm.RemoteData]) -> orm.RemoteData:
     """Get a singleton spice data node, create if it doesn't exist."""
     query = orm.QueryBuilder()
@@ -1,3 +1,5 @@
+import functools
+
 import coolname
 import pendulum
 from aiida import engine, orm
@@ -5,6 +7,120 @@ from aiida.engine.processes.workchains import workchain
 from typing_extensions import Self
 
 from aiida_c2sm import spice
+from aiida_c2sm.spice import calendar, timing
+
+
+class Gcm2IconPreprocess(engine.WorkChain):
+    """Prepare and convert the GCM data for one batch of Gcm2Icon months."""
+
+    @classmethod
+    def define(cls: type[Self], spec: workchain.WorkChainSpec) -> None:
+        super().define(spec)
+        spec.input("experiment_id", valid_type=orm.Str, serializer=orm.to_aiida_type)
+        spec.expose_inputs(
+            spice.prep.GCM2IconPrep, namespace="prep", exclude=["metadata"]
+        )
+        spec.input(
+            "prep.options",
+            valid_type=orm.Dict,
+            serializer=orm.to_aiida_type,
+            help="Computer options.",
+        )
+        spec.expose_inputs(
+            spice.conv2icon.Conv2Icon,
+            namespace="conv",
+            exclude=["gcm_prepared", "metadata"],
+        )
+        spec.input(
+            "conv.options",
+            valid_type=orm.Dict,
+            serializer=orm.to_aiida_type,
+            help="Computer options.",
+        )
+        spec.expose_outputs(
+            spice.prep.GCM2IconPrep, include=["gcm_prepared", "gcm_prepared_months"]
+        )
+        spec.expose_outputs(
+            spice.conv2icon.Conv2Icon,
+            include=["converted", "converted_months", "boundary_data", "remap_weights"],
+        )
+        spec.exit_code(
+            401, "ERROR_PREP_FAILED", message="The preparation calculation failed."
+        )
+        spec.exit_code(
+            402, "ERROR_CONV_FAILED", message="The conversion calculation failed."
+        )
+        spec.outline(cls.prep, cls.conv, cls.finalize)
+
+    @timing.timed_step
+    def prep(self: Self) -> None:
+        params = self.inputs.prep.parameters.obj
+        self.report(
+            "Starting Preparation run for date {current}.".format(
+                current=params.date.to_datetime_string()
+            )
+        )
+        builder = self.inputs.prep.code.get_builder()
+        builder.metadata.label = (
+            f"prep:{self.inputs.experiment_id.value}@{params.date.isoformat()}"
+        )
+        builder.metadata.description = " ".join(
+            (
+                f"Preparation job for experiment {self.inputs.experiment_id.value},",
+                "launched from Gcm2Icon workflow.",
+            )
+        )
+        builder.metadata.computer = builder.code.computer
+        for key, value in self.inputs.prep.options.items():
+            builder.metadata.options[key] = value
+        self.to_context(
+            prep=self.submit(
+                builder,
+                **self.exposed_inputs(spice.prep.GCM2IconPrep, namespace="prep"),
+            )
+        )
+
+    @timing.timed_step
+    def conv(self: Self) -> engine.ExitCode | None:
+        if not self.ctx.prep.is_finished_ok:
+            self.report(f"Preparation {self.ctx.prep.pk} failed, abort.")
+            return self.exit_codes.ERROR_PREP_FAILED
+        params = self.inputs.conv.parameters.obj
+        self.report(
+            "Starting Conv2Icon run for date {current}.".format(
+                current=params.date.to_datetime_string()
+            )
+        )
+        builder = self.inputs.conv.code.get_builder()
+        builder.metadata.label = (
+            f"conv:{self.inputs.experiment_id.value}@{params.date.isoformat()}"
+        )
+        builder.metadata.description = " ".join(
+            (
+                f"Conversion job for experiment {self.inputs.experiment_id.value},",
+                "launched from Gcm2Icon workflow.",
+            )
+        )
+        builder.metadata.computer = builder.code.computer
+        for key, value in self.inputs.conv.options.items():
+            builder.metadata.options[key] = value
+        self.to_context(
+            conv=self.submit(
+                builder,
+                gcm_prepared=self.ctx.prep.outputs.gcm_prepared,
+                **self.exposed_inputs(spice.conv2icon.Conv2Icon, namespace="conv"),
+            )
+        )
+        return None
+
+    @timing.timed_step
+    def finalize(self: Self) -> engine.ExitCode | None:
+        if not self.ctx.conv.is_finished_ok:
+            self.report(f"Conversion {self.ctx.conv.pk} failed, abort.")
+            return self.exit_codes.ERROR_CONV_FAILED
+        self.out_many(self.exposed_outputs(self.ctx.prep, spice.prep.GCM2IconPrep))
+        self.out_many(self.exposed_outputs(self.ctx.conv, spice.conv2icon.Conv2Icon))
+        return None
 
 
 class Gcm2Icon(engine.WorkChain):
@@ -23,6 +139,16 @@ class Gcm2Icon(engine.WorkChain):
         spec.input(
             "computer_options", valid_type=orm.Dict, serializer=orm.to_aiida_type
         )
+        spec.input(
+            "resume",
+            valid_type=orm.Bool,
+            serializer=orm.to_aiida_type,
+            default=lambda: orm.Bool(False),
+            help=(
+                "Skip the months already completed by previous runs with the same "
+                "experiment_id and continue from the last successful Icon restart."
+            ),
+        )
         spec.input(
             "prep.computer_options",
             valid_type=orm.Dict,
@@ -60,6 +186,7 @@ class Gcm2Icon(engine.WorkChain):
                 "parameters",
                 "restart_file_dir",
                 "restart_file_name",
+                "lightweight_namelists",
             ],
         )
         spec.expose_inputs(
@@ -67,13 +194,19 @@ class Gcm2Icon(engine.WorkChain):
         )
 
         spec.expose_outputs(spice.icon_wc.IconWorkChain)
+        spec.exit_code(
+            401,
+            "ERROR_PREPROCESSING_FAILED",
+            message="Preparation or conversion of the GCM data failed.",
+        )
 
         spec.outline(
             cls.check_inputs,
             cls.init_iterations,
+            engine.if_(cls.should_resume)(cls.resume),
             engine.while_(cls.should_run)(
-                cls.prep,
-                cls.conv,
+                cls.preprocess_ahead,
+                cls.wait_for_preprocessing,
                 cls.wait_for_previous_icon,
                 cls.icon,
                 cls.incr_iteration,
@@ -82,27 +215,98 @@ class Gcm2Icon(engine.WorkChain):
             cls.finalize,
         )
 
+    @timing.timed_step
     def check_inputs(self: Self) -> None:
         self.report("Checking inputs.")
         self.ctx.params = self.inputs.parameters.obj
         self.ctx.expid = self.inputs.experiment_id.value
 
+    @functools.cached_property
+    def experiment_calendar(self: Self) -> calendar.ExperimentCalendar:
+        """Run chunks of the experiment, computed again after a daemon restart."""
+        return calendar.ExperimentCalendar(
+            self.ctx.params.start_date,
+            self.ctx.params.stop_date,
+            self.ctx.params.chunk_months,
+        )
+
+    @timing.timed_step
     def init_iterations(self: Self) -> None:
         self.report("Initializing iteration variables.")
         self.ctx.current_date = self.ctx.params.start_date
-        self.ctx.next_date = next_date(self.ctx.current_date)
         self.ctx.iter_num = 0
+        self.ctx.preprocess_date = self.ctx.params.start_date
+        self.ctx.preprocess_ids = []
+
+    def should_resume(self: Self) -> bool:
+        return self.inputs.resume.value
+
+    @timing.timed_step
+    def resume(self: Self) -> None:
+        """
+        Continue after the last chunk completed by previous runs of this experiment.
+
+        Finished Icon runs are matched by label, starting from the start date, up to
+        the first chunk without one. Finished preprocessing of later chunks is
+        reused instead of submitted again.
+        """
+        self.ctx.reusable_preprocess = {}
+        for preprocess in _finished_by_label(
+            Gcm2IconPreprocess, f"preprocess:{self.ctx.expid}@"
+        ).values():
+            if "remap_weights" in preprocess.outputs:
+                self.ctx.remap_weights = preprocess.outputs.remap_weights
+            # the converted data is kept per chunk, which must be the same
+            conv_params = preprocess.inputs.conv.parameters.obj
+            if conv_params.chunk_months != self.ctx.params.chunk_months:
+                continue
+            months = (
+                preprocess.outputs["converted_months"]
+                if "converted_months" in preprocess.outputs
+                else {}
+            )
+            for month in months:
+                self.ctx.reusable_preprocess[month] = preprocess.uuid
+
+        icons = _finished_by_label(
+            spice.icon_wc.IconWorkChain, f"icon:{self.ctx.expid}@"
+        )
+        done = []
+        while self.ctx.current_date < self.ctx.params.stop_date and (
+            icon := icons.get(
+                f"icon:{self.ctx.expid}@{self.ctx.current_date.isoformat()}"
+            )
+        ):
+            done.append(icon)
+            self.ctx.current_date = self.experiment_calendar.next_date(
+                self.ctx.current_date
+            )
+        if not done:
+            self.report("No completed chunks found, starting from the start date.")
+            return
 
+        self.report(
+            f"Resuming after {len(done)} completed chunk(s) (last Icon run: {done[-1].pk})."
+        )
+        self.ctx.iter_num = len(done)
+        # `wait_for_previous_icon` adds the last one back before it is used
+        self.ctx.icons = done[:-1]
+        self.ctx.last_icon_id = done[-1].uuid
+        self.ctx.preprocess_date = self.ctx.current_date
+        self.ctx.preprocess_ids = [None] * len(done)
+        self.ctx.preprocessed = [None] * len(done)
+
+    @timing.timed_step
     def incr_iteration(self: Self) -> None:
         self.report("Updating iteration variables.")
+        next_date = self.experiment_calendar.next_date(self.ctx.current_date)
         self.report(
             "Current date: {current} -> {next}".format(
                 current=self.ctx.current_date.to_datetime_string(),
-                next=self.ctx.next_date.to_datetime_string(),
+                next=next_date.to_datetime_string(),
             )
         )
-        self.ctx.current_date = self.ctx.next_date
-        self.ctx.next_date = next_date(self.ctx.current_date)
+        self.ctx.current_date = next_date
         self.ctx.iter_num += 1
 
     def should_run(self: Self) -> bool:
@@ -111,85 +315,126 @@ class Gcm2Icon(engine.WorkChain):
             self.report("Stop date is reached, stopping.")
         return should_run
 
-    def prep(self: Self) -> None:
+    @timing.timed_step
+    def preprocess_ahead(self: Self) -> None:
+        """
+        Submit preprocessing for the current chunk and the chunks ahead of it.
+
+        Only Icon depends on the previous chunk (through the restart file),
+        so preparation and conversion for up to `max_preprocess_ahead` future
+        chunks run while the current Icon job is still queued or running.
+        Each submission covers whole chunks, as many as fit into
+        `preprocess_batch_months` months but at least one.
+        """
+        next_date = self.experiment_calendar.next_date
+        batch_chunks = max(
+            1, self.ctx.params.preprocess_batch_months // self.ctx.params.chunk_months
+        )
+        last_iter_num = self.ctx.iter_num + self.ctx.params.max_preprocess_ahead
+        reusable = self.ctx.get("reusable_preprocess", {})
+        while (
+            len(self.ctx.preprocess_ids) <= last_iter_num
+            and self.ctx.preprocess_date < self.ctx.params.stop_date
+        ):
+            if uuid := reusable.get(f"m{self.ctx.preprocess_date:%Y%m}"):
+                self.report(
+                    "Reusing finished preprocessing for date {current}.".format(
+                        current=self.ctx.preprocess_date.to_datetime_string()
+                    )
+                )
+                self.ctx.preprocess_ids.append(uuid)
+                self.ctx.preprocess_date = next_date(self.ctx.preprocess_date)
+                continue
+            dates = [self.ctx.preprocess_date]
+            while (
+                len(dates) < batch_chunks
+                and next_date(dates[-1]) < self.ctx.params.stop_date
+                and f"m{next_date(dates[-1]):%Y%m}" not in reusable
+            ):
+                dates.append(next_date(dates[-1]))
+            preprocess = self._submit_preprocess(dates[0], next_date(dates[-1]))
+            self.ctx.preprocess_ids.extend([preprocess.uuid] * len(dates))
+            self.ctx.preprocess_date = next_date(dates[-1])
+
+    def _submit_preprocess(
+        self: Self, date: pendulum.DateTime, stop_date: pendulum.DateTime
+    ) -> orm.WorkChainNode:
+        """Submit preprocessing of the chunks from `date` up to `stop_date`."""
+        n_months = len(spice.data.month_dates(date, stop_date))
         self.report(
-            "Starting Preparation run for date {current}.".format(
-                current=self.ctx.current_date.to_datetime_string()
+            "Starting preprocessing for {n_months} month(s) from {current}.".format(
+                n_months=n_months, current=date.to_datetime_string()
             )
         )
-        builder = self.inputs.prep.code.get_builder()
-        builder.metadata.label = (
-            f"prep:{self.ctx.expid}@{self.ctx.current_date.isoformat()}"
-        )
+        builder = Gcm2IconPreprocess.get_builder()
+        builder.metadata.label = f"preprocess:{self.ctx.expid}@{date.isoformat()}"
         builder.metadata.description = " ".join(
             (
-                f"Preparation job for experiment {self.ctx.expid},",
+                f"Preprocessing for experiment {self.ctx.expid},",
                 "launched from Gcm2Icon workflow.",
             )
         )
-        builder.metadata.computer = builder.code.computer
-        options = (
+        builder.experiment_id = self.inputs.experiment_id
+        builder.prep.code = self.inputs.prep.code
+        builder.prep.options = (
             self.inputs.computer_options.get_dict()
             | self.inputs.prep.computer_options.get_dict()
         )
-        for key, value in options.items():
-            builder.metadata.options[key] = value
-        builder.gcm_data = self.inputs.gcm_data
-        builder.parameters = orm.JsonableData(
+        builder.prep.gcm_data = self.inputs.gcm_data
+        builder.prep.parameters = spice.data.ParamsData(
             spice.data.PrepParams(
-                date=self.ctx.current_date,
-                next_date=self.ctx.next_date,
+                date=date,
+                next_date=stop_date,
                 n_parallel_tasks=self.ctx.params.prep_n_parallel_tasks,
                 utils_bindir=self.ctx.params.utils_bindir,
                 cfu_bindir=self.ctx.params.cfu_bindir,
                 hincbound=self.ctx.params.hincbound,
                 gcm_prefix=self.ctx.params.gcm_prefix,
+                stream_extract=self.ctx.params.prep_stream_extract,
             ),
-            label=f"prep:params:{self.ctx.expid}@{self.ctx.current_date.isoformat()}",
-        )
-        self.to_context(preps=engine.append_(self.submit(builder)))
-
-    def conv(self: Self) -> None:
-        self.report(
-            "Starting Conv2Icon run for date {current}.".format(
-                current=self.ctx.current_date.to_datetime_string()
-            )
-        )
-        builder = self.inputs.conv.code.get_builder()
-        builder.metadata.label = (
-            f"conv:{self.ctx.expid}@{self.ctx.current_date.isoformat()}"
+            label=f"prep:params:{self.ctx.expid}@{date.isoformat()}",
         )
-        builder.metadata.description = " ".join(
-            (
-                f"Conversion job for experiment {self.ctx.expid},",
-                "launched from Gcm2Icon workflow.",
-            )
-        )
-        builder.metadata.computer = builder.code.computer
-        options = (
+        builder.conv.code = self.inputs.conv.code
+        builder.conv.options = (
             self.inputs.computer_options.get_dict()
             | self.inputs.conv.computer_options.get_dict()
         )
-        for key, value in options.items():
-            builder.metadata.options[key] = value
-        builder.gcm_prepared = self.ctx.preps[self.ctx.iter_num].outputs.gcm_prepared
-        builder.ini_basedir = self.inputs.ini_basedir
-        builder.boundary_data = self.inputs.boundary_data
-        builder.parameters = orm.JsonableData(
+        builder.conv.ini_basedir = self.inputs.ini_basedir
+        builder.conv.boundary_data = self.inputs.boundary_data
+        builder.conv.parameters = spice.data.ParamsData(
             spice.conv2icon.Conv2IconParams(
                 start_date=self.ctx.params.start_date,
-                date=self.ctx.current_date,
+                date=date,
+                n_months=n_months,
+                chunk_months=self.ctx.params.chunk_months,
                 n_parallel_tasks=self.ctx.params.prep_n_parallel_tasks,
                 gcm_prefix=self.ctx.params.gcm_prefix,
                 omp_threads=self.ctx.params.prep_omp_threads,
                 gcm_remap=self.ctx.params.gcm_remap,
                 icon_input_optional=self.ctx.params.icon_input_optional,
                 cleanup_previous=False,
+                reuse_remap_weights=self.ctx.params.reuse_remap_weights,
+                lbc_conversion=self.ctx.params.lbc_conversion,
             ),
-            label=f"conv:params:{self.ctx.expid}@{self.ctx.current_date.isoformat()}",
+            label=f"conv:params:{self.ctx.expid}@{date.isoformat()}",
+        )
+        if "store" in self.inputs:
+            builder.prep.store = self.inputs.store
+            builder.conv.store = self.inputs.store
+        if "remap_weights" in self.ctx:
+            builder.conv.remap_weights = self.ctx.remap_weights
+        return self.submit(builder)
+
+    @timing.timed_step
+    def wait_for_preprocessing(self: Self) -> None:
+        self.report("Making the next Icon run wait for its preprocessing.")
+        self.to_context(
+            preprocessed=engine.append_(
+                orm.load_node(uuid=self.ctx.preprocess_ids[self.ctx.iter_num])
+            )
         )
-        self.to_context(convs=engine.append_(self.submit(builder)))
 
+    @timing.timed_step
     def wait_for_previous_icon(self: Self) -> None:
         self.report("Making the next step wait for the previous Icon run.")
         if self.ctx.iter_num > 0:
@@ -197,7 +442,14 @@ class Gcm2Icon(engine.WorkChain):
                 icons=engine.append_(orm.load_node(uuid=self.ctx.last_icon_id))
             )
 
-    def icon(self: Self) -> None:
+    @timing.timed_step
+    def icon(self: Self) -> engine.ExitCode | None:
+        preprocessed = self.ctx.preprocessed[self.ctx.iter_num]
+        if not preprocessed.is_finished_ok:
+            self.report(f"Preprocessing {preprocessed.pk} failed, abort.")
+            return self.exit_codes.ERROR_PREPROCESSING_FAILED
+        if "remap_weights" in preprocessed.outputs and "remap_weights" not in self.ctx:
+            self.ctx.remap_weights = preprocessed.outputs.remap_weights
         self.report(
             "Starting Icon run for date {current}.".format(
                 current=self.ctx.current_date.to_datetime_string()
@@ -219,7 +471,9 @@ class Gcm2Icon(engine.WorkChain):
             | self.inputs.icon.computer_options.get_dict()
         )
         builder.expid = self.inputs.experiment_id
-        builder.gcm_converted = self.ctx.convs[self.ctx.iter_num].outputs.converted
+        builder.gcm_converted = preprocessed.outputs.converted_months[
+            f"m{self.ctx.current_date:%Y%m}"
+        ]
         builder.boundary_data = self.inputs.boundary_data
         builder.ini_basedir = self.inputs.ini_basedir
         builder.inidata = self.inputs.inidata
@@ -228,6 +482,7 @@ class Gcm2Icon(engine.WorkChain):
         builder.parent_grid_relpath = self.ctx.params.parent_grid_relpath
         builder.extpar_relpath = self.ctx.params.extpar_relpath
         builder.ghg_file_relpath = self.ctx.params.ghg_file_relpath
+        builder.lightweight_namelists = self.ctx.params.icon_lightweight_namelists
         if self.ctx.iter_num > 0:
             prev_icon = self.ctx.icons[self.ctx.iter_num - 1]
             builder.restart_file_dir = prev_icon.outputs.restart_file_dir
@@ -253,11 +508,15 @@ class Gcm2Icon(engine.WorkChain):
                 dtime=self.ctx.params.dtime,
                 zml_soil=self.ctx.params.zml_soil,
                 ndyn_substeps=self.ctx.params.ndyn_substeps,
+                grid_header_only=self.ctx.params.grid_header_only,
+                chunk_months=self.ctx.params.chunk_months,
             ),
             label=f"icon:params:{self.ctx.expid}@{self.ctx.current_date.isoformat()}",
         )
         self.ctx.last_icon_id = self.submit(builder).uuid
+        return None
 
+    @timing.timed_step
     def finalize(self: Self) -> None:
         self.report(
             "Setting outputs from last Icon run (for date {current}).".format(
@@ -271,5 +530,20 @@ class Gcm2Icon(engine.WorkChain):
         )
 
 
-def next_date(current_date: pendulum.DateTime) -> pendulum.DateTime:
-    return (current_date + pendulum.duration(months=1)).start_of("month")
+def _finished_by_label(
+    process_class: type[engine.Process], prefix: str
+) -> dict[str, orm.ProcessNode]:
+    """Successfully finished processes with labels starting with `prefix`, by label."""
+    query = orm.QueryBuilder()
+    query.append(
+        process_class,
+        tag="process",
+        filters={
+            "label": {"like": f"{prefix}%"},
+            "attributes.process_state": "finished",
+            "attributes.exit_status": 0,
+        },
+    )
+    query.order_by({"process": {"ctime": "asc"}})
+    # later runs take precedence
+    return {node.label: node for node in query.all(flat=True)}
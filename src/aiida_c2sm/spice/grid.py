@@ -0,0 +1,122 @@
+"""
+Metadata of ICON grid files on remote computers.
+
+The metadata is read once per file version and stored as a `Dict` node created
+by a calcfunction, keyed by computer, remote path, file size and modification time.
+"""
+from __future__ import annotations
+
+import pathlib
+import re
+import shlex
+import tempfile
+from typing import Any
+
+import netCDF4 as nc
+from aiida import engine, orm
+from aiida.transports import transport as transports
+
+from aiida_c2sm import exceptions
+
+_GROUP_LABEL = "spice-grid-metadata"
+_GRID_ATTRIBUTES = ("grid_root", "grid_level")
+_HEADER_ATTRIBUTE_PATTERN = re.compile(
+    r"^\s*:(?P<name>\w+)\s*=\s*(?P<value>.*?)\s*;\s*$"
+)
+
+__all__ = ["get_grid_metadata"]
+
+
+def get_grid_metadata(
+    remote: orm.RemoteData, relpath: str, *, header_only: bool = True
+) -> dict[str, Any]:
+    """
+    Get the global grid attributes of a grid file, using the cache if possible.
+
+    Parameters:
+    -----------
+    remote: directory containing the grid file.
+    relpath: path of the grid file relative to `remote`.
+    header_only: read the attributes with `ncdump -h` on the remote computer
+        instead of copying the file. Requires `ncdump` to be available there.
+    """
+    path = str(pathlib.Path(remote.get_remote_path()) / relpath)
+    with remote.get_authinfo().get_transport() as transport:
+        key = _cache_key(transport, remote.computer, path)
+
+    cached = _find_cached(key)
+    if cached is not None:
+        return cached.get_dict()
+
+    node = read_grid_metadata(remote, orm.Str(relpath), orm.Bool(header_only))
+    group, _ = orm.Group.collection.get_or_create(label=_GROUP_LABEL)
+    group.add_nodes([node])
+    return node.get_dict()
+
+
+@engine.calcfunction
+def read_grid_metadata(
+    remote: orm.RemoteData, relpath: orm.Str, header_only: orm.Bool
+) -> orm.Dict:
+    """Read the grid attributes from the remote file and record the cache key."""
+    path = str(pathlib.Path(remote.get_remote_path()) / relpath.value)
+    with remote.get_authinfo().get_transport() as transport:
+        key = _cache_key(transport, remote.computer, path)
+        if header_only.value:
+            attributes = _read_header(transport, path)
+        else:
+            attributes = _read_file(transport, path)
+    return orm.Dict(key | {name: attributes[name] for name in _GRID_ATTRIBUTES})
+
+
+def _cache_key(
+    transport: transports.Transport, computer: orm.Computer, path: str
+) -> dict[str, Any]:
+    stat = transport.get_attribute(path)
+    return {
+        "computer": computer.uuid,
+        "path": path,
+        "size": int(stat.st_size),
+        "mtime": int(stat.st_mtime),
+    }
+
+
+def _find_cached(key: dict[str, Any]) -> orm.Dict | None:
+    query = orm.QueryBuilder()
+    query.append(orm.Group, filters={"label": _GROUP_LABEL}, tag="group")
+    query.append(
+        orm.Dict,
+        with_group="group",
+        filters={f"attributes.{name}": value for name, value in key.items()},
+    )
+    result = query.first()
+    return result[0] if result else None
+
+
+def _read_header(transport: transports.Transport, path: str) -> dict[str, Any]:
+    retval, stdout, stderr = transport.exec_command_wait(
+        f"ncdump -h {shlex.quote(str(path))}"
+    )
+    if retval != 0:
+        raise exceptions.RemoteCommandError(
+            f"Could not read the header of {path} with ncdump: {stderr}"
+        )
+    attributes = {}
+    for line in stdout.splitlines():
+        match = _HEADER_ATTRIBUTE_PATTERN.match(line)
+        if match and match["name"] in _GRID_ATTRIBUTES:
+            attributes[match["name"]] = int(match["value"].rstrip("bsBSLl"))
+    missing = set(_GRID_ATTRIBUTES) - set(attributes)
+    if missing:
+        raise exceptions.RemoteCommandError(
+            f"Grid file {path} does not define the attributes {sorted(missing)}."
+        )
+    return attributes
+
+
+def _read_file(transport: transports.Transport, path: str) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_grid_path = pathlib.Path(temp_dir) / "grid.nc"
+        transport.getfile(path, temp_grid_path)
+        with nc.Dataset(temp_grid_path, mode="r") as grid_data:
+            return {name: int(grid_data.getncattr(name)) for name in _GRID_ATTRIBUTES}
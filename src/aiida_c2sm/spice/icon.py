@@ -1,13 +1,31 @@
 from __future__ import annotations
 
+import datetime
 import pathlib
 import re
+from typing import Any
 
 from aiida import engine, orm
 from aiida.common import datastructures, folders
 from aiida.engine.processes.calcjobs import calcjob
 from aiida.parsers import parser
 
+from aiida_c2sm.spice import namelists, timing
+
+#: ICON timers summarized in the "performance" output, with the names of the
+#: timers they are taken from (the first one found in the report is used)
+PERFORMANCE_TIMERS = {
+    "total": ("total",),
+    "integrate_nh": ("integrate_nh",),
+    "physics": ("physics",),
+    "radiation": ("nwp_radiation", "radiation"),
+    "io_wait": ("wait_for_async_io",),
+    "restart_write": ("write_restart",),
+}
+_TIMER_LINE = re.compile(r"^\s*(?:L\s+)?(?P<name>\S+)\s+(?P<calls>\d+)\s+(?P<rest>.*)$")
+_TOTAL_SECONDS = re.compile(r"(?<![\w\[])\d+\.\d+(?![\w\]])")
+_RESTART_DATE = re.compile(r"_restart_atm_(\d{8}T\d{6})")
+
 
 class Icon(engine.CalcJob):
     """AiiDA calculation to run ICON."""
@@ -46,8 +64,12 @@ class Icon(engine.CalcJob):
             serializer=orm.to_aiida_type,
             help="Name of the restart file (or path relative to `restart_file_dir`).",
         )
-        spec.input("master_namelist", valid_type=orm.SinglefileData)
-        spec.input("model_namelist", valid_type=orm.SinglefileData)
+        spec.input(
+            "master_namelist", valid_type=(orm.SinglefileData, namelists.NamelistData)
+        )
+        spec.input(
+            "model_namelist", valid_type=(orm.SinglefileData, namelists.NamelistData)
+        )
         spec.input(
             "lam_grid_relpath",
             valid_type=orm.Str,
@@ -75,6 +97,12 @@ class Icon(engine.CalcJob):
         spec.input("ecraddir", valid_type=orm.RemoteData)
         spec.output("restart_file_dir")
         spec.output("restart_file_name")
+        spec.output(
+            "performance",
+            valid_type=orm.Dict,
+            required=False,
+            help="Main ICON timers and simulated years per day (SYPD).",
+        )
         options = spec.inputs["metadata"]["options"]
         options["resources"].default = {
             "num_machines": 10,
@@ -184,18 +212,18 @@ class Icon(engine.CalcJob):
                 )
             ]
 
-        calcinfo.local_copy_list = [
-            (
-                self.inputs.master_namelist.uuid,
-                self.inputs.master_namelist.filename,
-                "icon_master.namelist",
-            ),
-            (
-                self.inputs.model_namelist.uuid,
-                self.inputs.model_namelist.filename,
-                f"NAMELIST_{self.inputs.expid.value}",
-            ),
-        ]
+        calcinfo.local_copy_list = []
+        for namelist, filename in [
+            (self.inputs.master_namelist, "icon_master.namelist"),
+            (self.inputs.model_namelist, f"NAMELIST_{self.inputs.expid.value}"),
+        ]:
+            if isinstance(namelist, namelists.NamelistData):
+                with folder.open(filename, "w", encoding="utf8") as handle:
+                    handle.write(namelist.get_content())
+            else:
+                calcinfo.local_copy_list.append(
+                    (namelist.uuid, namelist.filename, filename)
+                )
         return calcinfo
 
 
@@ -203,6 +231,15 @@ class IconParser(parser.Parser):
     """Parser for raw Icon calculations."""
 
     def parse(self, **kwargs):
+        timing.record_calcjob_timings(self.node, self.retrieved)
+        try:
+            timers = parse_timer_report(
+                self.retrieved.get_object_content(
+                    self.node.get_option("scheduler_stdout")
+                )
+            )
+        except (FileNotFoundError, TypeError):
+            timers = {}
         remote_folder = self.node.outputs.remote_folder
 
         files = remote_folder.listdir()
@@ -214,5 +251,94 @@ class IconParser(parser.Parser):
             ):
                 self.out("restart_file_name", orm.Str(file_name))
                 self.out("restart_file_dir", self.node.outputs.remote_folder.clone())
+                if timers:
+                    try:
+                        simulated = self.simulated(file_name)
+                    except ValueError as exception:
+                        self.logger.warning(f"Cannot compute the SYPD: {exception}")
+                        simulated = None
+                    self.out(
+                        "performance", orm.Dict(get_performance(timers, simulated))
+                    )
                 return engine.ExitCode(0)
         return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
+
+    def simulated(self, restart_file_name: str) -> datetime.timedelta:
+        """Model time from the start of the run to the restart it wrote."""
+        if "restart_file_name" in self.node.inputs:
+            start = get_restart_date(self.node.inputs.restart_file_name.value)
+        else:
+            namelist = self.node.inputs.master_namelist.get_content()
+            match = re.search(r'ini_datetime_string\s*=\s*"([^"]+)"', namelist)
+            if match is None:
+                raise ValueError("No ini_datetime_string in the master namelist.")
+            start = (
+                datetime.datetime.fromisoformat(match.group(1))
+                .astimezone(datetime.timezone.utc)
+                .replace(tzinfo=None)
+            )
+        return get_restart_date(restart_file_name) - start
+
+
+def parse_timer_report(log: str) -> dict[str, dict[str, Any]]:
+    """
+    Timers of the last ICON timer report in `log`, by timer name.
+
+    Returns {<timer>: {"calls": <int>, "seconds": <float>}}, with the total time
+    of the slowest process if the report covers several.
+    """
+    lines = log.splitlines()
+    headers = [i for i, line in enumerate(lines) if "# calls" in line]
+    if not headers:
+        return {}
+    timers: dict[str, dict[str, Any]] = {}
+    for line in lines[headers[-1] + 1 :]:
+        if not line.strip():
+            break
+        if not (match := _TIMER_LINE.match(line)):
+            continue
+        totals = [float(value) for value in _TOTAL_SECONDS.findall(match["rest"])]
+        if totals and match["name"] not in timers:
+            timers[match["name"]] = {
+                "calls": int(match["calls"]),
+                "seconds": max(totals),
+            }
+    return timers
+
+
+def get_performance(
+    timers: dict[str, dict[str, Any]], simulated: datetime.timedelta | None
+) -> dict[str, Any]:
+    """
+    Summarize the ICON timers of a run which simulated `simulated` model time.
+
+    Returns
+    {
+        "timers": {<PERFORMANCE_TIMERS key>: {"calls": <int>, "seconds": <float>}},
+        "simulated_days": <float>,
+        "sypd": <simulated 365 day years per wall clock day of the total timer>,
+    }
+    Timers missing from the report are left out, as are "simulated_days" and
+    "sypd" if `simulated` is `None` and "sypd" without a "total" timer.
+    """
+    summary = {}
+    for key, names in PERFORMANCE_TIMERS.items():
+        if found := [timers[name] for name in names if name in timers]:
+            summary[key] = found[0]
+    performance: dict[str, Any] = {"timers": summary}
+    if simulated is None:
+        return performance
+    performance["simulated_days"] = simulated.total_seconds() / 86400
+    if summary.get("total", {}).get("seconds"):
+        performance["sypd"] = (
+            performance["simulated_days"] / 365 / (summary["total"]["seconds"] / 86400)
+        )
+    return performance
+
+
+def get_restart_date(restart_file_name: str) -> datetime.datetime:
+    """Model date (UTC) of a restart file, from its name."""
+    match = _RESTART_DATE.search(restart_file_name)
+    if match is None:
+        raise ValueError(f"No date in restart file name {restart_file_name!r}.")
+    return datetime.datetime.strptime(match.group(1), "%Y%m%dT%H%M%S")
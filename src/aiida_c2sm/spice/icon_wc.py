@@ -2,21 +2,16 @@ from __future__ import annotations
 
 import dataclasses
 import datetime
-import io
 import pathlib
-import tempfile
-import textwrap
 import typing
 
-import jinja2
-import netCDF4 as nc
 import pendulum
-import tabulate
 from aiida import engine, orm
 from aiida.engine.processes.workchains import workchain
 from typing_extensions import Self
 
 from aiida_c2sm import spice
+from aiida_c2sm.spice import calendar, namelists, timing
 
 
 class IconWorkChain(engine.WorkChain):
@@ -41,65 +36,60 @@ class IconWorkChain(engine.WorkChain):
             serializer=orm.to_aiida_type,
             help="Computer options.",
         )
+        spec.input(
+            "lightweight_namelists",
+            valid_type=bool,
+            default=False,
+            non_db=True,
+            help="Store the namelists directly instead of through a calcfunction. "
+            "Saves the database writes of the calcfunction and its input, the "
+            "namelists are still recorded as inputs of the Icon run.",
+        )
         spec.expose_outputs(spice.icon.Icon)
 
         spec.outline(cls.prepare_namelists, cls.launch_icon, cls.finalize)
 
+    @timing.timed_step
     def prepare_namelists(self) -> None:
         params = self.inputs.parameters.obj
-        ystartdate = params.start_date.strftime("%Y%m%d%H")
-        nmlvars: dict[str, typing.Any] = {}
-        next_date_full = (
-            pendulum.instance(params.date).naive() + pendulum.duration(months=1)
-        ).naive()
-        next_date = next_date_full.start_of("month").naive()
-        self.ctx.ifs2icon_filename = f"{params.gcm_prefix}{ystartdate}_ini.nc"
-        if params.start_date == params.date:
-            nmlvars["lrestart"] = ".FALSE."
-            nmlvars["check_uuid_gracefully"] = ".FALSE."
-            nmlvars["ifs2icon_filename"] = self.ctx.ifs2icon_filename
-        else:
-            nmlvars["lrestart"] = ".TRUE."
-            nmlvars["check_uuid_gracefully"] = ".TRUE."
-            nmlvars["ifs2icon_filename"] = ""
-
-        if params.num_restart_procs == 0:
-            nmlvars["restart_write_mode"] = "sync"
-        else:
-            nmlvars["restart_write_mode"] = "dedicated procs multifile"
-
-        self.ctx.master_namelist = str_to_namelist(
-            make_master_namelists(
-                params,
-                lrestart=nmlvars["lrestart"],
-                expid=self.inputs.expid.value,
-                next_date=next_date,
-            )
+        self.ctx.ifs2icon_filename = get_ifs2icon_filename(params)
+        ((master_namelist, model_namelist),) = make_namelists(
+            params,
+            [params.date],
+            expid=self.inputs.expid.value,
+            gcm_converted=self.inputs.gcm_converted,
+            ini_basedir=self.inputs.ini_basedir,
+            lam_grid_path=self.inputs.lam_grid_relpath.value,
+            parent_grid_path=self.inputs.parent_grid_relpath.value,
+            extpar_path=self.inputs.extpar_relpath.value,
+            ghg_file_path=str(
+                pathlib.Path(self.inputs.ini_basedir.get_remote_path())
+                / self.inputs.ghg_file_relpath.value
+            ),
+            ecraddir=self.inputs.ecraddir,
         )
-
-        self.ctx.model_namelist = str_to_namelist(
-            make_model_namelists(
-                params,
-                gcm_converted=self.inputs.gcm_converted,
-                ini_basedir=self.inputs.ini_basedir,
-                lam_grid_path=self.inputs.lam_grid_relpath.value,
-                parent_grid_path=self.inputs.parent_grid_relpath.value,
-                extpar_path=self.inputs.extpar_relpath.value,
-                ghg_file_path=str(
-                    pathlib.Path(self.inputs.ini_basedir.get_remote_path())
-                    / self.inputs.ghg_file_relpath.value
-                ),
-                ecraddir=self.inputs.ecraddir,
-                ifs2icon_filename=nmlvars["ifs2icon_filename"],
-                check_uuid_gracefully=nmlvars["check_uuid_gracefully"],
-                restart_write_mode=nmlvars["restart_write_mode"],
-                next_date=next_date,
+        # the namelists of the months of an experiment are stored as changes
+        # to those of the first month which was run
+        for name, namelist in [
+            ("master_namelist", master_namelist),
+            ("model_namelist", model_namelist),
+        ]:
+            groups = namelists.parse_namelists(namelist)
+            base = namelists.NamelistData.get_base(
+                f"{self.inputs.expid.value}:{name}", groups
             )
-        )
-
+            if self.inputs.lightweight_namelists:
+                self.ctx[name] = namelists.NamelistData(groups, base=base)
+            else:
+                self.ctx[name] = namelists.change_namelist(
+                    base, orm.List(namelists.diff_namelists(base.groups, groups))
+                )
+
+    @timing.timed_step
     def launch_icon(self) -> None:
         icon_builder = self.inputs.code.get_builder()
         icon_builder.metadata.computer = self.inputs.code.computer
+        icon_builder.metadata.label = self.node.label
         for key, value in self.inputs.options.items():
             icon_builder.metadata.options[key] = value
 
@@ -113,64 +103,111 @@ class IconWorkChain(engine.WorkChain):
             ),
         )
 
+    @timing.timed_step
     def finalize(self) -> None:
         self.out_many(self.exposed_outputs(self.ctx.icon, spice.icon.Icon))
 
 
-@engine.calcfunction
-def dict_to_namelist(namelists: orm.Dict) -> orm.SinglefileData:
-    namelists_lines: list[str] = []
-    for namelist, data in namelists.items():
-        namelists_lines.append(f"&{namelist}")
-        namelists_lines += textwrap.indent(
-            tabulate.tabulate(
-                [(key, "=", value) for key, value in data.items()], tablefmt="plain"
-            ),
-            prefix="  ",
-        ).splitlines()
-        namelists_lines.append("/")
-    namelists_str = "\n".join(namelists_lines) + "\n"
+def get_ifs2icon_filename(params: IconParams) -> str:
+    """Initial data of the experiment, as converted by Conv2Icon."""
+    return f"{params.gcm_prefix}{params.start_date:%Y%m%d%H}_ini.nc"
 
-    return orm.SinglefileData(
-        file=io.BytesIO(initial_bytes=namelists_str.encode("utf-8"))
+
+def make_namelists(
+    params: IconParams,
+    dates: typing.Iterable[datetime.datetime],
+    *,
+    expid: str,
+    gcm_converted: orm.RemoteData,
+    ini_basedir: orm.RemoteData,
+    lam_grid_path: str,
+    parent_grid_path: str,
+    extpar_path: str,
+    ghg_file_path: str,
+    ecraddir: orm.RemoteData,
+) -> list[tuple[str, str]]:
+    """
+    Master and model namelists of the runs of an experiment starting at `dates`.
+
+    All namelists are rendered in one go, e.g. to check a whole experiment
+    before it is submitted. The time steps, which may need the grid file, and
+    the calendar of the experiment are computed once for all of them.
+    """
+    dtimes = get_dtimes(params, ini_basedir, lam_grid_path)
+    experiment_calendar = get_calendar(params)
+    master_variables = []
+    model_variables = []
+    for date in dates:
+        run_params = dataclasses.replace(params, date=date)
+        restart = run_params.start_date != run_params.date
+        master_variables.append(
+            master_namelist_variables(
+                run_params,
+                lrestart=".TRUE." if restart else ".FALSE.",
+                expid=expid,
+                experiment_calendar=experiment_calendar,
+            )
+        )
+        model_variables.append(
+            model_namelist_variables(
+                run_params,
+                gcm_converted=gcm_converted,
+                ini_basedir=ini_basedir,
+                lam_grid_path=lam_grid_path,
+                parent_grid_path=parent_grid_path,
+                extpar_path=extpar_path,
+                ghg_file_path=ghg_file_path,
+                ecraddir=ecraddir,
+                ifs2icon_filename="" if restart else get_ifs2icon_filename(params),
+                check_uuid_gracefully=".TRUE." if restart else ".FALSE.",
+                restart_write_mode="sync"
+                if params.num_restart_procs == 0
+                else "dedicated procs multifile",
+                experiment_calendar=experiment_calendar,
+                dtimes=dtimes,
+            )
+        )
+    return list(
+        zip(
+            namelists.render_many(namelists.MASTER_TEMPLATE, master_variables),
+            namelists.render_many(namelists.MODEL_TEMPLATE, model_variables),
+        )
     )
 
 
-@engine.calcfunction
-def str_to_namelist(namelists: orm.Str) -> orm.SinglefileData:
-    return orm.SinglefileData(
-        file=io.BytesIO(initial_bytes=namelists.value.encode("utf-8"))
+def get_calendar(params: IconParams) -> calendar.ExperimentCalendar:
+    """The run chunks of the experiment of `params`."""
+    return calendar.ExperimentCalendar(
+        params.start_date, params.stop_date, params.chunk_months
     )
 
 
-def make_master_namelists(
+def master_namelist_variables(
     params: spice.icon.IconParams,
     *,
     lrestart: str,
     expid: str,
-    next_date: pendulum.DateTime,
-) -> str:
-    env = jinja2.Environment(
-        loader=jinja2.PackageLoader("aiida_c2sm.spice", "templates")
-    )
-    template = env.get_template("icon_master.namelist")
-
+    experiment_calendar: calendar.ExperimentCalendar | None = None,
+) -> dict[str, typing.Any]:
     def to_utc(dt: datetime.datetime) -> pendulum.DateTime:
         utc = pendulum.timezone("Utc")
         return pendulum.instance(dt).astimezone(utc)
 
-    dt_restart = (
-        pendulum.period(to_utc(params.date), to_utc(next_date)).in_hours() + 1
-    ) * 3600.0
-
-    return template.render(
-        lrestart=lrestart,
-        ini_datetime_string=to_utc(params.start_date).to_iso8601_string(),
-        dt_restart=f"{dt_restart:.1f}",
-        expid=expid,
-        experiment_start_date=to_utc(params.start_date).to_iso8601_string(),
-        experiment_stop_date=to_utc(params.stop_date).to_iso8601_string(),
-    )
+    if experiment_calendar is None:
+        experiment_calendar = get_calendar(params)
+    offsets = experiment_calendar.offsets
+    chunk = experiment_calendar.index(params.date)
+    # one hour beyond the next restart, which ends the run
+    dt_restart = float(offsets[chunk + 1] - offsets[chunk] + 3600)
+
+    return {
+        "lrestart": lrestart,
+        "ini_datetime_string": to_utc(params.start_date).to_iso8601_string(),
+        "dt_restart": f"{dt_restart:.1f}",
+        "expid": expid,
+        "experiment_start_date": to_utc(params.start_date).to_iso8601_string(),
+        "experiment_stop_date": to_utc(params.stop_date).to_iso8601_string(),
+    }
 
     #  return {
     #      "master_nml": {
@@ -203,7 +240,7 @@ def make_master_namelists(
     #  }
 
 
-def make_model_namelists(
+def model_namelist_variables(
     params: spice.icon.IconParams,
     *,
     gcm_converted: orm.RemoteData,
@@ -216,14 +253,16 @@ def make_model_namelists(
     ifs2icon_filename: str,
     check_uuid_gracefully: str,
     restart_write_mode: str,
-    next_date: pendulum.DateTime,
-) -> str:
-    env = jinja2.Environment(
-        loader=jinja2.PackageLoader("aiida_c2sm.spice", "templates")
-    )
-    template = env.get_template("model_namelists.nml")
-
-    return template.render(
+    experiment_calendar: calendar.ExperimentCalendar | None = None,
+    dtimes: dict[str, int] | None = None,
+) -> dict[str, typing.Any]:
+    """Variables of the model namelist template, `dtimes` from `get_dtimes`."""
+    if dtimes is None:
+        dtimes = get_dtimes(params, ini_basedir, lam_grid_path)
+    if experiment_calendar is None:
+        experiment_calendar = get_calendar(params)
+    chunk = experiment_calendar.index(params.date)
+    return dict(
         gcm_converted_path=gcm_converted.get_remote_path(),
         num_io_procs=params.num_io_procs,
         num_restart_procs=params.num_restart_procs,
@@ -241,16 +280,11 @@ def make_model_namelists(
         gust_interval=params.gust_interval.in_seconds(),
         melt_interval=to_iso_8601_period(params.melt_interval),
         restart_write_mode=restart_write_mode,
-        sstart=pendulum.period(params.start_date, params.date).in_hours() * 3600,
-        snext=pendulum.period(
-            pendulum.instance(params.start_date).naive(), next_date
-        ).in_hours()
-        * 3600,
+        sstart=int(experiment_calendar.offsets[chunk]),
+        snext=int(experiment_calendar.offsets[chunk + 1]),
         sout_inc=[inc.in_seconds() for inc in params.hout_inc],
         check_uuid_gracefully=check_uuid_gracefully,
-        **get_dtimes(params, ini_basedir, lam_grid_path),
-        year=params.date.year,
-        month=f"{params.date.month:02}",
+        **dtimes,
         zml_soil=params.zml_soil,
         ecrad_data_path=pathlib.Path(ecraddir.get_remote_path()).name,
         ghg_filename=ghg_file_path,
@@ -295,13 +329,11 @@ def get_dtimes(
     if params.dtime is not None:
         dtime = params.dtime
     else:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_grid_path = pathlib.Path(temp_dir) / "grid.nc"
-            ini_basedir.getfile(lam_grid_path, temp_grid_path)
-            lam_grid_data = nc.Dataset(temp_grid_path, mode="r")
-
-        grid_root = lam_grid_data.grid_root
-        grid_level = lam_grid_data.grid_level
+        lam_grid_data = spice.grid.get_grid_metadata(
+            ini_basedir, lam_grid_path, header_only=params.grid_header_only
+        )
+        grid_root = lam_grid_data["grid_root"]
+        grid_level = lam_grid_data["grid_level"]
         dtime = int(params.ndyn_substeps * 9090.0 / (grid_root * 2.0**grid_level))
 
         # DTIME modified such that it fits into `base_output_interval`.
@@ -344,6 +376,10 @@ class IconParams:
     #! number of short time steps per basic timestep dtime.
     #! Default: 5. Should not exceed the default
     ndyn_substeps: int = 5
+    #! read grid attributes with `ncdump -h` instead of copying the grid file.
+    grid_header_only: bool = True
+    #! number of months simulated by one run, see `calendar.ExperimentCalendar`
+    chunk_months: int = 1
 
     def as_dict(self) -> dict[str, str | int | bool]:
         data = dataclasses.asdict(self)
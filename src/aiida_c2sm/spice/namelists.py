@@ -0,0 +1,268 @@
+"""
+Rendering of the ICON namelist templates.
+
+The jinja environment is created once per process and keeps every template it
+compiled, so the model namelist template is parsed once per daemon worker
+rather than once per workchain step. The compiled bytecode is also cached on
+disk (see `jinja2.FileSystemBytecodeCache`), which spares new workers the
+parsing as well.
+
+`NamelistData` keeps a rendered namelist as its groups of variables. The
+namelists of the months of an experiment differ in a few values only, so they
+are stored as changes to a shared base namelist and only written out as a file
+when the calculation using them is submitted.
+"""
+from __future__ import annotations
+
+import functools
+import re
+from typing import Any, Iterable, Mapping, Optional
+
+import jinja2
+from aiida import engine, orm
+
+MASTER_TEMPLATE = "icon_master.namelist"
+MODEL_TEMPLATE = "model_namelists.nml"
+
+#: namelist groups in file order, as (<group name>, {<variable>: <value>})
+Groups = list[tuple[str, dict[str, str]]]
+#: changes of a namelist to another, as (<group key>, {<variable>: <value>})
+#: with `None` for removed variables, or (<group key>, None) for removed groups
+Changes = list[tuple[str, Optional[dict[str, Optional[str]]]]]
+
+_STRING = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+_HELD = re.compile(r"\x00(\d+)\x00")
+_GROUP = re.compile(r"&(\w+)(.*?)(?:/|&end\b)", re.DOTALL | re.IGNORECASE)
+_ASSIGNMENT = re.compile(r"([A-Za-z_]\w*(?:\([^)=]*\))?(?:%\w+(?:\([^)=]*\))?)*)\s*=")
+_KEY = re.compile(r"^(?P<name>\w+)(?:\[(?P<index>\d+)\])?$")
+
+__all__ = [
+    "get_environment",
+    "render",
+    "render_many",
+    "NamelistData",
+    "parse_namelists",
+    "format_namelists",
+    "diff_namelists",
+    "apply_changes",
+]
+
+
+@functools.cache
+def get_environment() -> jinja2.Environment:
+    """The environment of the namelist templates of this package."""
+    return jinja2.Environment(
+        loader=jinja2.PackageLoader("aiida_c2sm.spice", "templates"),
+        bytecode_cache=jinja2.FileSystemBytecodeCache(),
+        # the templates are package data, they do not change while running
+        auto_reload=False,
+        cache_size=-1,
+    )
+
+
+def render(template_name: str, variables: Mapping[str, Any]) -> str:
+    """Render one namelist template."""
+    return get_environment().get_template(template_name).render(variables)
+
+
+def render_many(
+    template_name: str, variables: Iterable[Mapping[str, Any]]
+) -> list[str]:
+    """Render a namelist template once for each set of `variables`."""
+    template = get_environment().get_template(template_name)
+    return [template.render(item) for item in variables]
+
+
+def parse_namelists(text: str) -> Groups:
+    """
+    Parse the groups of a Fortran namelist file.
+
+    Comments, strings containing `!`, `/` or `=` and values continued over
+    several lines are handled. Values are kept as Fortran source, with the
+    whitespace outside of strings collapsed and a trailing comma removed. Group
+    and variable names are case insensitive in Fortran and returned lower case.
+    """
+    strings: list[str] = []
+
+    def hold(match: re.Match) -> str:
+        strings.append(match.group())
+        return f"\x00{len(strings) - 1}\x00"
+
+    def restore(value: str) -> str:
+        return _HELD.sub(lambda match: strings[int(match.group(1))], value)
+
+    code = "\n".join(
+        _STRING.sub(hold, line).split("!", 1)[0] for line in text.splitlines()
+    )
+    groups: Groups = []
+    for group in _GROUP.finditer(code):
+        body = group.group(2)
+        assignments = list(_ASSIGNMENT.finditer(body))
+        variables = {}
+        for assignment, following in zip(assignments, assignments[1:] + [None]):
+            value = body[assignment.end() : following.start() if following else None]
+            variables[assignment.group(1).lower()] = restore(
+                " ".join(value.split()).rstrip(",").rstrip()
+            )
+        groups.append((group.group(1).lower(), variables))
+    return groups
+
+
+def format_namelists(groups: Groups) -> str:
+    """Write namelist groups in Fortran namelist syntax."""
+    lines = []
+    for name, variables in groups:
+        lines.append(f"&{name}")
+        lines += [f"  {variable} = {value}" for variable, value in variables.items()]
+        lines.append("/")
+    return "\n".join(lines) + "\n"
+
+
+def group_keys(groups: Groups) -> list[str]:
+    """
+    Keys of namelist groups: the name, followed by `[<n>]` for repeated groups.
+
+    The first group of a name is keyed by the name only, the next ones (e.g.
+    the 2nd `output_nml`) by `output_nml[1]` and so on.
+    """
+    counts: dict[str, int] = {}
+    keys = []
+    for name, _ in groups:
+        index = counts[name] = counts.get(name, -1) + 1
+        keys.append(f"{name}[{index}]" if index else name)
+    return keys
+
+
+def diff_namelists(base: Groups, other: Groups) -> Changes:
+    """Changes turning the `base` namelist into `other`, see `apply_changes`."""
+    base_groups = dict(zip(group_keys(base), (variables for _, variables in base)))
+    other_groups = dict(zip(group_keys(other), (variables for _, variables in other)))
+    changes: Changes = [(key, None) for key in base_groups if key not in other_groups]
+    for key, variables in other_groups.items():
+        base_variables = base_groups.get(key, {})
+        changed: dict[str, Optional[str]] = {
+            variable: None for variable in base_variables if variable not in variables
+        }
+        changed |= {
+            variable: value
+            for variable, value in variables.items()
+            if base_variables.get(variable) != value
+        }
+        if changed or key not in base_groups:
+            changes.append((key, changed))
+    return changes
+
+
+def apply_changes(base: Groups, changes: Changes) -> Groups:
+    """
+    Namelist groups from `diff_namelists(base, other)` and `base`.
+
+    The groups and variables keep the order of `base`, the groups and
+    variables added by `changes` follow. As the order of neither matters in
+    Fortran, the result reads the same as `other`.
+    """
+    changed = dict(changes)
+    groups: Groups = []
+    for key, (name, variables) in zip(group_keys(base), base):
+        if key in changed and changed[key] is None:
+            continue
+        variables = variables | (changed.pop(key, None) or {})
+        groups.append(
+            (
+                name,
+                {var: value for var, value in variables.items() if value is not None},
+            )
+        )
+    for key, variables in changed.items():
+        if variables is not None:
+            groups.append((_KEY.match(key).group("name"), dict(variables)))
+    return groups
+
+
+class NamelistData(orm.Data):
+    """
+    Fortran namelist file, stored as groups of variables.
+
+    With a `base`, only the changes to the base namelist are stored. The file
+    content is created by `get_content`, e.g. when a calculation is submitted.
+    """
+
+    def __init__(
+        self,
+        groups: Groups | None = None,
+        *,
+        base: NamelistData | None = None,
+        changes: Changes | None = None,
+        **kwargs: Any,
+    ) -> None:
+        """
+        Namelist of `groups`, or of the `changes` to `base`.
+
+        With both `groups` and `base`, the changes of `groups` to `base` are
+        stored.
+        """
+        super().__init__(**kwargs)
+        if base is None:
+            self.base.attributes.set("groups", [list(group) for group in groups])
+            return
+        if not base.is_stored or base.base_namelist is not None:
+            raise ValueError("The base namelist must be stored and have no base.")
+        if changes is None:
+            changes = diff_namelists(base.groups, groups)
+        self.base.attributes.set("base", base.uuid)
+        self.base.attributes.set("changes", [list(change) for change in changes])
+
+    @classmethod
+    def from_text(cls, text: str, *, base: NamelistData | None = None) -> NamelistData:
+        return cls(parse_namelists(text), base=base)
+
+    @classmethod
+    def get_base(cls, label: str, groups: Groups) -> NamelistData:
+        """
+        The first stored namelist without base labelled `label`.
+
+        If there is none yet, a namelist of `groups` is stored as such. Any
+        namelist works as base, the closer to those stored as changes of it the
+        better, e.g. the first namelist of an experiment for its other months.
+        """
+        query = orm.QueryBuilder()
+        query.append(
+            cls,
+            filters={"label": label, "attributes": {"has_key": "groups"}},
+            project="*",
+        )
+        query.order_by({cls: {"ctime": "asc"}})
+        existing = query.first(flat=True)
+        return existing if existing is not None else cls(groups, label=label).store()
+
+    @property
+    def base_namelist(self) -> NamelistData | None:
+        """The namelist this one is stored as changes of, if any."""
+        uuid = self.base.attributes.get("base", None)
+        return None if uuid is None else orm.load_node(uuid)
+
+    @property
+    def changes(self) -> Changes:
+        """Changes to the base namelist (empty without a base)."""
+        return [tuple(change) for change in self.base.attributes.get("changes", [])]
+
+    @property
+    def groups(self) -> Groups:
+        """The namelist groups, with the changes to the base namelist applied."""
+        base = self.base_namelist
+        if base is None:
+            return [
+                (name, dict(variables))
+                for name, variables in self.base.attributes.get("groups")
+            ]
+        return apply_changes(base.groups, self.changes)
+
+    def get_content(self) -> str:
+        """The namelist file."""
+        return format_namelists(self.groups)
+
+
+@engine.calcfunction
+def change_namelist(base: NamelistData, changes: orm.List) -> NamelistData:
+    """A namelist stored as `changes` (see `diff_namelists`) to `base`."""
+    return NamelistData(base=base, changes=changes.get_list())
@@ -34,6 +34,18 @@ def pathfield(**kwargs):
     return dataclasses.field(metadata={"to_json": str, "from_json": pathlib.Path})
 
 
+#: post-processing variants of the lateral boundary files, see conv2icon_lbc.sh
+LBC_CONVERSIONS = ("fused", "sequential")
+
+
+def check_lbc_conversion(lbc_conversion: str) -> None:
+    if lbc_conversion not in LBC_CONVERSIONS:
+        raise ValueError(
+            f"Unknown lbc_conversion {lbc_conversion!r}, "
+            f"expected one of {LBC_CONVERSIONS}."
+        )
+
+
 @dataclasses.dataclass(kw_only=True)
 class SpiceParams:
     start_date: pendulum.DateTime = datetimefield()
@@ -47,6 +59,10 @@ class SpiceParams:
     hincbound: int = 6
     gcm_prefix: str = "caf"
     gcm_remap: str = "remaplaf"
+    #! generate the remapping weights once and reuse them for all later months.
+    reuse_remap_weights: bool = True
+    #! "fused" or "sequential" post-processing of lateral boundary files.
+    lbc_conversion: str = "fused"
     precip_interval: pendulum.duration = durationfield(
         default=pendulum.duration(hours=1)
     )
@@ -78,12 +94,33 @@ class SpiceParams:
     #! number of short time steps per basic timestep dtime.
     #! Default: 5. Should not exceed the default
     ndyn_substeps: int = 5
+    #! read grid attributes with `ncdump -h` instead of copying the grid file.
+    grid_header_only: bool = True
     prep_n_parallel_tasks: int = 12
     prep_omp_threads: int = 1
+    #! feed tar members straight into decompression and conversion, which
+    #! overlaps extraction with conversion and halves the peak scratch usage.
+    prep_stream_extract: bool = True
+    #! number of months simulated by one ICON job (e.g. 12 for yearly restarts),
+    #! fewer jobs wait in the queue and write restarts. Must fit the walltime.
+    chunk_months: int = 1
+    #! number of chunks to prepare and convert ahead of the running ICON chunk.
+    #! 0 submits preprocessing for a chunk only once ICON is about to need it.
+    max_preprocess_ahead: int = 1
+    #! number of months prepared and converted by a single prep and conv job,
+    #! to pay the scheduler queue wait once per batch instead of once per month.
+    #! A batch holds at least one chunk and only whole chunks.
+    preprocess_batch_months: int = 1
     icon_input_optional: str = ""
     icon_num_io_procs: int = 1
     icon_num_restart_procs: int = 1
     icon_num_prefetch_proc: int = 1
+    #! store the ICON namelists without the provenance of a calcfunction,
+    #! which saves database writes for every month.
+    icon_lightweight_namelists: bool = False
+
+    def __post_init__(self) -> None:
+        check_lbc_conversion(self.lbc_conversion)
 
     def as_dict(self) -> dict[str, str | int | bool]:
         data = dataclasses.asdict(self)
@@ -1,13 +1,57 @@
+from __future__ import annotations
+
 import pathlib
+import shlex
+from typing import Any, Mapping
 
+import pendulum
 from aiida import engine, orm
-from aiida.common import datastructures, folders
+from aiida.common import datastructures, folders, hashing, links
 from aiida.engine.processes.calcjobs import calcjob
 from aiida.parsers import parser
 
+from aiida_c2sm.spice import timing
+
+
+def get_script_path(name: str) -> pathlib.Path:
+    return pathlib.Path(__file__).parent / "scripts" / name
+
+
+def get_store_path(
+    inputs: Mapping[str, Any], kind: str, key: Mapping[str, Any]
+) -> pathlib.Path | None:
+    """
+    Directory of the shared store keeping the months of `kind` for `key`.
+
+    `key` holds only what determines the content of a month (e.g. the GCM data
+    and prefix), not the dates or batch sizes of the job. The directory has one
+    entry per month, named `<YYYYMM>` (see `scripts/store.sh`), so experiments
+    with different start dates or batches share the months they have in
+    common. Returns `None` if there is no `store` input.
+    """
+    if "store" not in inputs:
+        return None
+    return (
+        pathlib.Path(inputs["store"].get_remote_path())
+        / kind
+        / hashing.make_hash(dict(key))
+    )
 
-def get_script_path() -> pathlib.Path:
-    return pathlib.Path(__file__).parent / "scripts" / "prep"
+
+def get_store_key(inputs: Mapping[str, Any]) -> dict[str, Any]:
+    """What determines the content of a prepared month, see `get_store_path`."""
+    return {
+        "gcm_data": inputs["gcm_data"].base.caching.compute_hash(),
+        "gcm_prefix": inputs["parameters"].obj.gcm_prefix,
+    }
+
+
+def get_node_inputs(node: orm.CalcJobNode) -> dict[str, orm.Node]:
+    """Inputs of a finished calculation, by link label."""
+    return {
+        link.link_label: link.node
+        for link in node.base.links.get_incoming(link_type=links.LinkType.INPUT_CALC)
+    }
 
 
 class GCM2IconPrep(engine.CalcJob):
@@ -20,7 +64,30 @@ class GCM2IconPrep(engine.CalcJob):
             "gcm_data", valid_type=orm.RemoteData, help="Base directory for GCM data."
         )
         spec.input("parameters", valid_type=orm.JsonableData, help="Input parameters.")
-        spec.output("gcm_prepared")
+        spec.input(
+            "store",
+            valid_type=orm.RemoteData,
+            required=False,
+            help="Shared directory keeping prepared months, see `get_store_path`.",
+        )
+        spec.output("gcm_prepared", help="Prepared data, one subdirectory per month.")
+        spec.output(
+            "timings",
+            valid_type=orm.Dict,
+            required=False,
+            help=(
+                "Wall time of the script stages and work queue tasks. With "
+                "`stream_extract`, untar, nccopy and ccaf2icaf overlap and are "
+                "timed as the single stage `untar_nccopy_ccaf2icaf`, their "
+                "decompress and convert_to_icaf tasks separately."
+            ),
+        )
+        spec.output_namespace(
+            "gcm_prepared_months",
+            valid_type=orm.RemoteData,
+            dynamic=True,
+            help="Prepared data of each month, keyed by `m<YYYYMM>`.",
+        )
         spec.exit_code(
             300,
             "ERROR_MISSING_OUTPUT_FILES",
@@ -35,16 +102,19 @@ class GCM2IconPrep(engine.CalcJob):
 
     def prepare_for_submission(self, folder: folders.Folder) -> datastructures.CalcInfo:
         params = self.inputs.parameters.obj
+        store_path = get_store_path(self.inputs, "prep", get_store_key(self.inputs))
         variables = {
-            "yyyy": params.date.strftime("%Y"),
-            "mm": params.date.strftime("%m"),
-            "current_date": params.date.strftime("%Y%m%d%H"),
+            "month_dates": '"{}"'.format(
+                " ".join(date.strftime("%Y%m%d%H") for date in params.month_dates())
+            ),
             "next_date": params.next_date.strftime("%Y%m%d%H"),
             "max_pp": params.n_parallel_tasks,
             "utils_bindir": params.utils_bindir,
             "cfu_bindir": params.cfu_bindir,
             "hincbound": params.hincbound,
             "gcm_prefix": params.gcm_prefix,
+            "stream_extract": 1 if params.stream_extract else 0,
+            "store_dir": store_path or "",
         }
 
         with folder.open("inputs.sh", "w", encoding="utf8") as handle:
@@ -53,12 +123,15 @@ class GCM2IconPrep(engine.CalcJob):
                     [f"{key.upper()}={value}" for key, value in variables.items()]
                 )
             )
+        for script in ["workqueue.sh", "store.sh"]:
+            folder.insert_path(str(get_script_path(script)), script)
 
         codeinfo = datastructures.CodeInfo()
         codeinfo.code_uuid = self.inputs.code.uuid
 
         calcinfo = datastructures.CalcInfo()
         calcinfo.codes_info = [codeinfo]
+        calcinfo.retrieve_list = ["task_timings.txt", "stage_timings.txt"]
         calcinfo.remote_symlink_list = [
             (
                 self.inputs.gcm_data.computer.uuid,
@@ -73,13 +146,52 @@ class PrepParser(parser.Parser):
     """Parser for prep calculations."""
 
     def parse(self, **kwargs):
-        """Add the remote outfiles subdirectory to outputs."""
+        """Add the outfiles directory and its months (linked to the store) to outputs."""
+        timing.record_calcjob_timings(self.node, self.retrieved)
+        if script_timings := timing.parse_script_timings(self.retrieved):
+            self.out("timings", orm.Dict(script_timings))
         remote_path = self.node.outputs.remote_folder.get_remote_path()
         outfiles = orm.RemoteData(
             computer=self.node.outputs.remote_folder.computer,
             remote_path=str(pathlib.Path(remote_path) / "outfiles"),
         )
-        if outfiles.is_empty:
+        months = get_month_outputs(
+            outfiles, self.node.inputs.parameters.obj.month_dates()
+        )
+        if not months.keys() <= get_filled_months(outfiles):
             return self.exit_codes.ERROR_MISSING_OUTPUT_FILES
         self.out("gcm_prepared", outfiles)
+        self.out("gcm_prepared_months", months)
         return engine.ExitCode(0)
+
+
+def get_filled_months(outfiles: orm.RemoteData) -> set[str]:
+    """
+    Keys `m<YYYYMM>` of the non-empty subdirectories of `outfiles`.
+
+    Lists all subdirectories (following the links into the store) with a
+    single remote command, instead of one transport call per month.
+    """
+    path = shlex.quote(outfiles.get_remote_path())
+    with outfiles.get_authinfo().get_transport() as transport:
+        retval, stdout, _ = transport.exec_command_wait(
+            f"find -L {path} -mindepth 2 -maxdepth 2 -not -name '.*'"
+        )
+    if retval != 0:
+        return set()
+    return {
+        f"m{pathlib.PurePosixPath(line).parent.name}" for line in stdout.splitlines()
+    }
+
+
+def get_month_outputs(
+    outfiles: orm.RemoteData, dates: list[pendulum.DateTime]
+) -> dict[str, orm.RemoteData]:
+    """Per month subdirectories of `outfiles`, keyed by `m<YYYYMM>`."""
+    return {
+        f"m{date:%Y%m}": orm.RemoteData(
+            computer=outfiles.computer,
+            remote_path=str(pathlib.Path(outfiles.get_remote_path()) / f"{date:%Y%m}"),
+        )
+        for date in dates
+    }
@@ -5,150 +5,217 @@ export PMI_MMAP_SYNC_WAIT_TIME=300
 
 set -e
 
+set -a
 source ./inputs.sh  # get variables
-
-WORKDIR=$PWD
-
-mkdir $WORKDIR/outfiles
-
-DATAFILELIST=$(find $WORKDIR/gcm_prepared/${GCM_PREFIX}??????????.nc)
-
-if [ ${CURRENT_DATE} -eq ${YDATE_START}  ]
-then
-
-  cdo -s selname,LSM $WORKDIR/gcm_prepared/${GCM_PREFIX}${YDATE_START}.nc $WORKDIR/boundary_data/input_FR_LAND.nc
-  ncrename -h -v LSM,FR_LAND $WORKDIR/boundary_data/input_FR_LAND.nc
-  cdo -s selname,FR_LAND ${EXTPAR} $WORKDIR/boundary_data/output_FR_LAND.nc
-  ncecat -O -u time $WORKDIR/boundary_data/output_FR_LAND.nc $WORKDIR/boundary_data/output_FR_LAND.nc # add time dimension otherwise ICON stops
-  ncks -h -A -v time $WORKDIR/boundary_data/input_FR_LAND.nc $WORKDIR/boundary_data/output_FR_LAND.nc # give time a value to avoid CDO warnings
-  cdo -L -s setctomiss,0. -ltc,0.5  $WORKDIR/boundary_data/input_FR_LAND.nc $WORKDIR/boundary_data/input_ocean_area.nc
-  cdo -L -s  setctomiss,0. -gec,0.5 $WORKDIR/boundary_data/input_FR_LAND.nc $WORKDIR/boundary_data/input_land_area.nc
-  cdo -L -s setctomiss,0. -ltc,1. $WORKDIR/boundary_data/output_FR_LAND.nc $WORKDIR/boundary_data/output_ocean_area.nc
-  cdo -L -s  setctomiss,0. -gtc,0. $WORKDIR/boundary_data/output_FR_LAND.nc $WORKDIR/boundary_data/output_land_area.nc
-  cdo -s setrtoc2,0.5,1.0,1,0 $WORKDIR/boundary_data/output_FR_LAND.nc $WORKDIR/outfiles/output_lsm.nc
-  rm $WORKDIR/boundary_data/input_FR_LAND.nc $WORKDIR/boundary_data/output_FR_LAND.nc
-
-
-  # create file with ICON grid information for CDO
-  cdo -s selgrid,2 ${LAM_GRID} $WORKDIR/boundary_data/triangular-grid.nc
-
-  # remap land area only variables (ocean points are assumed to be undefined in the input data)
-  cdo -s setmisstodis -selname,SMIL1,SMIL2,SMIL3,SMIL4,STL1,STL2,STL3,STL4,W_SNOW,T_SNOW $WORKDIR/gcm_prepared/${GCM_PREFIX}${YDATE_START}.nc  \
-                                       $WORKDIR/outfiles/tmpl1.nc
-  cdo -s -P ${OMP_THREADS_CONV2ICON} ${GCM_REMAP},$WORKDIR/boundary_data/triangular-grid.nc $WORKDIR/outfiles/tmpl1.nc $WORKDIR/outfiles/tmpl2.nc
-  cdo -s div $WORKDIR/outfiles/tmpl2.nc $WORKDIR/boundary_data/output_land_area.nc $WORKDIR/outfiles/tmp_output_l.nc
-  rm $WORKDIR/outfiles/tmpl?.nc
-
-  # remap land and ocean area differently for variables
-  # ocean part
-  cdo -s selname,SKT $WORKDIR/gcm_prepared/${GCM_PREFIX}${YDATE_START}.nc $WORKDIR/outfiles/tmp_input_ls.nc
-  cdo -s div $WORKDIR/outfiles/tmp_input_ls.nc $WORKDIR/boundary_data/input_ocean_area.nc  $WORKDIR/outfiles/tmpls1.nc
-  cdo -s setmisstodis $WORKDIR/outfiles/tmpls1.nc $WORKDIR/outfiles/tmpls2.nc
-  cdo -s -P ${OMP_THREADS_CONV2ICON} ${GCM_REMAP},$WORKDIR/boundary_data/triangular-grid.nc $WORKDIR/outfiles/tmpls2.nc $WORKDIR/outfiles/tmpls3.nc
-  cdo -s div $WORKDIR/outfiles/tmpls3.nc $WORKDIR/boundary_data/output_ocean_area.nc $WORKDIR/outfiles/tmp_ocean_part.nc
-  rm $WORKDIR/outfiles/tmpls?.nc
-  # land part
-  cdo -s div $WORKDIR/outfiles/tmp_input_ls.nc $WORKDIR/boundary_data/input_land_area.nc  $WORKDIR/outfiles/tmpls1.nc
-  cdo -s setmisstodis $WORKDIR/outfiles/tmpls1.nc $WORKDIR/outfiles/tmpls2.nc
-  cdo -s -P ${OMP_THREADS_CONV2ICON} ${GCM_REMAP},$WORKDIR/boundary_data/triangular-grid.nc $WORKDIR/outfiles/tmpls2.nc $WORKDIR/outfiles/tmpls3.nc
-  cdo -s div $WORKDIR/outfiles/tmpls3.nc $WORKDIR/boundary_data/output_land_area.nc $WORKDIR/outfiles/tmp_land_part.nc
-  rm $WORKDIR/outfiles/tmpls?.nc
-  # merge remapped land and ocean part
-  cdo -s ifthenelse $WORKDIR/outfiles/output_lsm.nc $WORKDIR/outfiles/tmp_land_part.nc  $WORKDIR/outfiles/tmp_ocean_part.nc $WORKDIR/outfiles/tmp_output_ls.nc
-  rm $WORKDIR/outfiles/tmp_land_part.nc $WORKDIR/outfiles/tmp_ocean_part.nc
-
-  # remap the rest
-  ncks -h -O -x -v W_SNOW,T_SNOW,STL1,STL2,STL3,STL4,SMIL1,SMIL2,SMIL3,SMIL4,SKT,LSM $WORKDIR/gcm_prepared/${GCM_PREFIX}${YDATE_START}.nc $WORKDIR/outfiles/tmp_input_rest.nc
-  cdo -s -P ${OMP_THREADS_CONV2ICON} ${GCM_REMAP},$WORKDIR/boundary_data/triangular-grid.nc $WORKDIR/outfiles/tmp_input_rest.nc $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
-
-   # merge remapped files plus land sea mask from EXTPAR
-  ncks -h -A $WORKDIR/outfiles/tmp_output_l.nc $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
-  ncks -h -A $WORKDIR/outfiles/tmp_output_ls.nc $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
-  ncks -h -A $WORKDIR/outfiles/output_lsm.nc  $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
-  rm -f $WORKDIR/outfiles/tmp_output_l.nc $WORKDIR/outfiles/tmp_output_ls.nc $WORKDIR/outfiles/tmp_input_ls.nc $WORKDIR/outfiles/tmp_input_rest.nc
-
-  # attribute modifications
-  ncatted -h -a coordinates,FR_LAND,o,c,"clon clat" $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
-
-  # renamings
-  ncrename -h -v FR_LAND,LSM $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
-  ncrename -h -v SIC,CI $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
-  ncrename -h -d level,lev $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
-  ncrename -h -d cell,ncells $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
-  ncrename -h -d nv,vertices $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
-
-  #   The vertical coordinate coefficients has not been transfered by CDO. They have to be added here again.
-  pushd $WORKDIR/boundary_data
-  ncks -h -O -C -v ak,bk $WORKDIR/gcm_prepared/${GCM_PREFIX}${YYYY}${MM}0100.nc hyai_hybi.nc
-  ncatted -h -a ,global,d,,  hyai_hybi.nc
-  ncrename -d level1,nhyi hyai_hybi.nc
-  ncrename -v ak,hyai hyai_hybi.nc
-  ncrename -v bk,hybi hyai_hybi.nc
-
-  ncks -h -A $WORKDIR/boundary_data/hyai_hybi.nc ${GCM_PREFIX}${YDATE_START}_ini.nc
-
-fi # end remapping initial data
-
-# ----------------------------------------------------------------------------
-# PART II: Extract lower boundary data
-# ----------------------------------------------------------------------------
-rm -f $WORKDIR/outfiles/${GCM_PREFIX}${YYYY}${MM}_tmp.nc
-
-ncrcat -h -v SIC,SST $WORKDIR/gcm_prepared/${GCM_PREFIX}??????????.nc  \
-                 $WORKDIR/outfiles/${GCM_PREFIX}${YYYY}${MM}_tmp.nc
-
-cdo -s setmisstodis -selname,SIC $WORKDIR/outfiles/${GCM_PREFIX}${YYYY}${MM}_tmp.nc \
-                                $WORKDIR/outfiles/SIC_${YYYY}${MM}_tmp.nc
-
-cdo -s setmisstodis -selname,SST $WORKDIR/outfiles/${GCM_PREFIX}${YYYY}${MM}_tmp.nc  \
-                                 $WORKDIR/outfiles/SST_${YYYY}${MM}_tmp.nc
-
-cdo -s merge $WORKDIR/outfiles/SST_${YYYY}${MM}_tmp.nc  \
-             $WORKDIR/outfiles/SIC_${YYYY}${MM}_tmp.nc  \
-             $WORKDIR/outfiles/SST-SIC_${YYYY}${MM}_tmp.nc
-
-cdo -s -P ${OMP_THREADS_CONV2ICON} ${GCM_REMAP},$WORKDIR/boundary_data/triangular-grid.nc \
-               $WORKDIR/outfiles/SST-SIC_${YYYY}${MM}_tmp.nc  \
-               $WORKDIR/outfiles/SST-SIC_${YYYY}${MM}_${GCM_REMAP}_tmp.nc
-
-cdo -s div $WORKDIR/outfiles/SST-SIC_${YYYY}${MM}_${GCM_REMAP}_tmp.nc $WORKDIR/boundary_data/output_ocean_area.nc \
-           $WORKDIR/outfiles/LOWBC_${YYYY}_${MM}.nc
-
-#Clean up
-rm -f $WORKDIR/outfiles/*_tmp.*
+set +a
+source ./workqueue.sh
+source ./store.sh
+
+export WORKDIR=$PWD
+TIMINGS=$WORKDIR/task_timings.txt
+stage_timing_init $WORKDIR/stage_timings.txt
+source ./conv2icon_lbc.sh  # get remap_to_icon, chunk_month
+
+export REMAP_WEIGHTS=${REMAP_WEIGHTS_DIR:-$WORKDIR/remap_weights}/weights.nc
+
+# generate the weights (e.g. remaplaf -> genlaf) unless they were passed in
+generate_remap_weights() {
+  if [ ${REUSE_REMAP_WEIGHTS} -eq 1 ] && [ ! -f ${REMAP_WEIGHTS} ]
+  then
+    mkdir -p $(dirname ${REMAP_WEIGHTS})
+    # write next to the final name and rename, other jobs may share the weights
+    cdo -s -P ${OMP_THREADS_CONV2ICON} gen${GCM_REMAP#remap},$WORKDIR/boundary_data/triangular-grid.nc \
+      -selname,T $(echo "${DATAFILELIST}" | head -n 1) ${REMAP_WEIGHTS}.$(hostname).$$.tmp
+    mv ${REMAP_WEIGHTS}.$(hostname).$$.tmp ${REMAP_WEIGHTS}
+  fi
+}
+
+# each month of the batch is converted into months/<YYYYMM>, unless it was
+# converted before (by this or another experiment) and is taken from the store.
+# The subdirectory of each ICON chunk in outfiles links to the files of its months.
+CONVERT_DATES=$(echo $(store_missing ${MONTH_DATES}))
+mkdir -p $WORKDIR/months
+: > $WORKDIR/lbc_files.txt
+for CURRENT_DATE in ${MONTH_DATES}
+do
+  MONTH=${CURRENT_DATE:0:6}
+  YYYY=${MONTH:0:4}
+  MM=${MONTH:4:2}
+  GCM_PREPARED=$WORKDIR/gcm_prepared/${MONTH}
+  OUTFILES=$WORKDIR/outfiles/$(chunk_month ${MONTH})
+  mkdir -p ${OUTFILES}
+  DATAFILELIST=$(find ${GCM_PREPARED}/${GCM_PREFIX}??????????.nc)
+
+  if [ ${CURRENT_DATE} -eq ${YDATE_START}  ]
+  then
+    stage_begin remap_initial
+
+    cdo -s selname,LSM ${GCM_PREPARED}/${GCM_PREFIX}${YDATE_START}.nc $WORKDIR/boundary_data/input_FR_LAND.nc
+    ncrename -h -v LSM,FR_LAND $WORKDIR/boundary_data/input_FR_LAND.nc
+    cdo -s selname,FR_LAND ${EXTPAR} $WORKDIR/boundary_data/output_FR_LAND.nc
+    ncecat -O -u time $WORKDIR/boundary_data/output_FR_LAND.nc $WORKDIR/boundary_data/output_FR_LAND.nc # add time dimension otherwise ICON stops
+    ncks -h -A -v time $WORKDIR/boundary_data/input_FR_LAND.nc $WORKDIR/boundary_data/output_FR_LAND.nc # give time a value to avoid CDO warnings
+    cdo -L -s setctomiss,0. -ltc,0.5  $WORKDIR/boundary_data/input_FR_LAND.nc $WORKDIR/boundary_data/input_ocean_area.nc
+    cdo -L -s  setctomiss,0. -gec,0.5 $WORKDIR/boundary_data/input_FR_LAND.nc $WORKDIR/boundary_data/input_land_area.nc
+    cdo -L -s setctomiss,0. -ltc,1. $WORKDIR/boundary_data/output_FR_LAND.nc $WORKDIR/boundary_data/output_ocean_area.nc
+    cdo -L -s  setctomiss,0. -gtc,0. $WORKDIR/boundary_data/output_FR_LAND.nc $WORKDIR/boundary_data/output_land_area.nc
+    cdo -s setrtoc2,0.5,1.0,1,0 $WORKDIR/boundary_data/output_FR_LAND.nc ${OUTFILES}/output_lsm.nc
+    rm $WORKDIR/boundary_data/input_FR_LAND.nc $WORKDIR/boundary_data/output_FR_LAND.nc
+
+
+    # create file with ICON grid information for CDO
+    cdo -s selgrid,2 ${LAM_GRID} $WORKDIR/boundary_data/triangular-grid.nc
+    generate_remap_weights
+
+    # remap land area only variables (ocean points are assumed to be undefined in the input data)
+    cdo -s setmisstodis -selname,SMIL1,SMIL2,SMIL3,SMIL4,STL1,STL2,STL3,STL4,W_SNOW,T_SNOW ${GCM_PREPARED}/${GCM_PREFIX}${YDATE_START}.nc  \
+                                         ${OUTFILES}/tmpl1.nc
+    remap_to_icon ${OUTFILES}/tmpl1.nc ${OUTFILES}/tmpl2.nc
+    cdo -s div ${OUTFILES}/tmpl2.nc $WORKDIR/boundary_data/output_land_area.nc ${OUTFILES}/tmp_output_l.nc
+    rm ${OUTFILES}/tmpl?.nc
+
+    # remap land and ocean area differently for variables
+    # ocean part
+    cdo -s selname,SKT ${GCM_PREPARED}/${GCM_PREFIX}${YDATE_START}.nc ${OUTFILES}/tmp_input_ls.nc
+    cdo -s div ${OUTFILES}/tmp_input_ls.nc $WORKDIR/boundary_data/input_ocean_area.nc  ${OUTFILES}/tmpls1.nc
+    cdo -s setmisstodis ${OUTFILES}/tmpls1.nc ${OUTFILES}/tmpls2.nc
+    remap_to_icon ${OUTFILES}/tmpls2.nc ${OUTFILES}/tmpls3.nc
+    cdo -s div ${OUTFILES}/tmpls3.nc $WORKDIR/boundary_data/output_ocean_area.nc ${OUTFILES}/tmp_ocean_part.nc
+    rm ${OUTFILES}/tmpls?.nc
+    # land part
+    cdo -s div ${OUTFILES}/tmp_input_ls.nc $WORKDIR/boundary_data/input_land_area.nc  ${OUTFILES}/tmpls1.nc
+    cdo -s setmisstodis ${OUTFILES}/tmpls1.nc ${OUTFILES}/tmpls2.nc
+    remap_to_icon ${OUTFILES}/tmpls2.nc ${OUTFILES}/tmpls3.nc
+    cdo -s div ${OUTFILES}/tmpls3.nc $WORKDIR/boundary_data/output_land_area.nc ${OUTFILES}/tmp_land_part.nc
+    rm ${OUTFILES}/tmpls?.nc
+    # merge remapped land and ocean part
+    cdo -s ifthenelse ${OUTFILES}/output_lsm.nc ${OUTFILES}/tmp_land_part.nc  ${OUTFILES}/tmp_ocean_part.nc ${OUTFILES}/tmp_output_ls.nc
+    rm ${OUTFILES}/tmp_land_part.nc ${OUTFILES}/tmp_ocean_part.nc
+
+    # remap the rest
+    ncks -h -O -x -v W_SNOW,T_SNOW,STL1,STL2,STL3,STL4,SMIL1,SMIL2,SMIL3,SMIL4,SKT,LSM ${GCM_PREPARED}/${GCM_PREFIX}${YDATE_START}.nc ${OUTFILES}/tmp_input_rest.nc
+    remap_to_icon ${OUTFILES}/tmp_input_rest.nc $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
+
+     # merge remapped files plus land sea mask from EXTPAR
+    ncks -h -A ${OUTFILES}/tmp_output_l.nc $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
+    ncks -h -A ${OUTFILES}/tmp_output_ls.nc $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
+    ncks -h -A ${OUTFILES}/output_lsm.nc  $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
+    rm -f ${OUTFILES}/tmp_output_l.nc ${OUTFILES}/tmp_output_ls.nc ${OUTFILES}/tmp_input_ls.nc ${OUTFILES}/tmp_input_rest.nc
+
+    # attribute modifications
+    ncatted -h -a coordinates,FR_LAND,o,c,"clon clat" $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
+
+    # renamings
+    ncrename -h -v FR_LAND,LSM $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
+    ncrename -h -v SIC,CI $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
+    ncrename -h -d level,lev $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
+    ncrename -h -d cell,ncells $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
+    ncrename -h -d nv,vertices $WORKDIR/boundary_data/${GCM_PREFIX}${YDATE_START}_ini.nc
+
+    #   The vertical coordinate coefficients has not been transfered by CDO. They have to be added here again.
+    pushd $WORKDIR/boundary_data
+    ncks -h -O -C -v ak,bk ${GCM_PREPARED}/${GCM_PREFIX}${YYYY}${MM}0100.nc hyai_hybi.nc
+    ncatted -h -a ,global,d,,  hyai_hybi.nc
+    ncrename -d level1,nhyi hyai_hybi.nc
+    ncrename -v ak,hyai hyai_hybi.nc
+    ncrename -v bk,hybi hyai_hybi.nc
+
+    ncks -h -A $WORKDIR/boundary_data/hyai_hybi.nc ${GCM_PREFIX}${YDATE_START}_ini.nc
+    popd
+
+  fi # end remapping initial data
+
+  if [[ " ${CONVERT_DATES} " != *" ${CURRENT_DATE} "* ]]
+  then
+    continue
+  fi
+  OUTFILES=$WORKDIR/months/${MONTH}
+  mkdir -p ${OUTFILES}
+
+  stage_begin remap_weights
+  generate_remap_weights
+
+  # ----------------------------------------------------------------------------
+  # PART II: Extract lower boundary data
+  # ----------------------------------------------------------------------------
+  stage_begin remap_lower_boundary
+  rm -f ${OUTFILES}/${GCM_PREFIX}${YYYY}${MM}_tmp.nc
+
+  ncrcat -h -v SIC,SST ${GCM_PREPARED}/${GCM_PREFIX}??????????.nc  \
+                   ${OUTFILES}/${GCM_PREFIX}${YYYY}${MM}_tmp.nc
+
+  cdo -s setmisstodis -selname,SIC ${OUTFILES}/${GCM_PREFIX}${YYYY}${MM}_tmp.nc \
+                                  ${OUTFILES}/SIC_${YYYY}${MM}_tmp.nc
+
+  cdo -s setmisstodis -selname,SST ${OUTFILES}/${GCM_PREFIX}${YYYY}${MM}_tmp.nc  \
+                                   ${OUTFILES}/SST_${YYYY}${MM}_tmp.nc
+
+  cdo -s merge ${OUTFILES}/SST_${YYYY}${MM}_tmp.nc  \
+               ${OUTFILES}/SIC_${YYYY}${MM}_tmp.nc  \
+               ${OUTFILES}/SST-SIC_${YYYY}${MM}_tmp.nc
+
+  remap_to_icon ${OUTFILES}/SST-SIC_${YYYY}${MM}_tmp.nc  \
+                ${OUTFILES}/SST-SIC_${YYYY}${MM}_${GCM_REMAP}_tmp.nc
+
+  cdo -s div ${OUTFILES}/SST-SIC_${YYYY}${MM}_${GCM_REMAP}_tmp.nc $WORKDIR/boundary_data/output_ocean_area.nc \
+             ${OUTFILES}/LOWBC_${YYYY}_${MM}.nc
+
+  #Clean up
+  rm -f ${OUTFILES}/*_tmp.*
+
+  echo "${DATAFILELIST}" >> $WORKDIR/lbc_files.txt
+done
+stage_end
 
 #-----------------------------------------------------------------------------
 # PART III: Extract lateral boundary data
 #-----------------------------------------------------------------------------
 echo ----- start CONV2ICON for LATBC
 
-#   The vertical coordinate coefficients has not been transfered by iconremap due to an error in the cdilib.
-#   They have to be added here again.
 pushd $WORKDIR/outfiles
 
-COUNTPP=0
-for FILE in ${DATAFILELIST}
+# spread the files of all months over LBC_SHARDS tasks (possibly on several nodes)
+mkdir -p $WORKDIR/lbc_shards
+stage_begin lateral_boundary
+if [ ${LBC_SHARDS} -gt 1 ]
+then
+  SRUN_OPTIONS="--ntasks=${LBC_SHARDS}"
+  if [ ${LBC_CPUS_PER_SHARD} -gt 0 ]
+  then
+    SRUN_OPTIONS="${SRUN_OPTIONS} --cpus-per-task=${LBC_CPUS_PER_SHARD}"
+  fi
+  srun ${SRUN_OPTIONS} bash $WORKDIR/conv2icon_lbc.sh $WORKDIR/lbc_files.txt
+else
+  bash $WORKDIR/conv2icon_lbc.sh $WORKDIR/lbc_files.txt
+fi
+stage_end
+cat $WORKDIR/lbc_shards/timings_*.txt >> ${TIMINGS}
+popd
+
+if [ -n "${STORE_DIR}" ]
+then
+  stage_begin store_publish
+  for CURRENT_DATE in ${CONVERT_DATES}
+  do
+    store_publish $WORKDIR/months/${CURRENT_DATE:0:6} ${CURRENT_DATE:0:6}
+  done
+  stage_end
+fi
+
+for CURRENT_DATE in ${MONTH_DATES}
 do
-(
-  FILEOUT=$(basename ${FILE} .nc)
-  cdo -s -P ${OMP_THREADS_CONV2ICON} ${GCM_REMAP},$WORKDIR/boundary_data/triangular-grid.nc -selname,T,U,V,W,LNPS,GEOP_ML,QV,QC,QI${ICON_INPUT_OPTIONAL} ${FILE} $WORKDIR/outfiles/${FILEOUT}_lbc.nc
-  ncks -h -A $WORKDIR/boundary_data/hyai_hybi.nc $WORKDIR/outfiles/${FILEOUT}_lbc.nc
-   ncrename -d level,lev $WORKDIR/outfiles/${FILEOUT}_lbc.nc
-   ncrename -d cell,ncells $WORKDIR/outfiles/${FILEOUT}_lbc.nc
-   ncrename -d nv,vertices $WORKDIR/outfiles/${FILEOUT}_lbc.nc
-)&
-    (( COUNTPP=COUNTPP+1 ))
-    if [ ${COUNTPP} -ge ${MAX_PP} ]
-    then
-      COUNTPP=0
-      wait
-    fi
+  MONTH=${CURRENT_DATE:0:6}
+  if [ ! -e $WORKDIR/months/${MONTH} ]
+  then
+    echo "Reusing ${MONTH} from ${STORE_DIR}"
+    ln -s ${STORE_DIR}/${MONTH} $WORKDIR/months/${MONTH}
+  fi
+  ln -s $WORKDIR/months/${MONTH}/* $WORKDIR/outfiles/$(chunk_month ${MONTH})/
 done
-wait
 
-if [ ${CURRENT_DATE} -eq ${YDATE_START}  ]
+if [[ " ${MONTH_DATES} " == *" ${YDATE_START} "* ]]
 then
-   cp $WORKDIR/outfiles/${GCM_PREFIX}${YDATE_START}_lbc.nc $WORKDIR/boundary_data
+   cp $WORKDIR/months/${YDATE_START:0:6}/${GCM_PREFIX}${YDATE_START}_lbc.nc $WORKDIR/boundary_data
 fi
 
 #-----------------------------------------------------------------------------
@@ -0,0 +1,88 @@
+# Lateral boundary conversion for conv2icon.sh.
+#
+# Sourced by conv2icon.sh for `remap_to_icon` and `chunk_month`. Executed
+# once per shard (through srun when the conversion is spread over several
+# tasks) as
+#
+#   bash conv2icon_lbc.sh <file list>
+#
+# to convert every LBC_SHARDS-th file of <file list>, starting at the shard
+# number (SLURM_PROCID, 0 outside of srun). On success the shard lists the
+# files it converted in lbc_shards/shard_<n>.done and its task timings in
+# lbc_shards/timings_<n>.txt.
+
+# remap onto the ICON grid, with precomputed weights unless disabled
+remap_to_icon() {
+  if [ ${REUSE_REMAP_WEIGHTS} -eq 1 ]
+  then
+    cdo -s -P ${OMP_THREADS_CONV2ICON} remap,$WORKDIR/boundary_data/triangular-grid.nc,${REMAP_WEIGHTS} "$@"
+  else
+    cdo -s -P ${OMP_THREADS_CONV2ICON} ${GCM_REMAP},$WORKDIR/boundary_data/triangular-grid.nc "$@"
+  fi
+}
+
+# subdirectory of the ICON chunk (of CHUNK_MONTHS months from YDATE_START)
+# containing month <YYYYMM>, named after its first month
+#
+# usage: chunk_month <YYYYMM>
+chunk_month() {
+  local start=$(( 10#${YDATE_START:0:4} * 12 + 10#${YDATE_START:4:2} - 1 ))
+  local month=$(( 10#${1:0:4} * 12 + 10#${1:4:2} - 1 ))
+  month=$(( start + (month - start) / CHUNK_MONTHS * CHUNK_MONTHS ))
+  printf "%04d%02d" $(( month / 12 )) $(( month % 12 + 1 ))
+}
+
+#   The vertical coordinate coefficients has not been transfered by iconremap due to an error in the cdilib.
+#   They have to be added here again.
+convert_lbc() {
+  # the output goes to the converted month of the input file
+  FILEOUT=$(basename $(dirname $1))/$(basename $1 .nc)
+  remap_to_icon -selname,T,U,V,W,LNPS,GEOP_ML,QV,QC,QI${ICON_INPUT_OPTIONAL} $1 $WORKDIR/months/${FILEOUT}_lbc.nc
+  if [ "${LBC_CONVERSION}" == "fused" ]
+  then
+    # attach in place (no temporary copy) and rename all dimensions in one pass
+    ncks -h -A --no_tmp_fl $WORKDIR/boundary_data/hyai_hybi.nc $WORKDIR/months/${FILEOUT}_lbc.nc
+    ncrename -h -d level,lev -d cell,ncells -d nv,vertices $WORKDIR/months/${FILEOUT}_lbc.nc
+  elif [ "${LBC_CONVERSION}" == "sequential" ]
+  then
+    ncks -h -A $WORKDIR/boundary_data/hyai_hybi.nc $WORKDIR/months/${FILEOUT}_lbc.nc
+    ncrename -d level,lev $WORKDIR/months/${FILEOUT}_lbc.nc
+    ncrename -d cell,ncells $WORKDIR/months/${FILEOUT}_lbc.nc
+    ncrename -d nv,vertices $WORKDIR/months/${FILEOUT}_lbc.nc
+  else
+    echo "Unknown LBC_CONVERSION '${LBC_CONVERSION}'." >&2
+    return 1
+  fi
+}
+
+convert_lbc_shard() {
+  local shard=${SLURM_PROCID:-0}
+  local files
+  files=$(awk -v n=${LBC_SHARDS} -v i=${shard} '(NR - 1) % n == i' $1)
+  touch $WORKDIR/lbc_shards/timings_${shard}.txt
+  if [ -z "${files}" ]
+  then
+    # more shards than files, nothing left for this one
+    touch $WORKDIR/lbc_shards/shard_${shard}.done
+    return
+  fi
+  echo "${files}" | workqueue_run ${MAX_PP} $WORKDIR/lbc_shards/timings_${shard}.txt convert_lbc
+  echo "${files}" > $WORKDIR/lbc_shards/shard_${shard}.done
+}
+
+if [[ "${BASH_SOURCE[0]}" == "$0" ]]
+then
+  set -e
+  cd $(dirname ${BASH_SOURCE[0]})
+
+  set -a
+  source ./inputs.sh  # get variables
+  set +a
+  source ./workqueue.sh
+
+  export WORKDIR=$PWD
+  export REMAP_WEIGHTS=${REMAP_WEIGHTS_DIR:-$WORKDIR/remap_weights}/weights.nc
+  export -f remap_to_icon
+
+  convert_lbc_shard $1
+fi
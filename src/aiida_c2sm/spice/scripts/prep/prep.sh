@@ -3,38 +3,95 @@ export PMI_NO_PREINITIALIZE=1
 export PMI_MMAP_SYNC_WAIT_TIME=300
 
 set -e
+set -o pipefail
 
-source ./inputs.sh  # get YYYY, MM, MAX_PP, UTILS_BINDIR
+set -a
+source ./inputs.sh  # get MONTH_DATES, MAX_PP, UTILS_BINDIR, STREAM_EXTRACT, STORE_DIR
+set +a
+source ./workqueue.sh
+source ./store.sh
 
-# untar
-tar -C gcm_data_compressed -xf gcm_data/ERAINT_${YYYY}_${MM}.tar
+TIMINGS=$PWD/task_timings.txt
+stage_timing_init $PWD/stage_timings.txt
+
+# months prepared before, by this or another experiment, are taken from the store
+PREPARE_DATES=$(store_missing ${MONTH_DATES})
+
+mkdir -p gcm_data_compressed outfiles
 
 # unzip
-COUNT_PP = 0
-for FILE in $(ls -1 gcm_data/*)
-do
-  BASE_NAME = $(basename $FILE .ncz)
-  nccopy -k 2 gcm_data_compressed/${BASE_NAME}.ncz outfiles/${BASE_NAME}.nc & (( COUNT_PP=COUNT_PP+1 ))
-  if [[ $COUNT_PP -ge $MAX_PP ]]
+decompress() {
+  nccopy -k 2 $1 outfiles/$(basename $(dirname $1))/$(basename $1 .ncz).nc
+}
+
+# ccaf2icaf
+convert_to_icaf() {
+  cd $(dirname $1)
+  ${UTILS_BINDIR}/ccaf2icaf $(basename $1) 1
+  ncks -h -O -x -v W_SO_REL,T_SO,soil1,soil1_bnds $(basename $1) $(basename $1)
+}
+
+# one subdirectory per month
+untar_month() {
+  MONTH=${1:0:6}
+  YYYY=${MONTH:0:4}
+  MM=${MONTH:4:2}
+  export MEMBER_DIR=$PWD/gcm_data_compressed/${MONTH}
+  mkdir -p ${MEMBER_DIR} outfiles/${MONTH}
+  tar -C ${MEMBER_DIR} -xf gcm_data/ERAINT_${YYYY}_${MM}.tar "${@:2}"
+}
+
+if [ -n "${PREPARE_DATES}" ]
+then
+  if [ ${STREAM_EXTRACT} -eq 1 ]
   then
-    COUNT_PP = 0
-    wait
+    # tar writes one member at a time and only then lists it, so each member is
+    # decompressed and converted while the rest of the archive is extracted,
+    # and deleted right away. The steps overlap and are timed as one stage, but
+    # still as separate decompress and convert_to_icaf tasks.
+    prepare_member() {
+      workqueue_time decompress $1
+      rm $1
+      workqueue_time convert_to_icaf outfiles/$(basename $(dirname $1))/$(basename $1 .ncz).nc
+    }
+    export -f decompress convert_to_icaf
+    stage_begin untar_nccopy_ccaf2icaf
+    for CURRENT_DATE in ${PREPARE_DATES}
+    do
+      untar_month ${CURRENT_DATE} \
+        --to-command='cat > ${MEMBER_DIR}/${TAR_FILENAME##*/} && echo ${MEMBER_DIR}/${TAR_FILENAME##*/}'
+    done | workqueue_run ${MAX_PP} ${TIMINGS} prepare_member
+  else
+    stage_begin untar
+    for CURRENT_DATE in ${PREPARE_DATES}
+    do
+      untar_month ${CURRENT_DATE}
+    done
+    stage_begin nccopy
+    ls -1 gcm_data_compressed/*/* | workqueue_run ${MAX_PP} ${TIMINGS} decompress
+    stage_begin ccaf2icaf
+    ls -1 outfiles/*/* | workqueue_run ${MAX_PP} ${TIMINGS} convert_to_icaf
   fi
-done
-wait
+  stage_end
+fi
 rm -rf gcm_data_compressed
 
-# ccaf2icaf
-cd outfiles
-COUNT_PP = 0
-for FILE in $(ls -1)
+for CURRENT_DATE in ${MONTH_DATES}
 do
-  ${UTILS_BINDIR}/ccaf2icaf $FILE 1
-  ncks -h -O -x -v W_SO_REL,T_SO,soil1,soil1_bnds $FILE $FILE
-  if [[ $COUNT_PP -ge $MAX_PP ]]
+  MONTH=${CURRENT_DATE:0:6}
+  if [ ! -e outfiles/${MONTH} ]
   then
-    COUNT_PP = 0
-    wait
+    echo "Reusing ${MONTH} from ${STORE_DIR}"
+    ln -s ${STORE_DIR}/${MONTH} outfiles/${MONTH}
   fi
 done
-wait
+
+if [ -n "${STORE_DIR}" ]
+then
+  stage_begin store_publish
+  for CURRENT_DATE in ${PREPARE_DATES}
+  do
+    store_publish outfiles/${CURRENT_DATE:0:6} ${CURRENT_DATE:0:6}
+  done
+  stage_end
+fi
@@ -0,0 +1,42 @@
+# Shared store for the prep and conv2icon scripts.
+#
+# STORE_DIR (from inputs.sh) is the store directory for the inputs of the job,
+# or empty if the job does not use a store. It keeps one entry per month, named
+# <YYYYMM>. An entry is complete once it contains a `.complete` file, which is
+# written before the entry becomes visible.
+
+# usage: store_is_complete <YYYYMM>
+store_is_complete() {
+  [ -n "${STORE_DIR}" ] && [ -f "${STORE_DIR}/$1/.complete" ]
+}
+
+# usage: store_missing <date>...
+#
+# Prints the dates (YYYYMMDDHH) of the months without a complete entry, all of
+# them if the job does not use a store.
+store_missing() {
+  local date
+  for date in "$@"
+  do
+    store_is_complete ${date:0:6} || echo ${date}
+  done
+}
+
+# usage: store_publish <directory> <YYYYMM>
+#
+# Moves <directory> into the entry of month <YYYYMM> and leaves a symlink to
+# the entry in its place. The entry is renamed into place in one step, so other
+# jobs never see it half written. If another job published the same entry
+# first, that copy is kept and <directory> is discarded.
+store_publish() {
+  local entry=${STORE_DIR}/$2
+  local staging=${entry}.$(hostname).$$.tmp
+  mkdir -p ${STORE_DIR}
+  mv "$1" ${staging}
+  touch ${staging}/.complete
+  if ! mv -T ${staging} ${entry} 2>/dev/null
+  then
+    rm -rf ${staging}
+  fi
+  ln -s ${entry} "$1"
+}
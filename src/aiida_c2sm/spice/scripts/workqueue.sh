@@ -0,0 +1,75 @@
+# Bounded work queue and stage timing for the prep and conv2icon scripts.
+#
+# usage: <one task per line> | workqueue_run <max parallel> <timing file> <function>
+#
+# Calls <function> <task> for every non-empty line on stdin, with at most
+# <max parallel> tasks running at a time. A new task starts as soon as any
+# running task finishes. Each task appends one line to <timing file>:
+#
+#   <function> <task> <start epoch seconds> <end epoch seconds> <exit status>
+#
+# Returns non-zero if any task failed. Variables and functions used by
+# <function> must be exported (e.g. with `set -a` / `export -f`).
+#
+# usage: workqueue_time <function> <task>
+#
+# Runs and times one step of a task the same way, for tasks made of several
+# steps which should show up in <timing file> on their own.
+
+workqueue_time() {
+  local start end status=0
+  start=$(date +%s.%N)
+  # a separate shell, so that `set -e` applies within the step but a failing
+  # step is still recorded by a caller running under `set -e`
+  bash -ec '"$@"' _ "$1" "$2" || status=$?
+  end=$(date +%s.%N)
+  echo "$1 $2 ${start} ${end} ${status}" >> "${WORKQUEUE_TIMING_FILE}"
+  return ${status}
+}
+
+workqueue_task() {
+  workqueue_time "${WORKQUEUE_FUNCTION}" "$1"
+}
+
+workqueue_run() {
+  export WORKQUEUE_TIMING_FILE=$2
+  export WORKQUEUE_FUNCTION=$3
+  export -f workqueue_time workqueue_task "$3"
+  sed '/^$/d' | xargs -r -d '\n' -P "$1" -I {} bash -c 'workqueue_task "$1"' _ {}
+}
+
+# Stage timing.
+#
+# usage: stage_timing_init <stage timing file>
+#        stage_begin <stage>
+#        ...
+#        stage_end
+#
+# Appends one line per stage to <stage timing file>:
+#
+#   <stage> <start epoch seconds> <end epoch seconds> <exit status>
+#
+# A stage ends at `stage_end`, at the next `stage_begin` or when the script
+# exits, in which case the exit status of the script is recorded (e.g. the
+# failing command under `set -e`). A stage may run several times.
+
+stage_timing_init() {
+  STAGE_TIMING_FILE=$1
+  STAGE_NAME=
+  touch "${STAGE_TIMING_FILE}"
+  trap 'stage_end $?' EXIT
+}
+
+stage_begin() {
+  stage_end
+  STAGE_NAME=$1
+  STAGE_START=$(date +%s.%N)
+}
+
+stage_end() {
+  if [ -n "${STAGE_NAME}" ]
+  then
+    echo "${STAGE_NAME} ${STAGE_START} $(date +%s.%N) ${1:-0}" >> "${STAGE_TIMING_FILE}"
+    STAGE_NAME=
+  fi
+}
@@ -0,0 +1,213 @@
+"""
+Timing records of the SPICE workflows.
+
+Workchain steps decorated with `timed_step` accumulate how long they took in
+the "step_timings" extra of the workchain node. The parsers call
+`record_calcjob_timings`, which stores the queue wait, run and retrieval time
+of the job in the "timings" extra of the CalcJob node, and
+`parse_script_timings` summarizes the stage and task timing logs written by
+the prep and conv2icon scripts (see workqueue.sh) for their "timings" output.
+`experiment_timings` collects the extras for one experiment, see also
+`c2sm-spice timings`.
+"""
+from __future__ import annotations
+
+import datetime
+import functools
+import os
+from typing import Any, Callable
+
+from aiida import engine, orm
+from aiida.common import escaping
+from aiida.orm.nodes import repository
+
+STEP_TIMINGS_EXTRA = "step_timings"
+CALCJOB_TIMINGS_EXTRA = "timings"
+STAGE_TIMINGS_FILE = "stage_timings.txt"
+TASK_TIMINGS_FILE = "task_timings.txt"
+STAGES = ("prep", "conv", "icon")
+
+__all__ = [
+    "timed_step",
+    "record_calcjob_timings",
+    "parse_script_timings",
+    "experiment_timings",
+]
+
+
+def timed_step(
+    step: Callable[[engine.WorkChain], Any]
+) -> Callable[[engine.WorkChain], Any]:
+    """
+    Record the duration of a workchain outline step.
+
+    The "step_timings" extra maps the step name to
+    {"calls": <int>, "seconds": <total>, "max_seconds": <float>, "last_started": <iso>}
+    """
+
+    @functools.wraps(step)
+    def wrapper(self: engine.WorkChain) -> Any:
+        started = _now()
+        try:
+            return step(self)
+        finally:
+            seconds = (_now() - started).total_seconds()
+            timings = self.node.base.extras.get(STEP_TIMINGS_EXTRA, {})
+            record = timings.get(
+                step.__name__, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
+            )
+            timings[step.__name__] = {
+                "calls": record["calls"] + 1,
+                "seconds": record["seconds"] + seconds,
+                "max_seconds": max(record["max_seconds"], seconds),
+                "last_started": started.isoformat(),
+            }
+            self.node.base.extras.set(STEP_TIMINGS_EXTRA, timings)
+
+    return wrapper
+
+
+def record_calcjob_timings(
+    node: orm.CalcJobNode, retrieved: orm.FolderData
+) -> dict[str, Any]:
+    """
+    Store the queue, run and retrieval times of a finished job in its extras.
+
+    The times come from the last scheduler poll of the job, the end of the run is
+    taken as the time the job was last seen by the scheduler. Scheduler times
+    without a time zone are taken as local time. Missing times (e.g. from
+    schedulers which do not report them) are left out.
+    """
+    timings: dict[str, Any] = {}
+    job_info = node.get_last_job_info()
+    submitted = _aware(getattr(job_info, "submission_time", None))
+    started = _aware(getattr(job_info, "dispatch_time", None))
+    finished = _aware(
+        getattr(job_info, "finish_time", None) or node.get_scheduler_lastchecktime()
+    )
+    if submitted:
+        timings["submitted"] = submitted.isoformat()
+    if started:
+        timings["started"] = started.isoformat()
+    if finished:
+        timings["finished"] = finished.isoformat()
+    if submitted and started:
+        timings["queue_seconds"] = (started - submitted).total_seconds()
+    if started and finished:
+        timings["run_seconds"] = (finished - started).total_seconds()
+    if finished:
+        timings["retrieve_seconds"] = (retrieved.ctime - finished).total_seconds()
+    timings["retrieved_bytes"] = sum(
+        _object_size(retrieved.base.repository, str(root / name))
+        for root, _, names in retrieved.base.repository.walk()
+        for name in names
+    )
+    node.base.extras.set(CALCJOB_TIMINGS_EXTRA, timings)
+    return timings
+
+
+def parse_script_timings(retrieved: orm.FolderData) -> dict[str, Any]:
+    """
+    Summarize the timing logs of a prep or conv2icon script.
+
+    Returns
+    {
+        "stages": {<stage>: <timings>},
+        "tasks": {<work queue function>: <timings>},
+    }
+    with <timings> = {"calls": <int>, "seconds": <total>, "max_seconds": <float>,
+    "failed": <int>}. Logs which were not retrieved (e.g. a job reusing the
+    store) are left out, so the result may be empty.
+    """
+    timings: dict[str, Any] = {}
+    names = retrieved.list_object_names()
+    for key, filename, name_fields in (
+        ("stages", STAGE_TIMINGS_FILE, 1),
+        ("tasks", TASK_TIMINGS_FILE, 2),
+    ):
+        if filename not in names:
+            continue
+        totals: dict[str, dict[str, Any]] = {}
+        for line in retrieved.get_object_content(filename).splitlines():
+            fields = line.split()
+            if len(fields) < name_fields + 3:
+                continue
+            # a task line also names the task, which may contain spaces
+            name, (start, end, status) = fields[0], fields[-3:]
+            seconds = float(end) - float(start)
+            total = totals.setdefault(
+                name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "failed": 0}
+            )
+            total["calls"] += 1
+            total["seconds"] += seconds
+            total["max_seconds"] = max(total["max_seconds"], seconds)
+            total["failed"] += int(status) != 0
+        timings[key] = totals
+    return timings
+
+
+def experiment_timings(expid: str) -> dict[str, Any]:
+    """
+    Timings of the jobs and workchain steps of an experiment.
+
+    Returns
+    {
+        "months": {<YYYY-MM>: {<stage>: <CalcJob timings>}},
+        "steps": {<workchain class>: {<step>: <step timings summed over runs>}},
+    }
+    Prep and conv jobs covering several months are listed under their first month.
+    """
+    months: dict[str, dict[str, Any]] = {}
+    label_expid = escaping.escape_for_sql_like(expid)
+    query = orm.QueryBuilder()
+    query.append(
+        orm.CalcJobNode,
+        filters={
+            "or": [{"label": {"like": f"{stage}:{label_expid}@%"}} for stage in STAGES]
+        },
+        project=["label", f"extras.{CALCJOB_TIMINGS_EXTRA}"],
+    )
+    for label, timings in query.all():
+        stage, date = label.split(":", 1)[0], label.rsplit("@", 1)[1]
+        months.setdefault(date[:7], {})[stage] = timings or {}
+
+    steps: dict[str, dict[str, Any]] = {}
+    query = orm.QueryBuilder()
+    query.append(
+        orm.Str,
+        filters={"attributes.value": expid},
+        tag="expid",
+    )
+    query.append(
+        orm.WorkChainNode,
+        with_incoming="expid",
+        edge_filters={"label": {"in": ["experiment_id", "expid"]}},
+        filters={"extras": {"has_key": STEP_TIMINGS_EXTRA}},
+        project=["attributes.process_label", f"extras.{STEP_TIMINGS_EXTRA}"],
+    )
+    for process_label, step_timings in query.all():
+        totals = steps.setdefault(process_label, {})
+        for step, record in step_timings.items():
+            total = totals.setdefault(
+                step, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
+            )
+            total["calls"] += record["calls"]
+            total["seconds"] += record["seconds"]
+            total["max_seconds"] = max(total["max_seconds"], record["max_seconds"])
+    return {"months": dict(sorted(months.items())), "steps": steps}
+
+
+def _object_size(node_repository: repository.NodeRepository, path: str) -> int:
+    """Size of a repository object, found by seeking to its end instead of reading it."""
+    with node_repository.open(path, mode="rb") as handle:
+        return handle.seek(0, os.SEEK_END)
+
+
+def _aware(value: datetime.datetime | None) -> datetime.datetime | None:
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.astimezone()
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
@@ -0,0 +1,84 @@
+"""
+Fixtures for the scheduling benchmarks.
+
+Every benchmark runs a workflow once on the temporary profile and records in
+`benchmark.extra_info`:
+
+- processes: number of processes created by the run.
+- processes_per_second: processes created per second of wall time.
+- workchain_steps: number of workchain steps executed.
+- queries_per_step: SQL statements per workchain step.
+"""
+from __future__ import annotations
+
+import dataclasses
+import time
+
+import pytest
+import sqlalchemy
+from aiida import engine, orm
+from aiida.engine.processes.workchains import workchain
+
+from aiida_c2sm import sleep
+
+
+@dataclasses.dataclass
+class SchedulingStats:
+    queries: int = 0
+    steps: int = 0
+
+
+@pytest.fixture
+def scheduling_stats(monkeypatch):
+    """Count SQL statements and workchain steps while the fixture is active."""
+    stats = SchedulingStats()
+
+    def count_query(*args, **kwargs):
+        stats.queries += 1
+
+    do_step = workchain.WorkChain._do_step
+
+    def count_step(self):
+        stats.steps += 1
+        return do_step(self)
+
+    monkeypatch.setattr(workchain.WorkChain, "_do_step", count_step)
+    sqlalchemy.event.listen(
+        sqlalchemy.engine.Engine, "before_cursor_execute", count_query
+    )
+    yield stats
+    sqlalchemy.event.remove(
+        sqlalchemy.engine.Engine, "before_cursor_execute", count_query
+    )
+
+
+@pytest.fixture
+def run_scheduling(aiida_profile_clean, benchmark, scheduling_stats):
+    """Run a process to completion once under the benchmark and record the metrics."""
+
+    def run(process: type[engine.Process], **inputs) -> orm.ProcessNode:
+        def run_once():
+            return engine.run_get_node(process, **inputs).node
+
+        start = time.perf_counter()
+        node = benchmark.pedantic(run_once, rounds=1, iterations=1)
+        elapsed = time.perf_counter() - start
+        assert node.is_finished_ok, node.exit_message
+
+        processes = orm.QueryBuilder().append(orm.ProcessNode).count()
+        benchmark.extra_info |= {
+            "processes": processes,
+            "processes_per_second": processes / elapsed,
+            "workchain_steps": scheduling_stats.steps,
+            "queries_per_step": scheduling_stats.queries
+            / max(scheduling_stats.steps, 1),
+        }
+        return node
+
+    return run
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """Make the demo tasks return immediately."""
+    monkeypatch.setattr(sleep.SleepMixin, "sleep", lambda self, seconds: None)
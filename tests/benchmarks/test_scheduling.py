@@ -0,0 +1,120 @@
+"""
+Submission throughput of the cycling and dependency workflows.
+
+The benchmarks only run with `--run-benchmarks`, e.g.
+`pytest tests/benchmarks --run-benchmarks --benchmark-cycle-sizes 10,100,1000`.
+"""
+from __future__ import annotations
+
+import statistics
+
+from aiida import engine, orm
+from aiida.engine.processes.workchains import workchain
+
+from aiida_c2sm import bakery, cycle, cycling, example_flow
+
+
+class DependencyChain(engine.WorkChain):
+    """Sell bread `length` times, each sale waiting on the previous Dependencies."""
+
+    @classmethod
+    def define(cls: type, spec: workchain.WorkChainSpec) -> None:
+        super().define(spec)
+        spec.input("length", valid_type=orm.Int)
+        spec.outline(cls.submit_chain, cls.await_last, cls.await_dependent)
+
+    def submit_chain(self) -> None:
+        previous = self.submit(bakery.SellBread, bread=bakery.one())
+        for _ in range(self.inputs.length.value):
+            previous = self.submit(
+                cycle.Dependencies,
+                dependent="c2sm.bakery_sell_bread",
+                dependencies={previous.uuid: {"money": "bread"}},
+            )
+        self.to_context(last=previous)
+
+    def await_last(self) -> None:
+        self.to_context(dependent=cycle.get_dependent(self.ctx.last))
+
+    def await_dependent(self) -> None:
+        self.report(f"Last dependent: {self.ctx.dependent.pk}")
+
+
+class FanOutFanIn(engine.WorkChain):
+    """One Hello, `width` WaitingHello handed off on it, and one waiting on all."""
+
+    @classmethod
+    def define(cls: type, spec: workchain.WorkChainSpec) -> None:
+        super().define(spec)
+        spec.input("width", valid_type=orm.Int)
+        spec.outline(cls.fan_out, cls.fan_in, cls.await_fan_in)
+
+    def fan_out(self) -> None:
+        root = self.submit(example_flow.Hello, task_name=orm.Str("root"))
+        self.ctx.branches = [
+            self.submit(
+                example_flow.WaitingHello,
+                task_name=orm.Str(f"branch {i}"),
+                dependencies=orm.List([root.uuid]),
+                sleep_duration=orm.Int(0),
+            ).uuid
+            for i in range(self.inputs.width.value)
+        ]
+
+    def fan_in(self) -> None:
+        join = self.submit(
+            example_flow.WaitingHello,
+            task_name=orm.Str("join"),
+            dependencies=orm.List(self.ctx.branches),
+            sleep_duration=orm.Int(0),
+        )
+        self.to_context(join=join)
+
+    def await_fan_in(self) -> None:
+        self.report(f"Joined: {self.ctx.join.pk}")
+
+
+def cycle_point_latencies(node: orm.ProcessNode) -> list[float]:
+    """Seconds from the first task created to the last task finished, per cycle point."""
+    query = orm.QueryBuilder()
+    query.append(orm.WorkChainNode, filters={"id": node.pk}, tag="cycling")
+    query.append(
+        orm.ProcessNode,
+        with_incoming="cycling",
+        filters={"label": {"like": "%@%"}},
+        project=["label", "ctime", "mtime"],
+    )
+    points = {}
+    for label, ctime, mtime in query.all():
+        _, point = cycling.split_task_key(label)
+        start, end = points.get(point, (ctime, mtime))
+        points[point] = (min(start, ctime), max(end, mtime))
+    return [(end - start).total_seconds() for start, end in points.values()]
+
+
+def test_bakery_cycle(run_scheduling, benchmark, no_sleep, cycle_size):
+    node = run_scheduling(
+        bakery.BakeryCycle,
+        initial_cycle_point=orm.Int(1),
+        final_cycle_point=orm.Int(cycle_size),
+    )
+    latencies = cycle_point_latencies(node)
+    assert len(latencies) == cycle_size
+    benchmark.extra_info["cycle_point_latency"] = statistics.mean(latencies)
+
+
+def test_dependencies_chain(run_scheduling, no_sleep, cycle_size):
+    node = run_scheduling(DependencyChain, length=orm.Int(cycle_size))
+    chain = sorted(
+        (called for called in node.called if isinstance(called, orm.WorkChainNode)),
+        key=lambda called: called.pk,
+    )
+    assert len(chain) == cycle_size + 1
+    assert all(called.is_finished_ok for called in chain)
+    assert cycle.get_dependent(chain[-1]).is_finished_ok
+
+
+def test_fan_out_fan_in(run_scheduling, no_sleep, cycle_size):
+    node = run_scheduling(FanOutFanIn, width=orm.Int(cycle_size))
+    assert len(node.called) == cycle_size + 2
+    assert all(called.is_finished_ok for called in node.called)
@@ -1,10 +1,43 @@
 """
-    Dummy conftest.py for aiida_c2sm.
+Shared fixtures for the aiida_c2sm tests.
 
-    If you don't know what this is for, just leave it empty.
-    Read more about conftest.py under:
-    - https://docs.pytest.org/en/stable/fixture.html
-    - https://docs.pytest.org/en/stable/writing_plugins.html
+The AiiDA fixtures create a temporary profile with `core.sqlite_dos` storage
+and no broker, processes submitted from a workchain run in the same event loop.
+Tests using the `benchmark` fixture are skipped unless `--run-benchmarks` is
+given.
 """
 
-# import pytest
+import pytest
+
+pytest_plugins = ["aiida.tools.pytest_fixtures"]
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--run-benchmarks",
+        action="store_true",
+        help="Run the scheduling benchmarks, which are skipped by default.",
+    )
+    parser.addoption(
+        "--benchmark-cycle-sizes",
+        default="10,100",
+        help=(
+            "Comma separated numbers of cycle points / processes for the "
+            "scheduling benchmarks, e.g. 10,100,1000 for the full baseline."
+        ),
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "cycle_size" in metafunc.fixturenames:
+        sizes = metafunc.config.getoption("benchmark_cycle_sizes")
+        metafunc.parametrize("cycle_size", [int(size) for size in sizes.split(",")])
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("run_benchmarks"):
+        return
+    skip = pytest.mark.skip(reason="benchmark, run with --run-benchmarks")
+    for item in items:
+        if "benchmark" in item.fixturenames:
+            item.add_marker(skip)
@@ -0,0 +1,101 @@
+"""Chunks of an experiment calendar."""
+from __future__ import annotations
+
+import pendulum
+import pytest
+
+from aiida_c2sm.spice import calendar, data
+
+
+def dt(*args: int) -> pendulum.DateTime:
+    return pendulum.datetime(*args)
+
+
+def test_monthly():
+    chunks = calendar.ExperimentCalendar(dt(1979, 1, 1), dt(1979, 4, 1))
+    assert len(chunks) == 3
+    assert chunks.dates == [dt(1979, 1, 1), dt(1979, 2, 1), dt(1979, 3, 1)]
+    assert chunks.stop(2) == dt(1979, 4, 1)
+    # January, February and March 1979 in seconds
+    assert chunks.offsets.tolist() == [0, 2678400, 5097600, 7776000]
+
+
+def test_leap_year_offsets():
+    chunks = calendar.ExperimentCalendar(dt(1979, 1, 1), dt(1981, 7, 1), 12)
+    assert chunks.dates == [dt(1979, 1, 1), dt(1980, 1, 1), dt(1981, 1, 1)]
+    assert chunks.offsets.tolist() == [0, 31536000, 63158400, 78796800]
+
+
+def test_uneven_chunks():
+    """Chunks of 5 months from January, the last one ends at the stop date."""
+    chunks = calendar.ExperimentCalendar(dt(1979, 1, 1), dt(1980, 1, 1), 5)
+    assert chunks.dates == [dt(1979, 1, 1), dt(1979, 6, 1), dt(1979, 11, 1)]
+    assert chunks.stop(1) == dt(1979, 11, 1)
+    assert chunks.stop(2) == dt(1980, 1, 1)
+
+
+def test_partial_last_chunk():
+    """A stop date within a month ends the last chunk at the next month."""
+    chunks = calendar.ExperimentCalendar(dt(1979, 1, 1), dt(1980, 6, 15), 12)
+    assert chunks.dates == [dt(1979, 1, 1), dt(1980, 1, 1)]
+    assert chunks.stop(1) == dt(1980, 7, 1)
+    assert chunks.next_date(dt(1980, 6, 30)) == dt(1980, 7, 1)
+
+
+def test_start_within_month():
+    """The first chunk is shorter, later chunks start with a month."""
+    chunks = calendar.ExperimentCalendar(dt(1979, 1, 10), dt(1981, 1, 1), 12)
+    assert chunks.dates == [dt(1979, 1, 10), dt(1980, 1, 1)]
+    assert chunks.offsets[1] == 356 * 86400
+    assert chunks.stop(1) == dt(1981, 1, 1)
+
+
+def test_single_chunk():
+    chunks = calendar.ExperimentCalendar(dt(1979, 3, 1), dt(1979, 4, 1), 3)
+    assert chunks.dates == [dt(1979, 3, 1)]
+    assert chunks.stop(0) == dt(1979, 4, 1)
+    chunks = calendar.ExperimentCalendar(dt(1979, 1, 1), dt(1979, 1, 1, 6))
+    assert chunks.dates == [dt(1979, 1, 1)]
+    assert chunks.stop(0) == dt(1979, 2, 1)
+
+
+def test_index():
+    chunks = calendar.ExperimentCalendar(dt(1979, 1, 1), dt(1980, 1, 1), 5)
+    assert chunks.index(dt(1979, 1, 1)) == 0
+    assert chunks.index(dt(1979, 5, 31, 23)) == 0
+    assert chunks.index(dt(1979, 6, 1)) == 1
+    assert chunks.index(dt(1979, 12, 31)) == 2
+    assert chunks.next_date(dt(1979, 7, 15)) == dt(1979, 11, 1)
+    for date in [dt(1978, 12, 31), dt(1980, 1, 1)]:
+        with pytest.raises(ValueError, match="outside of the experiment"):
+            chunks.index(date)
+
+
+def test_naive_dates():
+    """Naive dates stay naive, they are not moved to UTC."""
+    chunks = calendar.ExperimentCalendar(
+        pendulum.naive(1979, 1, 1), pendulum.naive(1979, 3, 1)
+    )
+    assert chunks.dates == [pendulum.naive(1979, 1, 1), pendulum.naive(1979, 2, 1)]
+    assert chunks.index(pendulum.naive(1979, 2, 15)) == 1
+
+
+@pytest.mark.parametrize(
+    "stop_date, chunk_months, message",
+    [
+        (dt(1980, 1, 1), 0, "at least one month"),
+        (dt(1979, 1, 1), 1, "is not after"),
+        (dt(1978, 1, 1), 1, "is not after"),
+    ],
+)
+def test_invalid(stop_date, chunk_months, message):
+    with pytest.raises(ValueError, match=message):
+        calendar.ExperimentCalendar(dt(1979, 1, 1), stop_date, chunk_months)
+
+
+def test_month_dates():
+    assert data.month_dates(dt(1979, 11, 1), dt(1980, 2, 1)) == [
+        dt(1979, 11, 1),
+        dt(1979, 12, 1),
+        dt(1980, 1, 1),
+    ]
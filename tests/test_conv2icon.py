@@ -0,0 +1,122 @@
+"""Months and ICON chunks converted by one Conv2Icon job."""
+from __future__ import annotations
+
+import dataclasses
+import os
+import shutil
+import subprocess
+
+import pendulum
+import pytest
+from aiida import orm
+
+from aiida_c2sm.spice import conv2icon, data, prep
+
+
+def dt(*args: int) -> pendulum.DateTime:
+    return pendulum.datetime(*args)
+
+
+def test_month_dates():
+    params = conv2icon.Conv2IconParams(
+        start_date=dt(1979, 1, 1), date=dt(1979, 11, 1), n_months=3
+    )
+    assert params.month_dates() == [dt(1979, 11, 1), dt(1979, 12, 1), dt(1980, 1, 1)]
+
+
+def test_chunk_dates_monthly():
+    params = conv2icon.Conv2IconParams(
+        start_date=dt(1979, 1, 1), date=dt(1979, 3, 1), n_months=4
+    )
+    assert params.chunk_dates() == params.month_dates()
+
+
+@pytest.mark.parametrize(
+    "date, n_months, chunks",
+    [
+        (dt(1980, 1, 1), 18, [dt(1980, 1, 1), dt(1981, 1, 1)]),
+        (dt(1979, 1, 1), 12, [dt(1979, 1, 1)]),
+        (dt(1981, 1, 1), 6, [dt(1981, 1, 1)]),
+    ],
+)
+def test_chunk_dates_yearly(date, n_months, chunks):
+    """Yearly chunks, the last converted one may be partial."""
+    params = conv2icon.Conv2IconParams(
+        start_date=dt(1979, 1, 1), date=date, n_months=n_months, chunk_months=12
+    )
+    assert len(params.month_dates()) == n_months
+    assert params.chunk_dates() == chunks
+
+
+def test_chunk_dates_start_within_month():
+    """The first chunk starts at the start date, not at the start of its month."""
+    params = conv2icon.Conv2IconParams(
+        start_date=dt(1979, 1, 10), date=dt(1979, 1, 10), n_months=6, chunk_months=3
+    )
+    assert params.month_dates()[0] == dt(1979, 1, 10)
+    assert params.chunk_dates() == [dt(1979, 1, 10), dt(1979, 4, 1)]
+
+
+def test_store_key_per_month(aiida_profile_clean, aiida_localhost):
+    """Jobs converting other months or chunks share their store entries."""
+    params = conv2icon.Conv2IconParams(
+        start_date=dt(1979, 1, 1), date=dt(1979, 1, 1), n_months=2
+    )
+
+    def store_key(**changes):
+        inputs = {
+            "gcm_prepared": orm.RemoteData(
+                computer=aiida_localhost, remote_path="/prepared"
+            ),
+            "ini_basedir": orm.RemoteData(computer=aiida_localhost, remote_path="/ini"),
+            "parameters": data.ParamsData(dataclasses.replace(params, **changes)),
+        }
+        for node in inputs.values():
+            node.store()
+        return conv2icon.get_store_key(inputs)
+
+    key = store_key()
+    assert key == store_key(
+        start_date=dt(1978, 1, 1), date=dt(1985, 6, 1), n_months=12, chunk_months=12
+    )
+    assert key != store_key(gcm_remap="remapbil")
+    assert key != store_key(icon_input_optional="QV_S")
+
+
+def test_empty_lbc_shard(tmp_path):
+    """A shard without files finishes without converting anything."""
+    for script in ["conv2icon_lbc.sh", "workqueue.sh"]:
+        shutil.copy(prep.get_script_path(script), tmp_path)
+    (tmp_path / "inputs.sh").write_text("LBC_SHARDS=3\nMAX_PP=2\n")
+    (tmp_path / "lbc_shards").mkdir()
+    (tmp_path / "lbc_files.txt").write_text("a/caf1.nc\nb/caf2.nc\n")
+    subprocess.run(
+        ["bash", str(tmp_path / "conv2icon_lbc.sh"), str(tmp_path / "lbc_files.txt")],
+        env={"PATH": os.environ["PATH"], "SLURM_PROCID": "2"},
+        check=True,
+    )
+    assert (tmp_path / "lbc_shards" / "shard_2.done").read_text() == ""
+    assert (tmp_path / "lbc_shards" / "timings_2.txt").read_text() == ""
+
+
+def test_workqueue_skips_empty_lines(tmp_path):
+    script = f"""
+        set -e -o pipefail
+        source {prep.get_script_path("workqueue.sh")}
+        task() {{ test -n "$1"; }}
+        printf 'a\\n\\nb\\n\\n' | workqueue_run 2 timings.txt task
+    """
+    subprocess.run(["bash", "-c", script], cwd=tmp_path, check=True)
+    timings = (tmp_path / "timings.txt").read_text().splitlines()
+    assert sorted(line.split()[1] for line in timings) == ["a", "b"]
+
+
+def test_unknown_lbc_conversion():
+    with pytest.raises(ValueError, match="Unknown lbc_conversion 'fast'"):
+        conv2icon.Conv2IconParams(
+            start_date=dt(1979, 1, 1), date=dt(1979, 1, 1), lbc_conversion="fast"
+        )
+    params = conv2icon.Conv2IconParams(
+        start_date=dt(1979, 1, 1), date=dt(1979, 1, 1), lbc_conversion="sequential"
+    )
+    assert params.lbc_conversion == "sequential"
@@ -0,0 +1,42 @@
+"""Dependencies workflows and their node lookups."""
+from __future__ import annotations
+
+import uuid
+
+import pytest
+from aiida import engine, orm
+from aiida.common import exceptions
+
+from aiida_c2sm import bakery, cycle
+
+
+def test_load_nodes(aiida_profile_clean):
+    node = orm.Int(1).store()
+    assert cycle.load_nodes([node.uuid], node_class=orm.Node) == {node.uuid: node}
+    assert cycle.load_nodes([]) == {}
+    unknown = str(uuid.uuid4())
+    with pytest.raises(exceptions.NotExistent, match=unknown):
+        cycle.load_nodes([node.uuid, unknown], node_class=orm.Node)
+    with pytest.raises(exceptions.NotExistent, match="ProcessNode"):
+        cycle.load_nodes([node.uuid])
+
+
+@pytest.mark.parametrize("unknown_input", ["dependencies", "passthrough_inputs"])
+def test_unknown_input(aiida_profile_clean, unknown_input):
+    """The dependent is not started without all of its inputs."""
+    _, one = engine.run_get_node(bakery.one)
+    unknown = str(uuid.uuid4())
+    inputs = {
+        "dependencies": {one.uuid: {"result": "x"}},
+        "passthrough_inputs": {"y": orm.Int(2).store().uuid},
+    }
+    inputs[unknown_input] = {
+        "dependencies": {unknown: {"result": "x"}},
+        "passthrough_inputs": {"y": unknown},
+    }[unknown_input]
+    _, node = engine.run_get_node(
+        cycle.Dependencies, dependent="core.arithmetic.add", **inputs
+    )
+    exit_code = cycle.Dependencies.exit_codes.DEPENDENCY_NOT_FOUND
+    assert node.exit_status == exit_code.status
+    assert cycle.DEPENDENT_EXTRA not in node.base.extras.keys()
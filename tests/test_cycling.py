@@ -0,0 +1,151 @@
+"""Expansion and scheduling of cycling graphs."""
+from __future__ import annotations
+
+import collections
+
+import pytest
+from aiida import engine, orm
+from aiida.engine import runners
+from aiida.engine.processes.workchains import workchain
+
+from aiida_c2sm import bakery, cycling, sleep
+
+
+class Relay(engine.WorkChain):
+    """Pass a token on right away."""
+
+    @classmethod
+    def define(cls: type, spec: workchain.WorkChainSpec) -> None:
+        super().define(spec)
+        spec.input("token")
+        spec.output("token")
+        spec.outline(cls.relay)
+
+    def relay(self) -> None:
+        self.out("token", bakery.one())
+
+
+class Slow(sleep.SleepMixin, engine.WorkChain):
+    """Finish after a few seconds."""
+
+    @classmethod
+    def define(cls: type, spec: workchain.WorkChainSpec) -> None:
+        super().define(spec)
+        spec.outline(cls.wait, cls.done)
+
+    def wait(self) -> None:
+        self.sleep(4)
+
+    def done(self) -> None:
+        pass
+
+
+RELAY_GRAPH = cycling.Graph(
+    tasks={"slow": Slow, "relay": Relay},
+    edges=(cycling.Edge("relay[-P1]", "relay", {"token": "token"}),),
+)
+
+
+class RelayCycle(cycling.CyclingWorkChain):
+    """A fast chain of relays next to one slow task per cycle point."""
+
+    graph = RELAY_GRAPH
+
+    def initial_input(
+        self, edge: cycling.Edge, cycle_point: int
+    ) -> dict[str, orm.Node]:
+        return {"token": orm.Int(0).store()}
+
+
+class UnseededRelayCycle(cycling.CyclingWorkChain):
+    """The relay chain without inputs before the initial cycle point."""
+
+    graph = RELAY_GRAPH
+
+
+def test_expand():
+    graph = cycling.Graph(
+        tasks={"a": Relay, "b": Relay, "c": Relay},
+        edges=(
+            cycling.Edge("b", "c", {"token": "token"}),
+            cycling.Edge("a", "b", {"token": "token"}),
+            cycling.Edge("c[-P2]", "a", {"token": "token"}),
+        ),
+    )
+    dag = graph.expand(3, 5)
+    assert list(dag) == [
+        f"{name}@{point}" for point in (3, 4, 5) for name in ("a", "b", "c")
+    ]
+    assert dag["a@3"] == [(None, 2)]
+    assert dag["a@4"] == [(None, 2)]
+    assert dag["a@5"] == [("c@3", 2)]
+    assert dag["b@4"] == [("a@4", 1)]
+    assert dag["c@5"] == [("b@5", 0)]
+
+
+def test_expand_single_cycle_point():
+    dag = RELAY_GRAPH.expand(7, 7)
+    assert dag == {"slow@7": [], "relay@7": [(None, 0)]}
+
+
+def test_edge_offset():
+    assert cycling.Edge("a", "b", {}).offset == 0
+    assert cycling.Edge("a[-P12]", "b", {}).source_task == "a"
+    assert cycling.Edge("a[-P12]", "b", {}).offset == 12
+    with pytest.raises(ValueError, match="Invalid edge source"):
+        cycling.Edge("a[+P1]", "b", {})
+
+
+def test_unknown_task():
+    with pytest.raises(ValueError, match=r"unknown tasks \['d'\]"):
+        cycling.Graph(
+            tasks={"a": Relay}, edges=(cycling.Edge("d", "a", {"token": "token"}),)
+        )
+
+
+def test_loop_within_cycle_point():
+    with pytest.raises(ValueError, match="form a loop"):
+        cycling.Graph(
+            tasks={"a": Relay, "b": Relay},
+            edges=(
+                cycling.Edge("a", "b", {"token": "token"}),
+                cycling.Edge("b", "a", {"token": "token"}),
+            ),
+        )
+
+
+def test_missing_initial_input(aiida_profile_clean):
+    _, node = engine.run_get_node(
+        UnseededRelayCycle,
+        initial_cycle_point=orm.Int(0),
+        final_cycle_point=orm.Int(2),
+    )
+    assert (
+        node.exit_status
+        == UnseededRelayCycle.exit_codes.ERROR_MISSING_INITIAL_INPUT.status
+    )
+    assert not node.called
+
+
+def test_tasks_finishing_first_release_dependents(aiida_profile_clean, monkeypatch):
+    """A relay is submitted once the previous one finished, not the slow task."""
+    watched = collections.Counter()
+    call_on_process_finish = runners.Runner.call_on_process_finish
+
+    def count_watched(runner, pk, callback):
+        watched[pk] += 1
+        call_on_process_finish(runner, pk, callback)
+
+    monkeypatch.setattr(runners.Runner, "call_on_process_finish", count_watched)
+    _, node = engine.run_get_node(
+        RelayCycle,
+        initial_cycle_point=orm.Int(0),
+        final_cycle_point=orm.Int(3),
+        max_active_cycle_points=orm.Int(10),
+    )
+    assert node.is_finished_ok
+    tasks = {task.label: task for task in node.called}
+    assert len(tasks) == 8
+    assert tasks["relay@0"].mtime < tasks["relay@1"].ctime < tasks["slow@0"].mtime
+    # every task is watched once, however often the work chain waited
+    assert watched == {task.pk: 1 for task in tasks.values()}
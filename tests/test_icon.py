@@ -0,0 +1,157 @@
+"""ICON timer reports and the performance summary of the ICON parser."""
+# ruff: noqa: E501
+from __future__ import annotations
+
+import io
+
+import pytest
+from aiida import orm
+from aiida.common import links
+
+from aiida_c2sm.spice import icon
+
+#: end of the log of a run on 4 processes, with the timer report as ICON prints it
+REPORT = """\
+ mo_nh_stepping:perform_nh_timeloop: Time loop finished
+ mo_atmo_model:destruct_atmo_model: start to clean up
+
+ --------------------------------------------------------------------------------------------------------------------------------------------------------------------
+ name                          # calls   t_min       min rank   t_avg       t_max       max rank   total min (s)   total min rank   total max (s)   total max rank   total avg (s)   # PEs
+ --------------------------------------------------------------------------------------------------------------------------------------------------------------------
+ total                               1   00:47m06s   [3]        00:47m06s   00:47m07s   [0]        2826.101        [3]              2826.302        [0]              2826.211        4
+  L integrate_nh                  2976   0.741s      [2]        0.788s      0.861s      [1]        2345.678        [2]              2350.123        [1]              2347.900        4
+     L nh_solve                  14880   0.011s      [0]        0.012s      0.019s      [3]        182.402         [0]              185.311         [3]              183.950         4
+     L physics                    2976   0.180s      [1]        0.192s      0.233s      [2]        571.004         [1]              575.690         [2]              573.118         4
+        L nwp_radiation            248   0.842s      [3]        0.851s      0.902s      [0]        211.231         [3]              213.502         [0]              212.340         4
+  L wait_for_async_io              744   0.000s      [1]        0.003s      0.010s      [0]        1.203           [1]              2.488           [0]              1.877           4
+  L write_restart                    1   3.402s      [2]        3.577s      3.690s      [0]        3.402           [2]              3.690           [0]              3.577           4
+
+ mo_atmo_model:destruct_atmo_model: clean-up finished
+ OK
+"""
+
+MASTER_NAMELIST = """\
+&master_nml
+ lrestart = .FALSE.
+/
+&master_time_control_nml
+ calendar = 'proleptic gregorian'
+ experimentStartDate = '1979-01-01T00:00:00Z'
+ ini_datetime_string = "1979-01-01T00:00:00Z"
+/
+"""
+
+
+@pytest.fixture
+def icon_node(aiida_profile_clean, aiida_localhost, tmp_path):
+    """
+    A finished Icon job which wrote a restart file of `restart_date`, with the
+    given ICON log.
+    """
+
+    def make(log: str, restart_date: str, restart_file_name: str | None = None):
+        node = orm.CalcJobNode(
+            computer=aiida_localhost,
+            process_type="aiida.calculations:c2sm.spice_raw_icon",
+        )
+        node.set_option("scheduler_stdout", "_scheduler-stdout.txt")
+        inputs = {
+            "master_namelist": orm.SinglefileData(
+                io.BytesIO(MASTER_NAMELIST.encode()), filename="icon_master.namelist"
+            )
+        }
+        if restart_file_name is not None:
+            inputs["restart_file_name"] = orm.Str(restart_file_name)
+        for name, data in inputs.items():
+            node.base.links.add_incoming(data.store(), links.LinkType.INPUT_CALC, name)
+        node.store()
+
+        workdir = tmp_path / "workdir"
+        workdir.mkdir()
+        (workdir / f"lam_DOM01_restart_atm_{restart_date}Z.nc").touch()
+        remote = orm.RemoteData(computer=aiida_localhost, remote_path=str(workdir))
+        remote.base.links.add_incoming(node, links.LinkType.CREATE, "remote_folder")
+        remote.store()
+        retrieved = orm.FolderData()
+        retrieved.put_object_from_filelike(
+            io.BytesIO(log.encode()), "_scheduler-stdout.txt"
+        )
+        retrieved.base.links.add_incoming(node, links.LinkType.CREATE, "retrieved")
+        retrieved.store()
+        return node
+
+    return make
+
+
+def test_parse_timer_report():
+    """Each timer takes the total time of its slowest process."""
+    timers = icon.parse_timer_report(REPORT)
+    assert timers == {
+        "total": {"calls": 1, "seconds": 2826.302},
+        "integrate_nh": {"calls": 2976, "seconds": 2350.123},
+        "nh_solve": {"calls": 14880, "seconds": 185.311},
+        "physics": {"calls": 2976, "seconds": 575.690},
+        "nwp_radiation": {"calls": 248, "seconds": 213.502},
+        "wait_for_async_io": {"calls": 744, "seconds": 2.488},
+        "write_restart": {"calls": 1, "seconds": 3.690},
+    }
+
+
+def test_parse_without_report():
+    assert icon.parse_timer_report(REPORT.split(" ----")[0]) == {}
+
+
+def test_performance_missing_timer():
+    """Timers not in the report are left out, "radiation" is a fallback name."""
+    report = REPORT.replace("L nwp_radiation ", "L radiation     ").replace(
+        "  L write_restart", "  L output_write"
+    )
+    performance = icon.get_performance(icon.parse_timer_report(report), None)
+    assert performance == {
+        "timers": {
+            "total": {"calls": 1, "seconds": 2826.302},
+            "integrate_nh": {"calls": 2976, "seconds": 2350.123},
+            "physics": {"calls": 2976, "seconds": 575.690},
+            "radiation": {"calls": 248, "seconds": 213.502},
+            "io_wait": {"calls": 744, "seconds": 2.488},
+        }
+    }
+
+
+def test_parser_first_run(icon_node):
+    """A first run is simulated from the start date of the master namelist."""
+    node = icon_node(REPORT, "19790201T000000")
+    results, calcfunction = icon.IconParser.parse_from_node(
+        node, store_provenance=False
+    )
+    assert calcfunction.is_finished_ok
+    performance = results["performance"].get_dict()
+    assert performance["timers"]["total"] == {"calls": 1, "seconds": 2826.302}
+    assert performance["timers"]["restart_write"] == {"calls": 1, "seconds": 3.69}
+    assert performance["simulated_days"] == 31
+    assert performance["sypd"] == pytest.approx(31 / 365 / (2826.302 / 86400))
+    assert results["restart_file_name"].value.endswith("19790201T000000Z.nc")
+
+
+def test_parser_restarted_run(icon_node):
+    """A restarted run is simulated from the date of the restart it read."""
+    node = icon_node(
+        REPORT,
+        "19790301T000000",
+        restart_file_name="lam_DOM01_restart_atm_19790201T000000Z.nc",
+    )
+    results, _ = icon.IconParser.parse_from_node(node, store_provenance=False)
+    performance = results["performance"].get_dict()
+    assert performance["simulated_days"] == 28
+    assert performance["sypd"] == pytest.approx(28 / 365 / (2826.302 / 86400))
+
+
+def test_parser_without_report(icon_node):
+    """Runs without a timer report have no performance output."""
+    node = icon_node(REPORT.split(" ----")[0], "19790201T000000")
+    results, calcfunction = icon.IconParser.parse_from_node(
+        node, store_provenance=False
+    )
+    assert calcfunction.is_finished_ok
+    assert "performance" not in results
+    assert "restart_file_name" in results
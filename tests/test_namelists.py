@@ -0,0 +1,180 @@
+"""Parsing, formatting and diffing of Fortran namelists."""
+from __future__ import annotations
+
+import pendulum
+import pytest
+from aiida import orm
+
+from aiida_c2sm.spice import icon_wc, namelists
+
+SOURCE = """\
+! leading comment
+&run_nml
+  num_lev     = 60,          ! levels
+  dtime       = 60.
+  output      = 'nml', "totint"
+  ltestcase   = .FALSE.
+/
+&io_nml
+  path        = '/scratch/run/out/' ! trailing / slash
+  label       = 'a=b, c=d'
+  quote       = 'it''s ! not a comment'
+  levels      = 1, 2,
+                3, 4
+  tracer(1)%name = 'qv'
+&end
+&output_nml
+  output_filename = 'out01/icon'
+  output_interval = 'PT1H'
+/
+&output_nml
+  output_filename = 'out02/icon'
+  output_interval = 'PT6H'
+/
+"""
+
+
+def _keyed(groups: namelists.Groups) -> dict[str, dict[str, str]]:
+    """Groups by key, the order of neither groups nor variables matters."""
+    return dict(zip(namelists.group_keys(groups), (dict(vs) for _, vs in groups)))
+
+
+@pytest.fixture
+def rendered(aiida_profile_clean, aiida_localhost):
+    """Master and model namelists of the first three months of an experiment."""
+    params = icon_wc.IconParams(
+        start_date=pendulum.datetime(1979, 1, 1),
+        stop_date=pendulum.datetime(1980, 1, 1),
+        date=pendulum.datetime(1979, 1, 1),
+        dtime=60,
+    )
+
+    def remote(path: str) -> orm.RemoteData:
+        return orm.RemoteData(computer=aiida_localhost, remote_path=path)
+
+    return icon_wc.make_namelists(
+        params,
+        [pendulum.datetime(1979, month, 1) for month in (1, 2, 3)],
+        expid="test",
+        gcm_converted=remote("/work/test/gcm_converted"),
+        ini_basedir=remote("/work/ini"),
+        lam_grid_path="grids/lam_DOM01.nc",
+        parent_grid_path="grids/lam_DOM01.parent.nc",
+        extpar_path="grids/extpar_DOM01.nc",
+        ghg_file_path="/work/ini/ghg.dat",
+        ecraddir=remote("/work/ecrad/data"),
+    )
+
+
+def test_parse():
+    groups = namelists.parse_namelists(SOURCE)
+    assert [name for name, _ in groups] == [
+        "run_nml",
+        "io_nml",
+        "output_nml",
+        "output_nml",
+    ]
+    assert groups[0][1] == {
+        "num_lev": "60",
+        "dtime": "60.",
+        "output": "'nml', \"totint\"",
+        "ltestcase": ".FALSE.",
+    }
+    assert groups[1][1] == {
+        "path": "'/scratch/run/out/'",
+        "label": "'a=b, c=d'",
+        "quote": "'it''s ! not a comment'",
+        "levels": "1, 2, 3, 4",
+        "tracer(1)%name": "'qv'",
+    }
+    assert groups[3][1]["output_filename"] == "'out02/icon'"
+
+
+def test_group_keys():
+    groups = namelists.parse_namelists(SOURCE)
+    assert namelists.group_keys(groups) == [
+        "run_nml",
+        "io_nml",
+        "output_nml",
+        "output_nml[1]",
+    ]
+
+
+def test_format_round_trip():
+    groups = namelists.parse_namelists(SOURCE)
+    assert namelists.parse_namelists(namelists.format_namelists(groups)) == groups
+
+
+def test_diff_repeated_groups():
+    base = namelists.parse_namelists(SOURCE)
+    other = namelists.parse_namelists(
+        SOURCE.replace("'PT6H'", "'PT3H'").replace("ltestcase   = .FALSE.\n", "")
+    )
+    changes = namelists.diff_namelists(base, other)
+    assert changes == [
+        ("run_nml", {"ltestcase": None}),
+        ("output_nml[1]", {"output_interval": "'PT3H'"}),
+    ]
+    assert namelists.apply_changes(base, changes) == other
+
+
+def test_diff_added_and_removed_groups():
+    base = namelists.parse_namelists(SOURCE)
+    other = base[1:] + [("extra_nml", {"path": "'a/b=c'"})] + base[2:3]
+    changes = namelists.diff_namelists(base, other)
+    assert ("run_nml", None) in changes
+    assert ("output_nml[2]", base[2][1]) in changes
+    assert _keyed(namelists.apply_changes(base, changes)) == _keyed(other)
+    assert namelists.diff_namelists(base, base) == []
+
+
+def test_rendered_round_trip(rendered):
+    for master, model in rendered:
+        for text in (master, model):
+            groups = namelists.parse_namelists(text)
+            assert groups
+            assert (
+                namelists.parse_namelists(namelists.format_namelists(groups)) == groups
+            )
+
+
+def test_rendered_apply_diff(rendered):
+    """Each month is restored from its changes to the first month."""
+    (base_master, base_model), *months = rendered
+    assert months
+    for base_text, text in [
+        (base, text)
+        for master, model in months
+        for base, text in [(base_master, master), (base_model, model)]
+    ]:
+        base = namelists.parse_namelists(base_text)
+        other = namelists.parse_namelists(text)
+        changes = namelists.diff_namelists(base, other)
+        assert changes
+        assert _keyed(namelists.apply_changes(base, changes)) == _keyed(other)
+
+
+def test_rendered_repeated_output_groups(rendered):
+    groups = namelists.parse_namelists(rendered[0][1])
+    keys = namelists.group_keys(groups)
+    assert "output_nml" in keys
+    assert "output_nml[1]" in keys
+    filenames = [
+        variables["output_filename"]
+        for name, variables in groups
+        if name == "output_nml"
+    ]
+    assert len(set(filenames)) == len(filenames) > 1
+
+
+def test_namelist_data(rendered):
+    (_, first), (_, second), _ = rendered
+    base = namelists.NamelistData.from_text(first).store()
+    data = namelists.NamelistData.from_text(second, base=base).store()
+    assert data.base_namelist.uuid == base.uuid
+    loaded = orm.load_node(data.pk)
+    assert _keyed(namelists.parse_namelists(loaded.get_content())) == _keyed(
+        namelists.parse_namelists(second)
+    )
+    with pytest.raises(ValueError, match="must be stored"):
+        namelists.NamelistData.from_text(second, base=data)
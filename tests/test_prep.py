@@ -0,0 +1,190 @@
+"""Input files of the prep calculation."""
+from __future__ import annotations
+
+import dataclasses
+import os
+import pathlib
+import re
+import subprocess
+
+import pendulum
+import pytest
+from aiida import orm
+from aiida.common import folders
+from aiida.engine.utils import instantiate_process
+from aiida.manage import get_manager
+
+from aiida_c2sm.spice import data, prep
+
+_SOURCED = re.compile(r"^\s*source \./(\S+)", re.MULTILINE)
+
+
+@pytest.fixture
+def prep_folder(aiida_profile_clean, aiida_localhost, aiida_code_installed, tmp_path):
+    """Upload folder written by `GCM2IconPrep.prepare_for_submission`."""
+    params = data.PrepParams(
+        date=pendulum.datetime(1979, 1, 1),
+        next_date=pendulum.datetime(1979, 3, 1),
+        n_parallel_tasks=2,
+        utils_bindir=pathlib.Path("/utils"),
+        cfu_bindir=pathlib.Path("/cfu"),
+        hincbound=6,
+        gcm_prefix="caf",
+    )
+    process = instantiate_process(
+        get_manager().get_runner(),
+        prep.GCM2IconPrep,
+        code=aiida_code_installed(default_calc_job_plugin="c2sm.spice_prep"),
+        gcm_data=orm.RemoteData(computer=aiida_localhost, remote_path="/gcm_data"),
+        parameters=data.ParamsData(params),
+    )
+    folder = folders.Folder(str(tmp_path))
+    process.prepare_for_submission(folder)
+    return folder
+
+
+def test_inputs(prep_folder):
+    inputs = prep_folder.get_abs_path("inputs.sh")
+    variables = dict(
+        line.split("=", 1) for line in pathlib.Path(inputs).read_text().splitlines()
+    )
+    assert variables["MONTH_DATES"] == '"1979010100 1979020100"'
+    assert variables["NEXT_DATE"] == "1979030100"
+
+
+@pytest.mark.parametrize(
+    "script", ["prep.sh", "prep/prep.sh", "prep_check.sh"], ids=str
+)
+def test_sourced_scripts_uploaded(prep_folder, script):
+    """Every prep script variant finds the scripts it sources next to it."""
+    sourced = set(_SOURCED.findall(prep.get_script_path(script).read_text()))
+    assert sourced == {"inputs.sh", "workqueue.sh", "store.sh"}
+    assert sourced <= set(prep_folder.get_content_list())
+
+
+@pytest.mark.parametrize(
+    "script", ["prep.sh", "prep/prep.sh", "prep_check.sh"], ids=str
+)
+def test_stage_timings_written(script):
+    """Every prep script variant writes the stage timings of the `timings` output."""
+    text = prep.get_script_path(script).read_text()
+    assert "stage_timing_init $PWD/stage_timings.txt" in text
+    assert "stage_begin store_publish" in text
+
+
+def _prep_params(**changes) -> data.ParamsData:
+    params = data.PrepParams(
+        date=pendulum.datetime(1979, 1, 1),
+        next_date=pendulum.datetime(1979, 3, 1),
+        n_parallel_tasks=2,
+        utils_bindir=pathlib.Path("/utils"),
+        cfu_bindir=pathlib.Path("/cfu"),
+        hincbound=6,
+        gcm_prefix="caf",
+    )
+    return data.ParamsData(dataclasses.replace(params, **changes))
+
+
+def test_store_path_per_forcing(aiida_profile_clean, aiida_localhost):
+    """Jobs of other dates share the store directory, other GCM data do not."""
+
+    def store_path(gcm_data="/gcm_data", **changes):
+        inputs = {
+            "store": orm.RemoteData(computer=aiida_localhost, remote_path="/store"),
+            "gcm_data": orm.RemoteData(computer=aiida_localhost, remote_path=gcm_data),
+            "parameters": _prep_params(**changes),
+        }
+        for node in inputs.values():
+            node.store()
+        return prep.get_store_path(inputs, "prep", prep.get_store_key(inputs))
+
+    path = store_path()
+    assert path.parent == pathlib.Path("/store/prep")
+    assert path == store_path(
+        date=pendulum.datetime(1985, 6, 1),
+        next_date=pendulum.datetime(1986, 6, 1),
+        n_parallel_tasks=8,
+    )
+    assert path != store_path(gcm_prefix="cas")
+    assert path != store_path(gcm_data="/other_gcm_data")
+
+
+def test_filled_months(aiida_profile_clean, aiida_localhost, tmp_path):
+    store = tmp_path / "store"
+    for month, files in [("197903", ["caf1979030100.nc"]), ("197904", [])]:
+        (store / month).mkdir(parents=True)
+        for name in files + [".complete"]:
+            (store / month / name).touch()
+    outfiles = tmp_path / "outfiles"
+    (outfiles / "197901").mkdir(parents=True)
+    (outfiles / "197901" / "caf1979010100.nc").touch()
+    (outfiles / "197902").mkdir()
+    for month in ["197903", "197904"]:
+        (outfiles / month).symlink_to(store / month)
+    folder = orm.RemoteData(computer=aiida_localhost, remote_path=str(outfiles))
+    assert prep.get_filled_months(folder) == {"m197901", "m197903"}
+    missing = orm.RemoteData(computer=aiida_localhost, remote_path=str(tmp_path / "x"))
+    assert prep.get_filled_months(missing) == set()
+
+
+def _run_store(tmp_path, commands: str) -> str:
+    script = f"set -e\nsource {prep.get_script_path('store.sh')}\n{commands}"
+    return subprocess.run(
+        ["bash", "-c", script],
+        cwd=tmp_path,
+        env={"PATH": os.environ["PATH"], "STORE_DIR": str(tmp_path / "store")},
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+def test_store_publish_per_month(tmp_path):
+    (tmp_path / "outfiles" / "197901").mkdir(parents=True)
+    (tmp_path / "outfiles" / "197901" / "a.nc").write_text("new")
+    (tmp_path / "store" / "197902").mkdir(parents=True)
+    (tmp_path / "store" / "197902" / ".complete").touch()
+    missing = _run_store(tmp_path, "store_missing 1979010100 1979020100 1979030100")
+    assert missing.split() == ["1979010100", "1979030100"]
+
+    _run_store(tmp_path, "store_publish outfiles/197901 197901")
+    entry = tmp_path / "store" / "197901"
+    assert (entry / ".complete").exists()
+    assert (tmp_path / "outfiles" / "197901").resolve() == entry
+    assert _run_store(tmp_path, "store_missing 1979010100").split() == []
+
+    # a month published by another job first is kept
+    (tmp_path / "again").mkdir()
+    (tmp_path / "again" / "a.nc").write_text("again")
+    _run_store(tmp_path, "store_publish again 197901")
+    assert (entry / "a.nc").read_text() == "new"
+    assert (tmp_path / "again").resolve() == entry
+
+
+def test_task_steps_timed(tmp_path):
+    """Steps of a task are timed on their own, a failing step is recorded too."""
+    script = f"""
+        source {prep.get_script_path("workqueue.sh")}
+        step() {{ test "$1" != bad; }}
+        task() {{
+          workqueue_time step "$1"
+          workqueue_time step bad
+          echo unreachable
+        }}
+        export -f step
+        echo member | workqueue_run 2 timings.txt task
+    """
+    result = subprocess.run(
+        ["bash", "-c", script], cwd=tmp_path, capture_output=True, text=True
+    )
+    assert result.returncode != 0
+    assert "unreachable" not in result.stdout
+    timings = [
+        (line.split()[:2], line.split()[-1])
+        for line in (tmp_path / "timings.txt").read_text().splitlines()
+    ]
+    assert sorted(timings) == [
+        (["step", "bad"], "1"),
+        (["step", "member"], "0"),
+        (["task", "member"], "1"),
+    ]
@@ -0,0 +1,36 @@
+"""Timing records of the SPICE jobs."""
+from __future__ import annotations
+
+import io
+
+from aiida import orm
+
+from aiida_c2sm.spice import timing
+
+
+def test_retrieved_bytes(aiida_profile_clean):
+    retrieved = orm.FolderData()
+    retrieved.put_object_from_filelike(io.BytesIO(b"12345"), "_scheduler-stdout.txt")
+    retrieved.put_object_from_filelike(io.BytesIO(b"123"), "lbc_shards/shard_0.done")
+    retrieved.store()
+    node = orm.CalcJobNode().store()
+    timings = timing.record_calcjob_timings(node, retrieved)
+    assert timings == {"retrieved_bytes": 8}
+    assert node.base.extras.get(timing.CALCJOB_TIMINGS_EXTRA) == timings
+
+
+def test_experiment_timings_label_wildcards(aiida_profile_clean):
+    """Wildcards in the experiment id only match themselves."""
+    for label, seconds in [
+        ("prep:exp_1@1979-01-01T00:00:00", 1.0),
+        ("prep:expx1@1979-02-01T00:00:00", 2.0),
+        ("conv:exp%@1979-03-01T00:00:00", 3.0),
+    ]:
+        node = orm.CalcJobNode(label=label).store()
+        node.base.extras.set(timing.CALCJOB_TIMINGS_EXTRA, {"run_seconds": seconds})
+    assert timing.experiment_timings("exp_1")["months"] == {
+        "1979-01": {"prep": {"run_seconds": 1.0}}
+    }
+    assert timing.experiment_timings("exp%")["months"] == {
+        "1979-03": {"conv": {"run_seconds": 3.0}}
+    }